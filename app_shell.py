@@ -0,0 +1,119 @@
+"""Jedno okno z narzędziami w kartach nad jedną wczytaną mapą.
+
+menu.py uruchamiał każde narzędzie jako osobny proces - każde przejście
+importowało od nowa Tk, matplotlib i networkx i parsowało gps_paths.json.
+Powłoka trzyma Navigator, Map Maker, Graph Analyzer i Map Manager w kartach
+ttk.Notebook jednego procesu. Mapa jest wczytana raz (MapSession: model,
+indeksy przestrzenne i graf tras), więc przełączenie narzędzia to zmiana
+karty, a zmiany z Map Manager są od razu widoczne w trasach Graph Analyzer
+i Navigator - bez zapisu i ponownego wczytania.
+
+Narzędzie powstaje przy pierwszym otwarciu jego karty (Graph Analyzer
+dopiero wtedy importuje matplotlib i networkx). Hasło administratora jest
+potrzebne raz na uruchomienie powłoki.
+
+Użycie:
+    python app_shell.py   # to samo co python menu.py
+"""
+import importlib
+import time
+import tkinter as tk
+from tkinter import ttk
+from typing import Dict, Optional
+
+from map_model import MapSession
+from map_store import MapStore
+
+MAP_FILENAME = "gps_paths.json"
+
+# Plik narzędzia (jak w menu.py) -> (moduł, klasa aplikacji)
+TOOLS = {
+    "navigator.py": ("navigator", "GPSNavigator"),
+    "mapmaker_new.py": ("mapmaker_new", "GPSPathSimulator"),
+    "graph.py": ("graph", "GraphPathFinderGUI"),
+    "map_manager.py": ("map_manager", "MapManager"),
+}
+
+
+class AppShell:
+    """Okno z kartami narzędzi i wspólną sesją mapy"""
+
+    def __init__(self, root, map_filename: str = MAP_FILENAME):
+        # Import na miejscu: menu.py uruchamia powłokę
+        from menu import MainMenu
+
+        self.root = root
+        self.root.title("GPS Navigation System")
+        self.root.geometry("1200x850")
+        self.map_filename = map_filename
+        self.session: Optional[MapSession] = None  # Wczytywana przy pierwszym użyciu
+        self.tools: Dict[str, object] = {}  # Plik narzędzia -> aplikacja w karcie
+        self.tabs: Dict[str, tk.Frame] = {}
+
+        self.notebook = ttk.Notebook(root)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+        self.menu_tab = tk.Frame(self.notebook, bg='#f5f5f5')
+        self.notebook.add(self.menu_tab, text="🏠 Menu")
+        self.menu = MainMenu(self.menu_tab, shell=self)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+
+    def open_session(self) -> MapSession:
+        """Wspólna sesja mapy (wczytana raz dla wszystkich narzędzi)"""
+        if self.session is None:
+            start = time.perf_counter()
+            self.session = MapSession(self.map_filename)
+            print(f"✓ Wczytano mapę {self.map_filename} "
+                  f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+        return self.session
+
+    def replace_map(self, data: dict):
+        """Zapisuje nową mapę (Map Maker) i podmienia ją we wszystkich narzędziach"""
+        if self.session is None:
+            MapStore(self.map_filename).write_snapshot(data)  # Sesja wczyta ją przy pierwszym użyciu
+        else:
+            self.session.replace(data)
+
+    def open_tool(self, filename: str, title: str):
+        """Pokazuje kartę narzędzia (tworzy narzędzie przy pierwszym otwarciu)"""
+        tab = self.tabs.get(filename)
+        if tab is None:
+            start = time.perf_counter()
+            module_name, class_name = TOOLS[filename]
+            app_class = getattr(importlib.import_module(module_name), class_name)
+            tab = tk.Frame(self.notebook)
+            self.notebook.add(tab, text=title)
+            try:
+                tool = app_class(tab, shell=self)
+            except Exception:
+                # Bez pustej karty - następne otwarcie spróbuje od nowa
+                self.notebook.forget(tab)
+                tab.destroy()
+                raise
+            self.tabs[filename] = tab
+            self.tools[filename] = tool
+            print(f"✓ Otwarto {title} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        self.notebook.select(tab)
+
+    def show_menu(self):
+        """Wraca do karty menu (narzędzia zostają otwarte)"""
+        self.notebook.select(self.menu_tab)
+
+    def on_tab_changed(self, event=None):
+        """Odświeża narzędzie pokazane po zmianach mapy zrobionych w innej karcie"""
+        selected = self.notebook.select()
+        for filename, tab in self.tabs.items():
+            if str(tab) == selected:
+                tool = self.tools.get(filename)
+                if hasattr(tool, 'refresh_from_model'):
+                    tool.refresh_from_model()
+                break
+
+
+def main():
+    root = tk.Tk()
+    app = AppShell(root)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Benchmarki silnika tras na syntetycznym budynku wielopiętrowym.
+
+Użycie:
+    python benchmark.py dijkstra --points 100000 --floors 3 --queries 20
+    python benchmark.py astar --map gps_paths.json --queries 200
+    python benchmark.py bidirectional --map gps_paths.json --queries 500
+    python benchmark.py tables --points 30000 --queries 200
+    python benchmark.py ch --points 50000 --queries 200
+    python benchmark.py reroute --points 30000 --queries 10
+"""
+import argparse
+import heapq
+import math
+import random
+import time
+
+from routing import CompiledGraph, RoutingEngine, load_building
+
+
+def make_synthetic_building(points: int = 100000, floors: int = 3,
+                            spacing: float = 20.0, seed: int = 1) -> dict:
+    """Generuje budynek w formacie gps_paths.json: siatka korytarzy na każdym piętrze.
+
+    Punkty każdego piętra tworzą siatkę (jeden wiersz = jedna ścieżka), część
+    połączeń jest losowo usuwana, a piętra łączą schody w narożnikach i winda
+    pośrodku.
+    """
+    rng = random.Random(seed)
+    side = max(2, int(math.ceil(math.sqrt(points / floors))))
+    floors_data = {}
+
+    for f in range(floors):
+        floor_id = str(f)
+        paths = []
+        connections = []
+        for row in range(side):
+            paths.append({
+                'id': row + 1,
+                'points': [{'id': row * side + col + 1,
+                            'x': round((col + 1) * spacing, 2),
+                            'y': round((row + 1) * spacing, 2)}
+                           for col in range(side)],
+                'color': '#3498db'
+            })
+            for col in range(side):
+                pid = row * side + col + 1
+                # Korytarze poziome zawsze, pionowe z przerwami (ściany)
+                if col + 1 < side:
+                    connections.append({'from': pid, 'to': pid + 1, 'distance': spacing})
+                if row + 1 < side and (col % 4 == 0 or rng.random() < 0.3):
+                    connections.append({'from': pid, 'to': pid + side, 'distance': spacing})
+        floors_data[floor_id] = {'paths': paths, 'connections': connections, 'point_labels': {}}
+
+    transitions = []
+    corners = [1, side, side * (side - 1) + 1, side * side]
+    middle = (side // 2) * side + side // 2 + 1
+    for f in range(floors - 1):
+        for i, pid in enumerate(corners):
+            transitions.append({
+                'id': f"transition_{len(transitions) + 1}", 'type': 'stairs',
+                'name': f"Schody {i + 1}", 'from_floor': str(f), 'to_floor': str(f + 1),
+                'from_point': str(pid), 'to_point': str(pid), 'travel_time': 30
+            })
+        transitions.append({
+            'id': f"transition_{len(transitions) + 1}", 'type': 'elevator',
+            'name': "Winda", 'from_floor': str(f), 'to_floor': str(f + 1),
+            'from_point': str(middle), 'to_point': str(middle), 'travel_time': 15
+        })
+
+    return {
+        'building_info': {'name': 'Budynek syntetyczny',
+                          'floors': list(floors_data.keys()),
+                          'floor_names': {f: f"Piętro {f}" for f in floors_data}},
+        'floors': floors_data,
+        'floor_transitions': transitions,
+        'metadata': {'version': '2.0', 'multifloor_support': True}
+    }
+
+
+def random_queries(graph: CompiledGraph, count: int, seed: int = 2):
+    """Losuje pary (start, cel) z różnych pięter"""
+    rng = random.Random(seed)
+    nodes = graph.node_ids
+    return [(rng.choice(nodes), rng.choice(nodes)) for _ in range(count)]
+
+
+def legacy_dict_dijkstra(adjacency: dict, start: str, end: str):
+    """Dawny wariant z GraphPathFinderGUI: słownik list z ID tekstowymi"""
+    pq = [(0, start, [start])]
+    visited = set()
+    distances = {node: float('inf') for node in adjacency}
+    distances[start] = 0
+    while pq:
+        current_dist, current_node, path = heapq.heappop(pq)
+        if current_node in visited:
+            continue
+        visited.add(current_node)
+        if current_node == end:
+            return path, current_dist
+        for neighbor, weight in adjacency[current_node]:
+            distance = current_dist + weight
+            if distance < distances[neighbor]:
+                distances[neighbor] = distance
+                heapq.heappush(pq, (distance, neighbor, path + [neighbor]))
+    return None, float('inf')
+
+
+def legacy_dijkstra(graph: CompiledGraph, start: str, end: str):
+    """Dawny wariant: pełna inicjalizacja odległości i kopia ścieżki w każdym wpisie kolejki"""
+    s = graph.index[start]
+    t = graph.index[end]
+    pq = [(0, s, [s])]
+    visited = set()
+    distances = [float('inf')] * len(graph)
+    distances[s] = 0
+    while pq:
+        current_dist, u, path = heapq.heappop(pq)
+        if u in visited:
+            continue
+        visited.add(u)
+        if u == t:
+            return [graph.node_ids[i] for i in path], current_dist
+        for k in range(graph.offsets[u], graph.offsets[u + 1]):
+            v = graph.targets[k]
+            distance = current_dist + graph.weights[k]
+            if distance < distances[v]:
+                distances[v] = distance
+                heapq.heappush(pq, (distance, v, path + [v]))
+    return None, float('inf')
+
+
+def time_queries(label: str, func, queries):
+    """Mierzy czas serii zapytań i zwraca (czas, wyniki)"""
+    results = []
+    started = time.perf_counter()
+    for start, end in queries:
+        results.append(func(start, end))
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<32} {elapsed:8.3f} s  ({elapsed / len(queries) * 1000:8.2f} ms/zapytanie)")
+    return elapsed, results
+
+
+def check_same_distances(reference, results, label: str):
+    """Sprawdza czy warianty zwracają te same długości tras"""
+    for (_, d1), (_, d2) in zip(reference, results):
+        if abs(d1 - d2) > 1e-6:
+            raise AssertionError(f"{label}: różne dystanse {d1} != {d2}")
+
+
+def bench_dijkstra(args):
+    """Porównanie dawnego Dijkstry z wariantem ze wskaźnikami poprzedników"""
+    graph, queries = prepare(args)
+    engine = RoutingEngine(graph)
+    adjacency = graph.adjacency()
+
+    dict_time, reference = time_queries("Dijkstra (słownik, GUI)",
+                                        lambda s, t: legacy_dict_dijkstra(adjacency, s, t), queries)
+    base_time, results = time_queries("Dijkstra (CSR, kopie ścieżek)",
+                                      lambda s, t: legacy_dijkstra(graph, s, t), queries)
+    check_same_distances(reference, results, "dijkstra CSR")
+    new_time, results = time_queries("Dijkstra (CSR, poprzednicy)", engine.route, queries)
+    check_same_distances(reference, results, "dijkstra")
+    print(f"  Przyspieszenie: {base_time / new_time:.1f}x względem kopii ścieżek, "
+          f"{dict_time / new_time:.1f}x względem wersji z GUI")
+
+
+def bench_astar(args):
+    """Porównanie Dijkstry i A* (czas i liczba rozwiniętych węzłów)"""
+    graph, queries = prepare(args)
+    engine = RoutingEngine(graph)
+    engine.heuristic  # Budowa heurystyki poza pomiarem
+
+    for method in ('dijkstra', 'astar'):
+        settled = []
+
+        def run(s, t):
+            result = engine.route(s, t, method=method)
+            settled.append(engine.stats['settled'])
+            return result
+
+        elapsed, results = time_queries(RoutingEngine.METHODS[method], run, queries)
+        print(f"    rozwinięte węzły: {sum(settled) / len(queries):.0f} / zapytanie")
+        if method == 'dijkstra':
+            base_time, base_settled, reference = elapsed, sum(settled), results
+        else:
+            check_same_distances(reference, results, method)
+            print(f"  Przyspieszenie: {base_time / elapsed:.1f}x, rozwiniętych węzłów "
+                  f"{base_settled / max(1, sum(settled)):.1f}x mniej")
+
+
+def bench_bidirectional(args):
+    """Porównanie Dijkstry jedno- i dwukierunkowego"""
+    graph, queries = prepare(args)
+    engine = RoutingEngine(graph)
+
+    for method in ('dijkstra', 'bidirectional'):
+        settled = []
+
+        def run(s, t):
+            result = engine.route(s, t, method=method)
+            settled.append(engine.stats['settled'])
+            return result
+
+        elapsed, results = time_queries(RoutingEngine.METHODS[method], run, queries)
+        print(f"    rozwinięte węzły: {sum(settled) / len(queries):.0f} / zapytanie")
+        if method == 'dijkstra':
+            base_time, reference = elapsed, results
+        else:
+            check_same_distances(reference, results, method)
+            print(f"  Przyspieszenie: {base_time / elapsed:.1f}x")
+
+
+def bench_tables(args):
+    """Porównanie Dijkstry z zapytaniami po tablicach przejść"""
+    graph, queries = prepare(args)
+    engine = RoutingEngine(graph)
+
+    started = time.perf_counter()
+    engine.transition_tables
+    print(f"  Budowa tablic przejść: {time.perf_counter() - started:.2f} s")
+
+    base_time, reference = time_queries("Dijkstra", engine.route, queries)
+    elapsed, results = time_queries(RoutingEngine.METHODS['tables'],
+                                    lambda s, t: engine.route(s, t, method='tables'), queries)
+    check_same_distances(reference, results, "tables")
+    print(f"  Przyspieszenie: {base_time / elapsed:.1f}x")
+
+
+def bench_ch(args):
+    """Porównanie Dijkstry, A* i zapytań po indeksie Contraction Hierarchies"""
+    graph, queries = prepare(args)
+    engine = RoutingEngine(graph)
+    engine.heuristic
+
+    started = time.perf_counter()
+    engine.contraction
+    print(f"  Kontrakcja grafu: {time.perf_counter() - started:.2f} s, "
+          f"{len(engine.contraction.up_targets)} krawędzi w górę")
+
+    base_time, reference = time_queries("Dijkstra", engine.route, queries)
+    for method in ('astar', 'ch'):
+        elapsed, results = time_queries(RoutingEngine.METHODS[method],
+                                        lambda s, t: engine.route(s, t, method=method), queries)
+        check_same_distances(reference, results, method)
+        print(f"  Przyspieszenie: {base_time / elapsed:.1f}x")
+
+
+def bench_reroute(args):
+    """Zmiana trasy po małych zboczeniach: pełny Dijkstra vs D* Lite ze stanem"""
+    graph, queries = prepare(args)
+    engine = RoutingEngine(graph)
+    engine.heuristic
+
+    # Zboczenia: co 5. węzeł trasy krok do sąsiada spoza trasy
+    scenarios = []
+    for start, end in queries:
+        path, _ = engine.route(start, end)
+        if not path:
+            continue
+        on_path = set(path)
+        deviations = []
+        for node in path[5:-1:5]:
+            u = graph.index[node]
+            for k in range(graph.offsets[u], graph.offsets[u + 1]):
+                v = graph.node_ids[graph.targets[k]]
+                if v not in on_path:
+                    deviations.append(v)
+                    break
+        scenarios.append((start, end, deviations))
+    reroutes = sum(len(deviations) for _, _, deviations in scenarios)
+    if not reroutes:
+        print("  Brak zboczeń do sprawdzenia")
+        return
+
+    started = time.perf_counter()
+    reference = [engine.route(v, end) for _, end, deviations in scenarios for v in deviations]
+    base_time = time.perf_counter() - started
+    print(f"  {'Dijkstra od zera':<32} {base_time:8.3f} s  "
+          f"({base_time / reroutes * 1000:8.2f} ms/zmianę trasy)")
+
+    results = []
+    expanded = 0
+    initial_time = 0.0
+    elapsed = 0.0
+    for start, end, deviations in scenarios:
+        started = time.perf_counter()
+        search = engine.incremental(end)
+        search.route(graph.index[start])  # Trasa początkowa (przed zboczeniami)
+        initial_time += time.perf_counter() - started
+        started = time.perf_counter()
+        for v in deviations:
+            path, distance = search.route(graph.index[v])
+            expanded += search.expanded
+            results.append((path, distance))
+        elapsed += time.perf_counter() - started
+    print(f"  {'D* Lite (trasa początkowa)':<32} {initial_time:8.3f} s  "
+          f"({initial_time / len(scenarios) * 1000:8.2f} ms/trasę)")
+    print(f"  {'D* Lite (zmiany trasy)':<32} {elapsed:8.3f} s  "
+          f"({elapsed / reroutes * 1000:8.2f} ms/zmianę trasy)")
+    print(f"    rozwinięte węzły przy zmianie trasy: {expanded / reroutes:.0f} / zapytanie")
+    check_same_distances(reference, results, "reroute")
+    print(f"  Przyspieszenie: {base_time / elapsed:.1f}x ({reroutes} zmian trasy)")
+
+
+def prepare(args):
+    """Wczytuje mapę (lub buduje syntetyczny budynek) i losuje zapytania"""
+    started = time.perf_counter()
+    if args.map:
+        data = load_building(args.map)
+    else:
+        data = make_synthetic_building(args.points, args.floors)
+    graph = CompiledGraph.compile(data['floors'], data['floor_transitions'])
+    print(f"Budynek: {len(graph)} węzłów, {len(graph.targets) // 2} krawędzi, "
+          f"{len(data['floors'])} piętra (kompilacja {time.perf_counter() - started:.2f} s)")
+    return graph, random_queries(graph, args.queries)
+
+
+BENCHMARKS = {
+    'dijkstra': bench_dijkstra,
+    'astar': bench_astar,
+    'bidirectional': bench_bidirectional,
+    'tables': bench_tables,
+    'ch': bench_ch,
+    'reroute': bench_reroute,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarki wyznaczania tras")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--map', help="plik mapy zamiast syntetycznego budynku")
+    parser.add_argument('--points', type=int, default=100000, help="liczba punktów w budynku")
+    parser.add_argument('--floors', type=int, default=3, help="liczba pięter")
+    parser.add_argument('--queries', type=int, default=20, help="liczba zapytań")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
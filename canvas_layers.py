@@ -0,0 +1,228 @@
+"""Warstwy canvas aktualizowane przyrostowo (bez tworzenia obiektu na każdy ruch).
+
+TraceLayer trzyma narysowaną ścieżkę użytkownika jako kilka łamanych
+(create_line z wieloma punktami) aktualizowanych przez canvas.coords.
+RouteLayer pamięta obiekty znaczników trasy według indeksu na trasie, więc
+osiągnięcie punktu zmienia styl tylko jego znacznika.
+"""
+import math
+from typing import Dict, List
+
+
+class TraceLayer:
+    """Ścieżka użytkownika jako rosnąca łamana z limitem obiektów canvas.
+
+    Punkty bliższe niż min_step od poprzedniego tylko przesuwają koniec
+    łamanej (decymacja w locie). Łamana jest dzielona na fragmenty po
+    chunk_size punktów; gdy fragmentów jest więcej niż max_items, dwa
+    najstarsze fragmenty tej samej kreski są łączone z pominięciem co
+    drugiego punktu (a najstarsza osobna kreska jest usuwana).
+    """
+
+    def __init__(self, canvas, tag: str = 'user_path', min_step: float = 3.0,
+                 chunk_size: int = 500, max_items: int = 20, **style):
+        self.canvas = canvas
+        self.tag = tag
+        self.min_step = min_step
+        self.chunk_size = chunk_size
+        self.max_items = max_items
+        self.style = style or {'fill': 'blue', 'width': 4}
+        self.chunks = []  # [(id obiektu lub None, numer kreski, lista punktów)]
+        self.stroke = 0
+        self.last_point = None
+
+    def clear(self):
+        """Usuwa całą ścieżkę z canvas"""
+        self.canvas.delete(self.tag)
+        self.chunks = []
+        self.last_point = None
+
+    def start_stroke(self, x: float, y: float):
+        """Rozpoczyna nową kreskę (nie łączy się z poprzednią)"""
+        self.stroke += 1
+        self.chunks.append([None, self.stroke, [(x, y)]])
+        self.last_point = (x, y)
+        self._enforce_budget()
+
+    def add(self, x: float, y: float):
+        """Dodaje punkt do bieżącej kreski"""
+        if not self.chunks or self.chunks[-1][1] != self.stroke:
+            self.start_stroke(x, y)
+            return
+
+        chunk = self.chunks[-1]
+        points = chunk[2]
+        if len(points) >= 2:
+            px, py = points[-2]
+            if math.hypot(x - px, y - py) < self.min_step:
+                points[-1] = (x, y)  # Decymacja: przesuń tylko koniec łamanej
+                self.last_point = (x, y)
+                self._update(chunk)
+                return
+
+        points.append((x, y))
+        self.last_point = (x, y)
+        self._update(chunk)
+
+        if len(points) >= self.chunk_size:
+            # Nowy fragment zaczyna się w ostatnim punkcie poprzedniego
+            self.chunks.append([None, self.stroke, [(x, y)]])
+            self._enforce_budget()
+
+    def item_count(self) -> int:
+        """Liczba obiektów canvas zajętych przez ścieżkę"""
+        return sum(1 for chunk in self.chunks if chunk[0] is not None)
+
+    def _update(self, chunk):
+        """Tworzy lub aktualizuje obiekt canvas fragmentu"""
+        points = chunk[2]
+        if len(points) < 2:
+            return
+        flat = [c for point in points for c in point]
+        if chunk[0] is None:
+            chunk[0] = self.canvas.create_line(*flat, tags=self.tag, **self.style)
+        else:
+            self.canvas.coords(chunk[0], *flat)
+
+    def _enforce_budget(self):
+        """Utrzymuje liczbę fragmentów w limicie max_items"""
+        while len(self.chunks) > self.max_items:
+            first, second = self.chunks[0], self.chunks[1]
+            if first[1] != second[1]:
+                # Najstarsza kreska jest osobna - usuń ją z widoku
+                if first[0] is not None:
+                    self.canvas.delete(first[0])
+                self.chunks.pop(0)
+                continue
+
+            merged = self._decimate(first[2] + second[2][1:])
+            if first[0] is not None:
+                self.canvas.delete(first[0])
+            second[2] = merged
+            self.chunks.pop(0)
+            self._update(second)
+
+    @staticmethod
+    def _decimate(points: List[tuple]) -> List[tuple]:
+        """Co drugi punkt (z zachowaniem pierwszego i ostatniego)"""
+        if len(points) <= 2:
+            return points
+        result = points[:-1:2]
+        result.append(points[-1])
+        return result
+
+
+class RouteLayer:
+    """Trasa nawigacji (linie i znaczniki) z uchwytami obiektów per indeks trasy"""
+
+    ROUTE_TAG = 'route'
+    MARKER_TAG = 'markers'
+    TRANSITION_TAG = 'floor_transition_marker'
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.items: Dict[int, List[int]] = {}  # Indeks na trasie -> obiekty znacznika
+        self.kinds: Dict[int, str] = {}  # Indeks na trasie -> start/goal/transition/waypoint
+        self.reached = set()
+
+    def clear(self):
+        """Usuwa trasę z canvas"""
+        self.canvas.delete(self.ROUTE_TAG)
+        self.canvas.delete(self.MARKER_TAG)
+        self.canvas.delete(self.TRANSITION_TAG)
+        self.items = {}
+        self.kinds = {}
+        self.reached = set()
+
+    @staticmethod
+    def _split(node: str):
+        """(piętro, ID punktu); piętro None dla starego formatu bez prefiksu"""
+        if '_' in node:
+            floor, point_id = node.split('_', 1)
+            return floor, point_id
+        return None, node
+
+    def draw(self, route: List[str], nodes_coords: Dict[str, dict], floor: str,
+             point_labels: Dict[str, str], transitions: Dict[int, str],
+             reached_index: int = 0):
+        """Rysuje od nowa trasę piętra floor (punkty przed reached_index jako osiągnięte)"""
+        self.clear()
+        canvas = self.canvas
+        split = [self._split(node) for node in route]
+
+        # Linie trasy tylko w obrębie piętra
+        for i in range(len(route) - 1):
+            floor_from, floor_to = split[i][0], split[i + 1][0]
+            if floor_from is not None and floor_to is not None:
+                if floor_from != floor or floor_to != floor:
+                    continue
+            a = nodes_coords.get(route[i])
+            b = nodes_coords.get(route[i + 1])
+            if a and b:
+                canvas.create_line(a['x'], a['y'], b['x'], b['y'],
+                                   fill='red', width=5, tags=self.ROUTE_TAG)
+
+        last = len(route) - 1
+        for i, node in enumerate(route):
+            node_floor, node_id = split[i]
+            if node_floor is not None and node_floor != floor:
+                continue
+            coords = nodes_coords.get(node)
+            if not coords:
+                continue
+            x, y = coords['x'], coords['y']
+            label = point_labels.get(node_id, f"#{node_id}")
+
+            if i == 0:
+                kind = 'start'
+                items = [
+                    canvas.create_oval(x-10, y-10, x+10, y+10, fill='green', outline='darkgreen',
+                                       width=2, tags=self.MARKER_TAG),
+                    canvas.create_text(x, y-20, text=f'START\n{label}', fill='green',
+                                       font=('Arial', 9, 'bold'), tags=self.MARKER_TAG)
+                ]
+            elif i == last:
+                kind = 'goal'
+                items = [
+                    canvas.create_oval(x-10, y-10, x+10, y+10, fill='red', outline='darkred',
+                                       width=2, tags=self.MARKER_TAG),
+                    canvas.create_text(x, y-20, text=f'CEL\n{label}', fill='red',
+                                       font=('Arial', 9, 'bold'), tags=self.MARKER_TAG)
+                ]
+            elif i in transitions:
+                kind = 'transition'
+                trans_icon = "🪜" if transitions[i] == "stairs" else "🛗"
+                items = [
+                    canvas.create_rectangle(x-12, y-12, x+12, y+12, fill='purple',
+                                            outline='darkviolet', width=3,
+                                            tags=self.TRANSITION_TAG),
+                    canvas.create_text(x, y-18, text=f'{trans_icon}\n{label}', fill='purple',
+                                       font=('Arial', 9, 'bold'), tags=self.TRANSITION_TAG)
+                ]
+            else:
+                kind = 'waypoint'
+                items = [canvas.create_oval(x-6, y-6, x+6, y+6, fill='orange',
+                                            outline='darkorange', width=2,
+                                            tags=self.MARKER_TAG)]
+                if node_id in point_labels:
+                    items.append(canvas.create_text(x, y-12, text=label, fill='orange',
+                                                    font=('Arial', 7), tags=self.MARKER_TAG))
+
+            self.items[i] = items
+            self.kinds[i] = kind
+
+        for i in range(min(reached_index, len(route))):
+            self.mark_reached(i)
+
+    def mark_reached(self, index: int):
+        """Oznacza osiągnięty punkt trasy (zmienia styl tylko jego znacznika)"""
+        if index in self.reached or index not in self.items:
+            return
+        self.reached.add(index)
+        kind = self.kinds[index]
+        if kind in ('start', 'goal'):
+            return  # Start i cel zostają bez zmian
+        shape, *texts = self.items[index]
+        self.canvas.itemconfig(shape, fill='lightgray', outline='gray')
+        for text in texts:
+            self.canvas.itemconfig(text, fill='gray')
@@ -0,0 +1,326 @@
+"""Skompilowana mapa w formacie binarnym (gps_paths.map.bin) wczytywana przez mmap.
+
+Kompilacja zapisuje obok mapy plik z sekcjami tablic liczbowych:
+współrzędne punktów, ścieżki (CSR po punktach), połączenia, etykiety
+(teksty internowane w jednej tablicy napisów) oraz gotowy graf CSR
+z routing.CompiledGraph i tablicą przejść między piętrami. Wczytanie to
+mmap pliku i rzutowanie sekcji na memoryview - bez parsowania JSON.
+
+Nagłówek zawiera wersję formatu i skrót SHA-256 mapy (razem z dziennikiem
+zmian, routing.file_hash). Plik nieaktualny lub innej wersji jest pomijany,
+aplikacje wczytują wtedy JSON i kompilują plik od nowa.
+
+Użycie:
+    python compiled_map.py [gps_paths.json]
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from floor_shards import is_sharded
+from map_store import read_map
+from routing import CompiledGraph, file_hash
+
+
+MAGIC = b'GPSMAP\x00\x00'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sHH32sI')  # magic, wersja, kolejność bajtów, skrót, liczba sekcji
+SECTION = struct.Struct('<8sc3xQQ')  # nazwa, typ tablicy, przesunięcie, długość w bajtach
+LITTLE_ENDIAN = 1 if sys.byteorder == 'little' else 2
+
+INT_X, INT_Y = 1, 2  # Flagi punktu: współrzędna zapisana w JSON jako liczba całkowita
+INT_DISTANCE = 1
+
+
+def sidecar_filename(map_filename: str) -> str:
+    """Ścieżka skompilowanej mapy obok pliku mapy"""
+    base, _ = os.path.splitext(map_filename)
+    return base + ".map.bin"
+
+
+class _Strings:
+    """Internowanie napisów do jednej tablicy"""
+
+    def __init__(self):
+        self.items: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def __call__(self, text) -> int:
+        if text is None:
+            return -1
+        i = self.index.get(text)
+        if i is None:
+            i = len(self.items)
+            self.index[text] = i
+            self.items.append(text)
+        return i
+
+
+class CompiledMap:
+    """Sekcje skompilowanej mapy (memoryview na mmap albo tablice array)"""
+
+    def __init__(self, map_hash: str, sections: Dict[str, object], buffer=None):
+        self.map_hash = map_hash
+        self.sections = sections
+        self._buffer = buffer  # mmap musi żyć tak długo jak sekcje
+        self._strings = None
+
+    # Kompilacja ---------------------------------------------------------
+
+    @classmethod
+    def build(cls, data: dict, map_hash: str) -> Optional['CompiledMap']:
+        """Kompiluje mapę wielopiętrową; None gdy mapy nie da się zapisać dokładnie"""
+        if 'floors' not in data or 'building_info' not in data:
+            return None  # Stary format jest czytany tylko z JSON
+        strings = _Strings()
+        s = {name: array(code) for name, code in (
+            ('fl_name', 'i'),
+            ('pt_id', 'q'), ('pt_x', 'd'), ('pt_y', 'd'), ('pt_flags', 'b'),
+            ('pa_floor', 'i'), ('pa_id', 'q'), ('pa_color', 'i'), ('pa_start', 'q'),
+            ('co_floor', 'i'), ('co_from', 'q'), ('co_to', 'q'), ('co_dist', 'd'), ('co_flags', 'b'),
+            ('lb_floor', 'i'), ('lb_key', 'i'), ('lb_value', 'i'),
+            ('g_nodes', 'i'), ('g_floor', 'i'), ('g_floors', 'i'), ('g_tr', 'i'))}
+
+        def number(value) -> bool:
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+        for f, (floor_id, floor) in enumerate(data['floors'].items()):
+            if set(floor) - {'paths', 'connections', 'point_labels'}:
+                return None
+            s['fl_name'].append(strings(floor_id))
+            for path in floor.get('paths', []):
+                if set(path) - {'id', 'points', 'color'} or not isinstance(path.get('id'), int):
+                    return None
+                s['pa_floor'].append(f)
+                s['pa_id'].append(path['id'])
+                s['pa_color'].append(strings(path.get('color')))
+                s['pa_start'].append(len(s['pt_id']))
+                for point in path.get('points', []):
+                    if set(point) != {'id', 'x', 'y'} or not isinstance(point['id'], int) \
+                            or not number(point['x']) or not number(point['y']):
+                        return None
+                    s['pt_id'].append(point['id'])
+                    s['pt_x'].append(point['x'])
+                    s['pt_y'].append(point['y'])
+                    s['pt_flags'].append((INT_X if isinstance(point['x'], int) else 0)
+                                         | (INT_Y if isinstance(point['y'], int) else 0))
+            for conn in floor.get('connections', []):
+                if set(conn) != {'from', 'to', 'distance'} or not isinstance(conn['from'], int) \
+                        or not isinstance(conn['to'], int) or not number(conn['distance']):
+                    return None
+                s['co_floor'].append(f)
+                s['co_from'].append(conn['from'])
+                s['co_to'].append(conn['to'])
+                s['co_dist'].append(conn['distance'])
+                s['co_flags'].append(INT_DISTANCE if isinstance(conn['distance'], int) else 0)
+            for key, value in floor.get('point_labels', {}).items():
+                if not isinstance(value, str):
+                    return None
+                s['lb_floor'].append(f)
+                s['lb_key'].append(strings(key))
+                s['lb_value'].append(strings(value))
+        s['pa_start'].append(len(s['pt_id']))
+
+        # Gotowy graf CSR (jak routing.CompiledGraph.compile)
+        transitions = data.get('floor_transitions', [])
+        graph = CompiledGraph.compile(data['floors'], transitions)
+        s['g_nodes'] = array('i', (strings(node) for node in graph.node_ids))
+        s['g_floor'] = array('i', graph.node_floors)
+        s['g_floors'] = array('i', (strings(floor_id) for floor_id in graph.floor_ids))
+        s['g_xs'], s['g_ys'] = graph.xs, graph.ys
+        s['g_off'], s['g_tgt'], s['g_w'] = graph.offsets, graph.targets, graph.weights
+        transition_index = {id(t): i for i, t in enumerate(transitions)}
+        for (u, v), transition in graph.transitions.items():
+            s['g_tr'].extend((u, v, transition_index[id(transition)]))
+
+        # Napisy i reszta dokumentu (mała) jako JSON
+        rest = {k: v for k, v in data.items() if k != 'floors'}
+        s['json'] = array('b', json.dumps(rest, ensure_ascii=False).encode('utf-8'))
+        blob = bytearray()
+        offsets = array('q', [0])
+        for text in strings.items:
+            blob += text.encode('utf-8')
+            offsets.append(len(blob))
+        s['str_data'] = array('b', bytes(blob))
+        s['str_off'] = offsets
+        return cls(map_hash, s)
+
+    def save(self, filename: str):
+        """Zapisuje sekcje do pliku (atomowo przez plik tymczasowy)"""
+        names = sorted(self.sections)
+        position = HEADER.size + SECTION.size * len(names)
+        table, chunks = [], []
+        for name in names:
+            section = self.sections[name]
+            raw = section.tobytes()
+            padding = (-position) % 8  # Wyrównanie sekcji do 8 bajtów
+            position += padding
+            chunks.append(b'\x00' * padding + raw)
+            table.append(SECTION.pack(name.encode('ascii'), section.typecode.encode('ascii'),
+                                      position, len(raw)))
+            position += len(raw)
+
+        tmp = filename + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, LITTLE_ENDIAN,
+                                bytes.fromhex(self.map_hash), len(names)))
+            f.writelines(table)
+            f.writelines(chunks)
+        os.replace(tmp, filename)
+
+    # Wczytywanie --------------------------------------------------------
+
+    @classmethod
+    def open(cls, filename: str, map_hash: Optional[str] = None) -> Optional['CompiledMap']:
+        """Mapuje plik do pamięci; None gdy brak, inna wersja lub inny skrót mapy"""
+        try:
+            with open(filename, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(buffer) < HEADER.size:
+            return None
+        magic, version, byteorder, digest, count = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or byteorder != LITTLE_ENDIAN:
+            return None
+        if map_hash is not None and digest.hex() != map_hash:
+            return None
+
+        view = memoryview(buffer)
+        sections = {}
+        for k in range(count):
+            name, code, offset, length = SECTION.unpack_from(buffer, HEADER.size + k * SECTION.size)
+            sections[name.rstrip(b'\x00').decode('ascii')] = \
+                view[offset:offset + length].cast(code.decode('ascii'))
+        return cls(digest.hex(), sections, buffer)
+
+    @property
+    def strings(self) -> List[str]:
+        """Internowane napisy (dekodowane przy pierwszym użyciu)"""
+        if self._strings is None:
+            data = bytes(self.sections['str_data'])
+            offsets = self.sections['str_off']
+            self._strings = [data[offsets[i]:offsets[i + 1]].decode('utf-8')
+                             for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def graph(self) -> CompiledGraph:
+        """Graf CSR bez kompilacji (tablice wskazują na zmapowany plik)"""
+        s = self.sections
+        strings = self.strings
+        rest = json.loads(bytes(s['json']).decode('utf-8'))
+        floor_transitions = rest.get('floor_transitions', [])
+        g_tr = s['g_tr']
+        transitions = {(g_tr[k], g_tr[k + 1]): floor_transitions[g_tr[k + 2]]
+                       for k in range(0, len(g_tr), 3)}
+        return CompiledGraph([strings[i] for i in s['g_nodes']], s['g_floor'],
+                             [strings[i] for i in s['g_floors']], s['g_xs'], s['g_ys'],
+                             s['g_off'], s['g_tgt'], s['g_w'], transitions)
+
+    def building(self) -> dict:
+        """Mapa w strukturze gps_paths.json (floors, floor_transitions, ...)"""
+        s = self.sections
+        strings = self.strings
+        data = json.loads(bytes(s['json']).decode('utf-8'))
+        floors = {}
+        floor_list = []
+        for name in s['fl_name']:
+            floor = {'paths': [], 'connections': [], 'point_labels': {}}
+            floors[strings[name]] = floor
+            floor_list.append(floor)
+
+        pt_id, pt_x, pt_y, pt_flags = s['pt_id'], s['pt_x'], s['pt_y'], s['pt_flags']
+        pa_start = s['pa_start']
+        for p, (f, path_id, color) in enumerate(zip(s['pa_floor'], s['pa_id'], s['pa_color'])):
+            points = []
+            for k in range(pa_start[p], pa_start[p + 1]):
+                flags = pt_flags[k]
+                x, y = pt_x[k], pt_y[k]
+                points.append({'id': pt_id[k],
+                               'x': int(x) if flags & INT_X else x,
+                               'y': int(y) if flags & INT_Y else y})
+            path = {'id': path_id, 'points': points}
+            if color >= 0:
+                path['color'] = strings[color]
+            floor_list[f]['paths'].append(path)
+
+        for f, a, b, distance, flags in zip(s['co_floor'], s['co_from'], s['co_to'],
+                                            s['co_dist'], s['co_flags']):
+            floor_list[f]['connections'].append(
+                {'from': a, 'to': b, 'distance': int(distance) if flags & INT_DISTANCE else distance})
+        for f, key, value in zip(s['lb_floor'], s['lb_key'], s['lb_value']):
+            floor_list[f]['point_labels'][strings[key]] = strings[value]
+
+        result = {'building_info': data.pop('building_info'), 'floors': floors}
+        result.update(data)
+        return result
+
+
+def compile_map(map_filename: str, data: Optional[dict] = None) -> Optional[CompiledMap]:
+    """Kompiluje mapę (wczytaną z JSON, jeśli nie podano) i zapisuje plik obok niej"""
+    map_hash = file_hash(map_filename)
+    if data is None:
+        data = read_map(map_filename)
+    compiled = CompiledMap.build(data, map_hash)
+    if compiled is None:
+        return None
+    try:
+        compiled.save(sidecar_filename(map_filename))
+    except OSError as e:
+        print(f"✗ Nie udało się zapisać skompilowanej mapy: {e}")
+    return compiled
+
+
+def load_compiled(map_filename: str) -> Optional[CompiledMap]:
+    """Aktualna skompilowana mapa albo None (brak pliku lub mapa zmieniona)"""
+    return CompiledMap.open(sidecar_filename(map_filename), file_hash(map_filename))
+
+
+def load_building_data(map_filename: str) -> dict:
+    """Mapa ze skompilowanego pliku; gdy jest nieaktualny - z JSON i kompilacja od nowa.
+
+    Mapa podzielona na pliki pięter jest zwracana bez kompilacji - piętra
+    wczytają się przy pierwszym dostępie.
+    """
+    if is_sharded(map_filename):
+        return read_map(map_filename)
+    compiled = load_compiled(map_filename)
+    if compiled is not None:
+        return compiled.building()
+    data = read_map(map_filename)
+    if compile_map(map_filename, data) is not None:
+        print(f"✓ Skompilowano mapę: {sidecar_filename(map_filename)}")
+    return data
+
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else "gps_paths.json"
+    started = time.perf_counter()
+    data = read_map(filename)
+    parsed = time.perf_counter()
+    compiled = compile_map(filename, data)
+    if compiled is None:
+        print(f"✗ Mapy {filename} nie da się skompilować (stary format lub nietypowe pola)")
+        return
+    compiled_at = time.perf_counter()
+
+    loaded = load_compiled(filename)
+    building = loaded.building()
+    graph = loaded.graph()
+    loaded_at = time.perf_counter()
+    print(f"✓ Zapisano {sidecar_filename(filename)} "
+          f"({os.path.getsize(sidecar_filename(filename))} B, {len(graph)} węzłów)")
+    print(f"  JSON: {(parsed - started) * 1000:.1f} ms | kompilacja: "
+          f"{(compiled_at - parsed) * 1000:.1f} ms | wczytanie mmap: "
+          f"{(loaded_at - compiled_at) * 1000:.1f} ms")
+    if building != data:
+        print("✗ Odczytana mapa różni się od JSON")
+
+
+if __name__ == "__main__":
+    main()
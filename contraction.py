@@ -0,0 +1,282 @@
+"""Contraction Hierarchies (CH) dla skompilowanego grafu budynku.
+
+Węzły są kolejno "kontraktowane" (od najmniej ważnych): po usunięciu węzła v
+każda najkrótsza ścieżka u - v - w, której nie zastępuje inna droga (świadek),
+jest zachowywana jako skrót u - w pamiętający węzeł środkowy v. Zapytanie to
+dwukierunkowy Dijkstra idący tylko "w górę" hierarchii, a skróty są na końcu
+rozwijane do ścieżki po oryginalnych krawędziach.
+
+Indeks jest zapisywany obok pliku mapy (gps_paths.ch.json) razem ze skrótem
+SHA-256 mapy, więc Graph Analyzer i Navigator wczytują go zamiast
+kontraktować graf przy każdym starcie.
+"""
+import heapq
+import json
+import os
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from routing import CompiledGraph, file_hash
+
+
+FORMAT_VERSION = 1
+WITNESS_SETTLE_LIMIT = 60  # Limit rozwiniętych węzłów w wyszukiwaniu świadka
+
+
+def index_filename(map_filename: str) -> str:
+    """Ścieżka pliku z indeksem CH obok pliku mapy"""
+    base, _ = os.path.splitext(map_filename)
+    return base + ".ch.json"
+
+
+class ContractionHierarchy:
+    """Indeks CH: ranga węzłów i graf krawędzi "w górę" w formacie CSR.
+
+    Krawędź i -> up_targets[k] (k w up_offsets[i]:up_offsets[i + 1]) prowadzi
+    do węzła o wyższej randze; up_middle[k] to węzeł środkowy skrótu albo -1
+    dla oryginalnej krawędzi grafu.
+    """
+
+    def __init__(self, graph: CompiledGraph, map_hash: str, rank,
+                 up_offsets, up_targets, up_weights, up_middle):
+        self.graph = graph
+        self.map_hash = map_hash
+        self.rank = rank
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_middle = up_middle
+        self.settled = 0  # Rozwinięte węzły w ostatnim zapytaniu
+
+    @classmethod
+    def build(cls, graph: CompiledGraph, map_hash: str = "") -> 'ContractionHierarchy':
+        """Kontraktuje graf (kolejność wg różnicy krawędzi, leniwe aktualizacje)"""
+        n = len(graph)
+        inf = float('inf')
+
+        # Pozostały graf: węzeł -> {sąsiad: (waga, węzeł środkowy)}
+        adj: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(n)]
+        for u in range(n):
+            for k in range(graph.offsets[u], graph.offsets[u + 1]):
+                v = graph.targets[k]
+                w = graph.weights[k]
+                if v != u and w < adj[u].get(v, (inf, -1))[0]:
+                    adj[u][v] = (w, -1)
+
+        deleted_neighbours = [0] * n
+        up: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+        rank = array('i', [0]) * n
+
+        def priority(v, shortcuts):
+            return len(shortcuts) - len(adj[v]) + deleted_neighbours[v]
+
+        pq = [(priority(v, cls._shortcuts(adj, v)), v) for v in range(n)]
+        heapq.heapify(pq)
+
+        order = 0
+        while pq:
+            _, v = heapq.heappop(pq)
+            shortcuts = cls._shortcuts(adj, v)
+            p = priority(v, shortcuts)
+            if pq and p > pq[0][0]:
+                heapq.heappush(pq, (p, v))  # Priorytet się zdezaktualizował
+                continue
+
+            rank[v] = order
+            order += 1
+            up[v] = [(u, w, m) for u, (w, m) in adj[v].items()]
+            for u in adj[v]:
+                del adj[u][v]
+                deleted_neighbours[u] += 1
+            adj[v] = {}
+            for u, x, w in shortcuts:
+                if w < adj[u].get(x, (inf, -1))[0]:
+                    adj[u][x] = (w, v)
+                    adj[x][u] = (w, v)
+
+        up_offsets = array('i', [0]) * (n + 1)
+        up_targets = array('i')
+        up_weights = array('d')
+        up_middle = array('i')
+        for v in range(n):
+            for u, w, m in up[v]:
+                up_targets.append(u)
+                up_weights.append(w)
+                up_middle.append(m)
+            up_offsets[v + 1] = len(up_targets)
+
+        return cls(graph, map_hash, rank, up_offsets, up_targets, up_weights, up_middle)
+
+    @staticmethod
+    def _shortcuts(adj, v: int) -> List[Tuple[int, int, float]]:
+        """Skróty potrzebne po usunięciu v: (u, w, waga) bez ścieżki-świadka"""
+        inf = float('inf')
+        neighbours = [(u, w) for u, (w, _) in adj[v].items()]
+        shortcuts = []
+
+        for i, (u, wu) in enumerate(neighbours):
+            targets = {x: wu + wx for x, wx in neighbours[i + 1:]}
+            if not targets:
+                continue
+            max_dist = max(targets.values())
+
+            # Ograniczony Dijkstra z u z pominięciem v
+            dist = {u: 0.0}
+            pq = [(0.0, u)]
+            settled = 0
+            remaining = len(targets)
+            while pq and remaining and settled < WITNESS_SETTLE_LIMIT:
+                d, a = heapq.heappop(pq)
+                if d > dist[a]:
+                    continue
+                if d > max_dist:
+                    break
+                settled += 1
+                if a in targets:
+                    remaining -= 1
+                for b, (w, _) in adj[a].items():
+                    if b == v:
+                        continue
+                    nd = d + w
+                    if nd < dist.get(b, inf):
+                        dist[b] = nd
+                        heapq.heappush(pq, (nd, b))
+
+            for x, via in targets.items():
+                if dist.get(x, inf) > via:
+                    shortcuts.append((u, x, via))
+        return shortcuts
+
+    def route(self, s: int, t: int) -> Tuple[Optional[List[int]], float]:
+        """Dwukierunkowe wyszukiwanie w górę hierarchii z rozwinięciem skrótów"""
+        up_offsets = self.up_offsets
+        up_targets = self.up_targets
+        up_weights = self.up_weights
+        inf = float('inf')
+
+        dist = ({s: 0.0}, {t: 0.0})
+        parent = ({s: -1}, {t: -1})
+        queues = ([(0.0, s)], [(0.0, t)])
+        best, meet = (0.0, s) if s == t else (inf, -1)
+        settled = 0
+
+        while queues[0] or queues[1]:
+            for side in (0, 1):
+                pq = queues[side]
+                if not pq:
+                    continue
+                d, u = heapq.heappop(pq)
+                if d >= best:
+                    pq.clear()  # Ten kierunek nie poprawi już wyniku
+                    continue
+                if d > dist[side][u]:
+                    continue
+                settled += 1
+
+                other = dist[1 - side].get(u)
+                if other is not None and d + other < best:
+                    best, meet = d + other, u
+
+                own = dist[side]
+                for k in range(up_offsets[u], up_offsets[u + 1]):
+                    v = up_targets[k]
+                    nd = d + up_weights[k]
+                    if nd < own.get(v, inf):
+                        own[v] = nd
+                        parent[side][v] = u
+                        heapq.heappush(pq, (nd, v))
+
+        self.settled = settled
+        if meet == -1:
+            return None, inf
+
+        forward = []
+        u = meet
+        while u != -1:
+            forward.append(u)
+            u = parent[0][u]
+        forward.reverse()
+        u = parent[1][meet]
+        while u != -1:
+            forward.append(u)
+            u = parent[1][u]
+
+        path = [forward[0]]
+        for a, b in zip(forward, forward[1:]):
+            self._unpack(a, b, path)
+        return path, best
+
+    def _up_edge(self, a: int, b: int) -> int:
+        """Indeks krawędzi między a i b (zapisanej przy węźle o niższej randze)"""
+        if self.rank[a] > self.rank[b]:
+            a, b = b, a
+        for k in range(self.up_offsets[a], self.up_offsets[a + 1]):
+            if self.up_targets[k] == b:
+                return k
+        raise KeyError((a, b))
+
+    def _unpack(self, a: int, b: int, path: List[int]):
+        """Dopisuje do path węzły krawędzi a -> b (bez a), rozwijając skróty"""
+        stack = [(a, b)]
+        while stack:
+            a, b = stack.pop()
+            m = self.up_middle[self._up_edge(a, b)]
+            if m == -1:
+                path.append(b)
+            else:
+                stack.append((m, b))
+                stack.append((a, m))
+
+    def save(self, filename: str):
+        """Zapisuje indeks do pliku JSON"""
+        data = {
+            'version': FORMAT_VERSION,
+            'map_hash': self.map_hash,
+            'node_count': len(self.graph),
+            'rank': list(self.rank),
+            'up_offsets': list(self.up_offsets),
+            'up_targets': list(self.up_targets),
+            'up_weights': list(self.up_weights),
+            'up_middle': list(self.up_middle)
+        }
+        tmp = filename + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename: str, graph: CompiledGraph,
+             map_hash: str) -> Optional['ContractionHierarchy']:
+        """Wczytuje indeks; None gdy plik nie istnieje lub jest nieaktualny"""
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if (data.get('version') != FORMAT_VERSION
+                or data.get('map_hash') != map_hash
+                or data.get('node_count') != len(graph)):
+            return None
+
+        return cls(graph, map_hash,
+                   array('i', data['rank']),
+                   array('i', data['up_offsets']),
+                   array('i', data['up_targets']),
+                   array('d', data['up_weights']),
+                   array('i', data['up_middle']))
+
+    @classmethod
+    def for_map(cls, graph: CompiledGraph, map_filename: str) -> 'ContractionHierarchy':
+        """Wczytuje indeks zapisany obok mapy lub kontraktuje graf i go zapisuje"""
+        map_hash = file_hash(map_filename)
+        filename = index_filename(map_filename)
+        index = cls.load(filename, graph, map_hash)
+        if index is None:
+            index = cls.build(graph, map_hash)
+            try:
+                index.save(filename)
+                print(f"✓ Zapisano indeks CH: {filename}")
+            except OSError as e:
+                print(f"✗ Nie udało się zapisać indeksu CH: {e}")
+        return index
@@ -0,0 +1,141 @@
+"""Macierz odległości między opisanymi punktami (point_labels) budynku.
+
+Dla każdego punktu źródłowego wykonywany jest jeden przebieg Dijkstry
+(one-to-many), który wypełnia od razu cały wiersz macierzy. Źródła są
+liczone równolegle w puli procesów.
+
+Wynik to plik binarny (nagłówek, ID węzłów "piętro_punkt", wiersze float32;
+inf = brak drogi) oraz plik CSV z tymi samymi danymi.
+
+Użycie:
+    python distance_matrix.py --map gps_paths.json --output distance_matrix
+"""
+import argparse
+import csv
+import os
+import struct
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from routing import RoutingEngine, load_building, node_key
+
+
+MAGIC = b'DMAT'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sII')  # magic, wersja, liczba węzłów
+
+_engine = None  # Silnik w procesie roboczym
+
+
+def labelled_points(data: dict, include_all: bool = False) -> Dict[str, str]:
+    """Zwraca {ID węzła: etykieta} dla opisanych punktów wszystkich pięter"""
+    points = {}
+    for floor_id, floor_data in data.get('floors', {}).items():
+        labels = floor_data.get('point_labels', {})
+        if include_all:
+            for conn in floor_data.get('connections', []):
+                for point_id in (conn['from'], conn['to']):
+                    points.setdefault(node_key(floor_id, point_id), "")
+        for point_id, label in labels.items():
+            points[node_key(floor_id, point_id)] = label
+    return points
+
+
+def _init_worker(map_filename: str):
+    """Inicjalizacja procesu roboczego: własny skompilowany graf"""
+    global _engine
+    _engine = RoutingEngine.from_file(map_filename)
+
+
+def _row(args: Tuple[str, List[str]]) -> Tuple[str, List[float]]:
+    """Wiersz macierzy dla jednego źródła (wywoływane w procesie roboczym)"""
+    source, nodes = args
+    distances = _engine.one_to_many(source, nodes)
+    return source, [distances[node] for node in nodes]
+
+
+def compute_matrix(map_filename: str, nodes: List[str],
+                   workers: Optional[int] = None) -> List[List[float]]:
+    """Liczy macierz odległości nodes x nodes w puli procesów"""
+    rows = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(map_filename,)) as pool:
+        chunksize = max(1, len(nodes) // ((workers or os.cpu_count() or 1) * 4))
+        for source, row in pool.map(_row, [(source, nodes) for source in nodes],
+                                    chunksize=chunksize):
+            rows[source] = row
+    return [rows[source] for source in nodes]
+
+
+def write_binary(filename: str, nodes: List[str], matrix: List[List[float]]):
+    """Zapisuje macierz w formacie binarnym (float32, wierszami)"""
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(nodes)))
+        ids = '\n'.join(nodes).encode('utf-8')
+        f.write(struct.pack('<I', len(ids)))
+        f.write(ids)
+        for row in matrix:
+            array('f', row).tofile(f)
+
+
+def read_binary(filename: str) -> Tuple[List[str], List[array]]:
+    """Wczytuje macierz zapisaną przez write_binary"""
+    with open(filename, 'rb') as f:
+        magic, version, n = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Nieprawidłowy plik macierzy odległości: {filename}")
+        (size,) = struct.unpack('<I', f.read(4))
+        nodes = f.read(size).decode('utf-8').split('\n') if n else []
+        matrix = []
+        for _ in range(n):
+            row = array('f')
+            row.fromfile(f, n)
+            matrix.append(row)
+    return nodes, matrix
+
+
+def write_csv(filename: str, nodes: List[str], labels: Dict[str, str],
+              matrix: List[List[float]]):
+    """Zapisuje macierz jako CSV (wiersze i kolumny to ID węzłów)"""
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['node', 'label'] + nodes)
+        for node, row in zip(nodes, matrix):
+            writer.writerow([node, labels.get(node, "")] +
+                            [round(d, 2) if d != float('inf') else "" for d in row])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Macierz odległości między opisanymi punktami")
+    parser.add_argument('--map', default="gps_paths.json", help="plik mapy")
+    parser.add_argument('--output', default="distance_matrix",
+                        help="nazwa plików wynikowych (bez rozszerzenia)")
+    parser.add_argument('--workers', type=int, help="liczba procesów (domyślnie liczba rdzeni)")
+    parser.add_argument('--all', action='store_true',
+                        help="wszystkie punkty zamiast tylko opisanych")
+    args = parser.parse_args()
+
+    data = load_building(args.map)
+    labels = labelled_points(data, include_all=args.all)
+    engine = RoutingEngine.from_file(args.map)
+    nodes = [node for node in labels if node in engine.graph.index]
+    skipped = len(labels) - len(nodes)
+    if skipped:
+        print(f"✗ Pominięto {skipped} punktów bez połączeń")
+    if not nodes:
+        print("✗ Brak opisanych punktów (point_labels) - użyj --all dla wszystkich punktów")
+        return
+
+    started = time.perf_counter()
+    matrix = compute_matrix(args.map, nodes, args.workers)
+    print(f"✓ Macierz {len(nodes)}x{len(nodes)} policzona w {time.perf_counter() - started:.2f} s")
+
+    write_binary(args.output + ".bin", nodes, matrix)
+    write_csv(args.output + ".csv", nodes, labels, matrix)
+    print(f"✓ Zapisano {args.output}.bin i {args.output}.csv")
+
+
+if __name__ == "__main__":
+    main()
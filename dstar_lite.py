@@ -0,0 +1,158 @@
+"""Przyrostowe wyznaczanie trasy do stałego celu (D* Lite / LPA*).
+
+Przeszukiwanie idzie wstecz, od celu do bieżącej pozycji użytkownika. Wartości
+g (odległość do celu) i rhs (jej jednokrokowa prognoza) zostają między
+zapytaniami, więc trasa z nowej pozycji po zboczeniu wymaga rozwinięcia tylko
+węzłów, których poprzednie przeszukiwanie jeszcze nie ustaliło. Zmiana wagi
+krawędzi (np. zablokowany korytarz) naprawia tylko dotknięte wartości (LPA*).
+
+Klucze kolejki używają heurystyki FloorHeuristic względem bieżącego startu.
+Ta heurystyka nie jest metryką (przejścia między piętrami), więc zamiast
+poprawki k_m z D* Lite klucze kolejki są przeliczane przy zmianie startu.
+"""
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+from routing import CompiledGraph, FloorHeuristic
+
+
+class DStarLite:
+    """Trasy z dowolnego startu do ustalonego celu z zachowaniem stanu przeszukiwania"""
+
+    def __init__(self, graph: CompiledGraph, goal: int,
+                 heuristic: Optional[FloorHeuristic] = None):
+        self.graph = graph
+        self.goal = goal
+        self.heuristic = heuristic or FloorHeuristic(graph)
+        self.g: Dict[int, float] = {}
+        self.rhs: Dict[int, float] = {goal: 0.0}
+        self.open: Dict[int, Tuple[float, float]] = {}  # Węzeł -> aktualny klucz
+        self.queue: List[Tuple[Tuple[float, float], int]] = []
+        self.overrides: Dict[Tuple[int, int], float] = {}  # Zmienione wagi krawędzi
+        self.start = None
+        self.h = lambda v: 0.0
+        self.expanded = 0  # Rozwinięte węzły w ostatnim zapytaniu
+        self._push(goal)
+
+    def _key(self, u: int) -> Tuple[float, float]:
+        inf = float('inf')
+        k = min(self.g.get(u, inf), self.rhs.get(u, inf))
+        return (k + self.h(u), k)
+
+    def _push(self, u: int):
+        key = self._key(u)
+        self.open[u] = key
+        heapq.heappush(self.queue, (key, u))
+
+    def _neighbours(self, u: int):
+        """Sąsiedzi węzła z wagami krawędzi (z uwzględnieniem zmian)"""
+        graph = self.graph
+        overrides = self.overrides
+        for k in range(graph.offsets[u], graph.offsets[u + 1]):
+            v = graph.targets[k]
+            w = graph.weights[k]
+            if overrides:
+                w = overrides.get((u, v), w)
+            yield v, w
+
+    def _update_vertex(self, u: int):
+        inf = float('inf')
+        g = self.g
+        if u != self.goal:
+            best = inf
+            for v, w in self._neighbours(u):
+                d = w + g.get(v, inf)
+                if d < best:
+                    best = d
+            self.rhs[u] = best
+        self.open.pop(u, None)  # Stary wpis w kopcu staje się nieaktualny
+        if g.get(u, inf) != self.rhs.get(u, inf):
+            self._push(u)
+
+    def _set_start(self, start: int):
+        """Nowy start: heurystyka względem niego i przeliczone klucze kolejki"""
+        if start == self.start:
+            return
+        self.start = start
+        self.h = self.heuristic.for_target(start)
+        self.queue = []
+        for u in self.open:
+            self.open[u] = self._key(u)
+            self.queue.append((self.open[u], u))
+        heapq.heapify(self.queue)
+
+    def _compute(self, start: int):
+        inf = float('inf')
+        g = self.g
+        rhs = self.rhs
+        queue = self.queue
+        open_keys = self.open
+        expanded = 0
+
+        while queue:
+            key, u = queue[0]
+            if open_keys.get(u) != key:
+                heapq.heappop(queue)  # Wpis nieaktualny
+                continue
+            if key >= self._key(start) and rhs.get(start, inf) == g.get(start, inf):
+                break
+            heapq.heappop(queue)
+            del open_keys[u]
+            expanded += 1
+
+            if g.get(u, inf) > rhs.get(u, inf):
+                g[u] = rhs[u]
+                for v, w in self._neighbours(u):
+                    if v != self.goal and g[u] + w < rhs.get(v, inf):
+                        rhs[v] = g[u] + w
+                        open_keys.pop(v, None)
+                        if g.get(v, inf) != rhs[v]:
+                            self._push(v)
+            else:
+                g[u] = inf
+                self._update_vertex(u)
+                for v, _ in self._neighbours(u):
+                    self._update_vertex(v)
+        self.expanded = expanded
+
+    def _settled(self, start: int) -> bool:
+        """Czy odległość startu jest już ostateczna (żaden otwarty węzeł jej nie poprawi)"""
+        inf = float('inf')
+        g = self.g.get(start, inf)
+        if g == inf or g != self.rhs.get(start, inf):
+            return False
+        return all(key[1] >= g for key in self.open.values())
+
+    def route(self, start: int) -> Tuple[Optional[List[int]], float]:
+        """Najkrótsza ścieżka start -> cel (wykorzystuje poprzednie przeszukiwania)"""
+        inf = float('inf')
+        if self._settled(start):
+            self.expanded = 0
+        else:
+            self._set_start(start)
+            self._compute(start)
+        distance = self.g.get(start, inf)
+        if distance == inf:
+            return None, inf
+
+        g = self.g
+        path = [start]
+        u = start
+        while u != self.goal:
+            best, best_v = inf, -1
+            for v, w in self._neighbours(u):
+                d = w + g.get(v, inf)
+                if d < best:
+                    best, best_v = d, v
+            if best_v == -1 or len(path) > len(self.graph):
+                return None, inf
+            path.append(best_v)
+            u = best_v
+        return path, distance
+
+    def set_edge_weight(self, u: int, v: int, weight: float):
+        """Zmienia wagę krawędzi u - v (inf = krawędź zablokowana)"""
+        self.overrides[(u, v)] = weight
+        self.overrides[(v, u)] = weight
+        self._update_vertex(u)
+        self._update_vertex(v)
@@ -0,0 +1,169 @@
+"""Feedback użytkowników o trasach w bazie SQLite (route_feedback.db).
+
+Każde zgłoszenie to jeden INSERT (bez wczytywania i przepisywania całego
+pliku). Kolumny timestamp, reason oraz start_node/end_node mają indeksy, a
+węzły sugerowanej trasy pominięte przez użytkownika trafiają do osobnej
+tabeli z indeksem po węźle. Przegląd feedbacku pobiera dane stronami i
+liczy statystyki zapytaniami agregującymi.
+
+Przy pierwszym otwarciu bazy dotychczasowe zgłoszenia z route_feedback.json
+są importowane (plik JSON zostaje bez zmian).
+"""
+import json
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_DB = "route_feedback.db"
+LEGACY_JSON = "route_feedback.json"
+PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    deviated INTEGER NOT NULL,
+    start_node TEXT,
+    end_node TEXT,
+    path_length INTEGER,
+    notes TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feedback_timestamp ON feedback(timestamp);
+CREATE INDEX IF NOT EXISTS feedback_reason ON feedback(reason, timestamp);
+CREATE INDEX IF NOT EXISTS feedback_route ON feedback(start_node, end_node);
+CREATE TABLE IF NOT EXISTS feedback_skipped (
+    feedback_id INTEGER NOT NULL REFERENCES feedback(id),
+    node TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feedback_skipped_node ON feedback_skipped(node);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+PERIODS = {'hour': 13, 'day': 10, 'month': 7}  # Długość prefiksu "YYYY-MM-DD HH"
+
+
+class FeedbackStore:
+    """Zgłoszenia feedbacku: zapis O(1), odczyt stronami i agregaty"""
+
+    def __init__(self, filename: str = DEFAULT_DB, legacy_json: Optional[str] = LEGACY_JSON):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(SCHEMA)
+        if legacy_json:
+            self._import_legacy(legacy_json)
+
+    def close(self):
+        self.db.close()
+
+    def _import_legacy(self, legacy_json: str):
+        """Jednorazowy import zgłoszeń z route_feedback.json"""
+        done = self.db.execute("SELECT value FROM meta WHERE key = 'legacy_import'").fetchone()
+        if done or not os.path.exists(legacy_json):
+            return
+        try:
+            with open(legacy_json, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"✗ Nie udało się zaimportować {legacy_json}: {e}")
+            return
+        with self.db:
+            for record in records:
+                self._insert(record)
+            self.db.execute("INSERT INTO meta(key, value) VALUES ('legacy_import', ?)",
+                            (legacy_json,))
+        print(f"✓ Zaimportowano {len(records)} zgłoszeń z {legacy_json}")
+
+    def _insert(self, record: dict) -> int:
+        suggested = [str(node) for node in record.get('suggested_route', [])]
+        visited = {str(node) for node in record.get('visited_nodes', [])}
+        cursor = self.db.execute(
+            "INSERT INTO feedback(timestamp, reason, deviated, start_node, end_node,"
+            " path_length, notes, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (record.get('timestamp', ''), record.get('reason', 'unknown'),
+             1 if record.get('deviated') else 0,
+             suggested[0] if suggested else None, suggested[-1] if suggested else None,
+             record.get('path_length', 0), record.get('notes', ''),
+             json.dumps(record, ensure_ascii=False)))
+        feedback_id = cursor.lastrowid
+        skipped = [(feedback_id, node) for node in dict.fromkeys(suggested) if node not in visited]
+        if skipped:
+            self.db.executemany("INSERT INTO feedback_skipped(feedback_id, node) VALUES (?, ?)",
+                                skipped)
+        return feedback_id
+
+    def add(self, record: dict) -> int:
+        """Zapisuje jedno zgłoszenie i zwraca jego ID"""
+        with self.db:
+            return self._insert(record)
+
+    @staticmethod
+    def _where(reason: Optional[str] = None, since: Optional[str] = None,
+               until: Optional[str] = None, start_node: Optional[str] = None,
+               end_node: Optional[str] = None) -> Tuple[str, list]:
+        """Warunek WHERE dla filtrów (czas jako tekst "YYYY-MM-DD HH:MM:SS")"""
+        clauses, params = [], []
+        for column, op, value in (('reason', '=', reason), ('timestamp', '>=', since),
+                                  ('timestamp', '<', until), ('start_node', '=', start_node),
+                                  ('end_node', '=', end_node)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, **filters) -> int:
+        """Liczba zgłoszeń spełniających filtry"""
+        where, params = self._where(**filters)
+        return self.db.execute(f"SELECT COUNT(*) FROM feedback{where}", params).fetchone()[0]
+
+    def page(self, offset: int = 0, limit: int = PAGE_SIZE, newest_first: bool = True,
+             **filters) -> List[Tuple[int, dict]]:
+        """Strona zgłoszeń: [(ID, zgłoszenie)]"""
+        where, params = self._where(**filters)
+        order = "DESC" if newest_first else "ASC"
+        rows = self.db.execute(
+            f"SELECT id, record FROM feedback{where} ORDER BY id {order} LIMIT ? OFFSET ?",
+            params + [limit, offset])
+        return [(feedback_id, json.loads(record)) for feedback_id, record in rows]
+
+    def summary(self, **filters) -> Dict[str, int]:
+        """Liczba zgłoszeń i liczba odstępstw od trasy"""
+        where, params = self._where(**filters)
+        total, deviated = self.db.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(deviated), 0) FROM feedback{where}", params).fetchone()
+        return {'total': total, 'deviated': deviated}
+
+    def counts_by_reason(self, **filters) -> List[Tuple[str, int]]:
+        """[(powód, liczba)] od najczęstszego"""
+        where, params = self._where(**filters)
+        return self.db.execute(
+            f"SELECT reason, COUNT(*) AS n FROM feedback{where} GROUP BY reason ORDER BY n DESC",
+            params).fetchall()
+
+    def counts_by_route(self, limit: int = 10, **filters) -> List[Tuple[str, str, int]]:
+        """[(start, cel, liczba)] najczęściej zgłaszanych tras"""
+        where, params = self._where(**filters)
+        return self.db.execute(
+            f"SELECT start_node, end_node, COUNT(*) AS n FROM feedback{where}"
+            " GROUP BY start_node, end_node ORDER BY n DESC LIMIT ?", params + [limit]).fetchall()
+
+    def counts_by_skipped_node(self, limit: int = 10, **filters) -> List[Tuple[str, int]]:
+        """[(węzeł, liczba)] węzłów sugerowanej trasy najczęściej pomijanych"""
+        where, params = self._where(**filters)
+        return self.db.execute(
+            "SELECT node, COUNT(*) AS n FROM feedback_skipped"
+            f" WHERE feedback_id IN (SELECT id FROM feedback{where})"
+            " GROUP BY node ORDER BY n DESC LIMIT ?", params + [limit]).fetchall()
+
+    def counts_by_period(self, period: str = 'day', **filters) -> List[Tuple[str, int]]:
+        """[(okres, liczba)] w kolejności czasu (period: hour/day/month)"""
+        length = PERIODS[period]
+        where, params = self._where(**filters)
+        return self.db.execute(
+            f"SELECT substr(timestamp, 1, {length}) AS p, COUNT(*) FROM feedback{where}"
+            " GROUP BY p ORDER BY p", params).fetchall()
@@ -0,0 +1,198 @@
+"""Budynek zapisany jako mały manifest + osobny plik na każde piętro.
+
+gps_paths.json zawiera wtedy tylko building_info, floor_transitions,
+metadata i floor_files (piętro -> plik w katalogu gps_paths.floors/).
+Piętra są wczytywane przy pierwszym dostępie (LazyFloors), więc otwarcie
+budynku z 30 piętrami kosztuje tyle co manifest i jedno piętro.
+
+Zapis przepisuje tylko piętra, których zawartość się zmieniła. Nowy plik
+piętra dostaje numer generacji w nazwie, a manifest jest podmieniany na
+końcu - po przerwanym zapisie manifest dalej wskazuje komplet starych plików.
+
+Użycie:
+    python floor_shards.py split [gps_paths.json]   # jeden plik -> manifest + piętra
+    python floor_shards.py join [gps_paths.json]    # manifest + piętra -> jeden plik
+"""
+import copy
+import json
+import os
+import re
+import sys
+from collections.abc import MutableMapping
+from typing import Dict
+
+
+def shard_directory(map_filename: str) -> str:
+    """Katalog z plikami pięter obok pliku mapy"""
+    base, _ = os.path.splitext(map_filename)
+    return base + ".floors"
+
+
+def is_sharded(map_filename: str) -> bool:
+    """Czy mapa jest zapisana jako manifest + pliki pięter"""
+    return os.path.isdir(shard_directory(map_filename))
+
+
+def _dump(floor: dict) -> str:
+    return json.dumps(floor, indent=2, ensure_ascii=False)
+
+
+def _write_atomic(filename: str, text: str):
+    tmp = filename + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+class LazyFloors(MutableMapping):
+    """Słownik pięter wczytujący plik piętra przy pierwszym dostępie"""
+
+    def __init__(self, directory: str, files: Dict[str, str]):
+        self.directory = directory
+        self.files = dict(files)  # Piętro -> nazwa pliku (w kolejności manifestu)
+        self.loaded: Dict[str, dict] = {}
+        self.texts: Dict[str, str] = {}  # Zawartość pliku przy wczytaniu (do wykrycia zmian)
+
+    def __getitem__(self, floor_id):
+        floor_id = str(floor_id)
+        floor = self.loaded.get(floor_id)
+        if floor is None:
+            if floor_id not in self.files:
+                raise KeyError(floor_id)
+            with open(os.path.join(self.directory, self.files[floor_id]), 'r', encoding='utf-8') as f:
+                text = f.read()
+            floor = json.loads(text)
+            self.loaded[floor_id] = floor
+            self.texts[floor_id] = text
+        return floor
+
+    def __setitem__(self, floor_id, floor: dict):
+        floor_id = str(floor_id)
+        self.files.setdefault(floor_id, None)
+        self.loaded[floor_id] = floor
+
+    def __delitem__(self, floor_id):
+        floor_id = str(floor_id)
+        del self.files[floor_id]
+        self.loaded.pop(floor_id, None)
+        self.texts.pop(floor_id, None)
+
+    def __contains__(self, floor_id) -> bool:
+        return str(floor_id) in self.files  # Bez wczytywania piętra
+
+    def __iter__(self):
+        return iter(list(self.files))
+
+    def __len__(self):
+        return len(self.files)
+
+    def __repr__(self):
+        return f"LazyFloors({list(self.files)}, wczytane: {list(self.loaded)})"
+
+    def __deepcopy__(self, memo):
+        # Kopia ma własne dane wszystkich pięter - stare pliki pięter są usuwane po zapisie
+        clone = LazyFloors(self.directory, self.files)
+        clone.loaded = {floor_id: copy.deepcopy(self[floor_id], memo) for floor_id in self.files}
+        clone.texts = dict(self.texts)
+        return clone
+
+
+def open_sharded(map_filename: str, manifest: dict) -> dict:
+    """Dane mapy z manifestu; piętra jako LazyFloors"""
+    data = {k: v for k, v in manifest.items() if k != 'floor_files'}
+    data['floors'] = LazyFloors(shard_directory(map_filename), manifest.get('floor_files', {}))
+    return data
+
+
+def _floor_filename(floor_id: str, generation: int) -> str:
+    safe = re.sub(r'[^0-9A-Za-z_-]', '_', floor_id)
+    return f"{safe}.g{generation}.json"
+
+
+def write_sharded(map_filename: str, data: dict, generation: int) -> int:
+    """Zapisuje manifest i zmienione piętra; zwraca liczbę zapisanych plików pięter"""
+    directory = shard_directory(map_filename)
+    os.makedirs(directory, exist_ok=True)
+    floors = data['floors']
+    lazy = floors if isinstance(floors, LazyFloors) else None
+
+    old_files = set()
+    if os.path.exists(map_filename):
+        try:
+            with open(map_filename, 'r', encoding='utf-8') as f:
+                old_files = set(json.load(f).get('floor_files', {}).values())
+        except (OSError, ValueError):
+            pass
+
+    files = {}
+    written = 0
+    for floor_id in floors:
+        if lazy is not None and floor_id not in lazy.loaded and lazy.files.get(floor_id):
+            files[floor_id] = lazy.files[floor_id]  # Nie wczytane - nie zmienione
+            continue
+        floor = floors[floor_id]
+        text = _dump(floor)
+        current = lazy.files.get(floor_id) if lazy is not None else None
+        if current and lazy.texts.get(floor_id) == text \
+                and os.path.exists(os.path.join(directory, current)):
+            files[floor_id] = current
+            continue
+        name = _floor_filename(floor_id, generation)
+        _write_atomic(os.path.join(directory, name), text)
+        files[floor_id] = name
+        written += 1
+        if lazy is not None:
+            lazy.texts[floor_id] = text
+
+    manifest = {k: v for k, v in data.items() if k != 'floors'}
+    manifest['floor_files'] = files
+    _write_atomic(map_filename, json.dumps(manifest, indent=2, ensure_ascii=False))
+    if lazy is not None:
+        lazy.files = dict(files)
+
+    # Pliki pięter, na które nie wskazuje już manifest
+    for name in old_files - set(files.values()):
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    return written
+
+
+def main():
+    # Import na miejscu: map_store korzysta z tego modułu
+    from map_store import MapStore, read_map
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('split', 'join'):
+        print(__doc__)
+        return
+    filename = sys.argv[2] if len(sys.argv) > 2 else "gps_paths.json"
+    data = read_map(filename)
+    if 'floors' not in data:
+        print(f"✗ {filename}: stary format jednopiętrowy - najpierw zapisz go w Map Manager")
+        return
+    floors = {floor_id: data['floors'][floor_id] for floor_id in data['floors']}
+    data['floors'] = floors
+    directory = shard_directory(filename)
+
+    if sys.argv[1] == 'split':
+        os.makedirs(directory, exist_ok=True)
+        MapStore(filename).write_snapshot(data)
+        print(f"✓ {filename}: manifest + {len(floors)} plików pięter w {directory}")
+    else:
+        # Katalog pięter usuwamy dopiero po zapisaniu pełnego pliku
+        retired = directory + ".old"
+        if os.path.isdir(directory):
+            os.replace(directory, retired)
+        MapStore(filename).write_snapshot(data)
+        if os.path.isdir(retired):
+            for name in os.listdir(retired):
+                os.remove(os.path.join(retired, name))
+            os.rmdir(retired)
+        print(f"✓ {filename}: jeden plik ({len(floors)} pięter)")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,21 @@ from tkinter import ttk, filedialog, messagebox
 import networkx as nx
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import heapq
 import json
 import os
 from typing import Dict, List, Tuple
 
+from compiled_map import load_building_data, load_compiled
+from map_store import map_exists
+from routing import CompiledGraph, RoutingEngine, split_node
+
 class GraphPathFinderGUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Znajdowanie najkrótszej ścieżki - Multi-Floor GPS Path Finder")
-        self.root.geometry("1200x800")
+    def __init__(self, root, shell=None):
+        self.root = root  # Okno albo karta powłoki (app_shell.py)
+        self.shell = shell  # Powłoka ze wspólną sesją mapy (None = osobne okno)
+        if shell is None:
+            self.root.title("Znajdowanie najkrótszej ścieżki - Multi-Floor GPS Path Finder")
+            self.root.geometry("1200x800")
         
         # Multi-floor support
         self.floors = {}  # Dane wszystkich pięter
@@ -20,6 +25,14 @@ class GraphPathFinderGUI:
         self.building_info = {}
         self.current_floor = "0"  # Piętro wyświetlane na wizualizacji
         
+        # Skompilowany graf i silnik tras (routing.py)
+        self.compiled_graph = None
+        self.compiled_map = None  # Skompilowana mapa (mmap), gdy jest aktualna
+        self.router = None
+        self.map_filename = None
+        self.map_session = None  # Wspólna sesja mapy powłoki (model + graf tras)
+        self.graph_version = None  # Wersja modelu, z której zbudowano graf
+        
         # Legacy - dla pojedynczego piętra
         self.graph = {}
         self.positions = {}
@@ -86,6 +99,15 @@ class GraphPathFinderGUI:
         
         tk.Frame(top_frame, width=2, bg='gray').pack(side=tk.LEFT, fill=tk.Y, padx=10)
         
+        # Wybór algorytmu wyznaczania trasy
+        tk.Label(top_frame, text="Algorytm:", bg='#f0f0f0',
+                font=('Arial', 9)).pack(side=tk.LEFT, padx=2)
+        self.method_var = tk.StringVar(value=RoutingEngine.METHODS['dijkstra'])
+        self.method_combo = ttk.Combobox(top_frame, textvariable=self.method_var,
+                                         values=list(RoutingEngine.METHODS.values()),
+                                         width=10, state='readonly')
+        self.method_combo.pack(side=tk.LEFT, padx=5)
+        
         # Przycisk znajdź ścieżkę
         self.find_btn = tk.Button(top_frame, text="🔍 Znajdź najkrótszą ścieżkę",
                                  command=self.find_shortest_path,
@@ -136,19 +158,27 @@ class GraphPathFinderGUI:
     
     def load_graph(self):
         """Wczytuje graf z pliku JSON (obsługa multi-floor)"""
-        # Sprawdź czy istnieje plik testowy, jeśli nie - użyj standardowego
-        if os.path.exists("test_multifloor.json"):
+        # Mapa powłoki; poza nią plik testowy (jeśli istnieje) albo standardowy
+        if self.shell is not None:
+            filename = self.shell.map_filename
+        elif os.path.exists("test_multifloor.json"):
             filename = "test_multifloor.json"
         else:
             filename = "gps_paths.json"
         
-        if not os.path.exists(filename):
+        if not map_exists(filename):  # JSON albo baza gps_paths.db
             messagebox.showerror("Błąd", f"Nie znaleziono pliku {filename}!\nUtwórz mapę w Map Maker.")
             return False
             
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            if self.shell is not None:
+                # Ten sam model i graf tras co w pozostałych narzędziach powłoki
+                self.map_session = self.shell.open_session()
+                self.compiled_map = None
+                data = self.map_session.model.data
+            else:
+                self.compiled_map = load_compiled(filename)
+                data = self.compiled_map.building() if self.compiled_map else load_building_data(filename)
             
             # Sprawdź czy to nowy format wielopiętrowy
             if 'floors' in data and 'building_info' in data:
@@ -156,6 +186,7 @@ class GraphPathFinderGUI:
                 self.floors = data.get('floors', {})
                 self.floor_transitions = data.get('floor_transitions', [])
                 self.building_info = data.get('building_info', {})
+                self.map_filename = filename
                 
                 # Zbuduj jeden wielki graf zawierający wszystkie piętra
                 self.build_multifloor_graph()
@@ -327,54 +358,48 @@ class GraphPathFinderGUI:
     
     def build_multifloor_graph(self):
         """Buduje jeden wielki graf zawierający wszystkie piętra + przejścia"""
-        self.graph = {}
+        # Skompiluj graf raz - zapytania działają na tablicach CSR
+        # (z aktualnej skompilowanej mapy graf jest gotowy, bez kompilacji)
+        if self.map_session is not None:
+            # Graf sesji jest aktualizowany zmianami z innych narzędzi
+            self.router = self.map_session.routing.engine()
+            self.compiled_graph = self.router.graph
+            self.graph_version = self.map_session.model.version
+        else:
+            if self.compiled_map is not None:
+                self.compiled_graph = self.compiled_map.graph()
+            else:
+                self.compiled_graph = CompiledGraph.compile(self.floors, self.floor_transitions)
+            self.router = RoutingEngine(self.compiled_graph, self.map_filename)
+        
+        # Słownik sąsiedztwa i współrzędne na potrzeby wizualizacji/eksportu
+        self.graph = self.compiled_graph.adjacency()
+        self.point_coords = self.compiled_graph.point_coords()
         self.positions = {}
-        self.point_coords = {}
         
-        # Dodaj wszystkie piętra
-        for floor_id, floor_data in self.floors.items():
-            # Zbierz punkty
-            all_points = {}
-            for path in floor_data.get('paths', []):
-                # Obsługa nowego formatu: path ma 'points'
-                if isinstance(path, dict) and 'points' in path:
-                    for point in path['points']:
-                        if isinstance(point, dict) and 'id' in point:
-                            point_id = str(point['id'])
-                            x = point.get('x', 0)
-                            y = point.get('y', 0)
-                            if x != 0 or y != 0:
-                                all_points[point_id] = (x, y)
-                                # Dodaj prefiks piętra dla unikalności
-                                full_id = f"{floor_id}_{point_id}"
-                                self.point_coords[full_id] = (x, y)
-                # Obsługa starego formatu: path to lista współrzędnych
-                elif isinstance(path, list):
-                    pass  # Pomiń stary format
-            
-            # Dodaj połączenia na tym piętrze
-            for conn in floor_data.get('connections', []):
-                node1 = f"{floor_id}_{conn['from']}"
-                node2 = f"{floor_id}_{conn['to']}"
-                dist = conn['distance']
-                self.add_edge(node1, node2, dist)
-            
-            # Pozycje dla wizualizacji
-            max_y = max(y for x, y in all_points.values()) if all_points else 700
-            for point_id, (x, y) in all_points.items():
-                full_id = f"{floor_id}_{point_id}"
-                self.positions[full_id] = (x, max_y - y)
-        
-        # Dodaj przejścia między piętrami
-        for transition in self.floor_transitions:
-            from_floor = transition['from_floor']
-            to_floor = transition['to_floor']
-            from_point = f"{from_floor}_{transition['from_point']}"
-            to_point = f"{to_floor}_{transition['to_point']}"
-            travel_time = transition.get('travel_time', 30)
-            
-            # Dodaj krawędź między piętrami
-            self.add_edge(from_point, to_point, travel_time)
+        # Pozycje dla wizualizacji (oś Y odwrócona osobno dla każdego piętra)
+        floor_points = {}
+        for node, (x, y) in self.point_coords.items():
+            floor_points.setdefault(split_node(node)[0], []).append((node, x, y))
+        for points in floor_points.values():
+            max_y = max(y for _, _, y in points)
+            for node, x, y in points:
+                self.positions[node] = (x, max_y - y)
+    
+    def refresh_from_model(self):
+        """Przebudowuje graf po zmianach mapy w innym narzędziu powłoki"""
+        if self.map_session is None or self.graph_version == self.map_session.model.version:
+            return
+        self.build_multifloor_graph()
+        floor_list = list(self.floors.keys())
+        self.start_floor_combo['values'] = floor_list
+        self.end_floor_combo['values'] = floor_list
+        
+        # Trasa przez usunięte punkty jest nieaktualna
+        if self.shortest_path and any(node not in self.compiled_graph.index for node in self.shortest_path):
+            self.shortest_path = None
+            self.export_btn['state'] = 'disabled'
+        self.visualize_graph()
     
     def update_point_lists(self):
         """Aktualizuje listy punktów w comboboxach"""
@@ -392,16 +417,6 @@ class GraphPathFinderGUI:
             self.start_var.set(nodes[0])
             self.end_var.set(nodes[-1] if len(nodes) > 1 else nodes[0])
     
-    def add_edge(self, node1: str, node2: str, weight: float):
-        """Dodaje krawędź między dwoma węzłami"""
-        if node1 not in self.graph:
-            self.graph[node1] = []
-        if node2 not in self.graph:
-            self.graph[node2] = []
-        
-        self.graph[node1].append((node2, weight))
-        self.graph[node2].append((node1, weight))
-    
     def find_shortest_path(self):
         """Znajduje najkrótszą ścieżkę między wybranymi punktami (multi-floor)"""
         start = self.start_var.get()
@@ -423,8 +438,9 @@ class GraphPathFinderGUI:
                                   "Punkt startowy i końcowy są takie same!")
             return
         
-        # Znajdź ścieżkę
-        path, distance = self.dijkstra(start_node, end_node)
+        # Znajdź ścieżkę wybranym algorytmem (na grafie z ostatnimi zmianami mapy)
+        self.refresh_from_model()
+        path, distance = self.router.route(start_node, end_node, method=self.get_route_method())
         
         if path:
             self.shortest_path = path
@@ -443,6 +459,7 @@ class GraphPathFinderGUI:
                         f"Kroki: {len(path) - 1}")
             if floor_changes:
                 info_text += f" | Zmian pięter: {len(floor_changes)}"
+            info_text += f" | {self.method_var.get()}: {self.router.stats.get('settled', 0)} węzłów"
             self.info_label['text'] = info_text
             
             # Pokaż wizualizację ze ścieżką
@@ -466,36 +483,17 @@ class GraphPathFinderGUI:
                                f"a {end} (piętro {end_floor})!\n"
                                "Sprawdź czy punkty są połączone lub istnieją przejścia między piętrami.")
     
+    def get_route_method(self) -> str:
+        """Zwraca klucz metody wybranej w comboboxie (np. 'astar')"""
+        selected = self.method_var.get()
+        for method, name in RoutingEngine.METHODS.items():
+            if name == selected:
+                return method
+        return 'dijkstra'
+    
     def dijkstra(self, start: str, end: str) -> Tuple[List[str], float]:
-        """Algorytm Dijkstry do znajdowania najkrótszej ścieżki"""
-        if start not in self.graph or end not in self.graph:
-            return None, float('inf')
-        
-        # Kolejka priorytetowa: (dystans, węzeł, ścieżka)
-        pq = [(0, start, [start])]
-        visited = set()
-        distances = {node: float('inf') for node in self.graph}
-        distances[start] = 0
-        
-        while pq:
-            current_dist, current_node, path = heapq.heappop(pq)
-            
-            if current_node in visited:
-                continue
-            
-            visited.add(current_node)
-            
-            if current_node == end:
-                return path, current_dist
-            
-            for neighbor, weight in self.graph[current_node]:
-                distance = current_dist + weight
-                
-                if distance < distances[neighbor]:
-                    distances[neighbor] = distance
-                    heapq.heappush(pq, (distance, neighbor, path + [neighbor]))
-        
-        return None, float('inf')
+        """Najkrótsza ścieżka - deleguje do silnika tras (routing.py)"""
+        return self.router.route(start, end)
     
     def analyze_floor_transitions(self, path: List[str]) -> List[str]:
         """Analizuje ścieżkę i znajduje przejścia między piętrami"""
@@ -529,23 +527,7 @@ class GraphPathFinderGUI:
     
     def find_transition_info(self, from_node: str, to_node: str) -> dict:
         """Znajduje informacje o przejściu między węzłami"""
-        from_floor, from_point = from_node.split('_')
-        to_floor, to_point = to_node.split('_')
-        
-        for transition in self.floor_transitions:
-            # Sprawdź czy to nasze przejście (w obu kierunkach)
-            if (transition['from_floor'] == from_floor and 
-                transition['to_floor'] == to_floor and
-                str(transition['from_point']) == from_point and
-                str(transition['to_point']) == to_point):
-                return transition
-            elif (transition['from_floor'] == to_floor and 
-                  transition['to_floor'] == from_floor and
-                  str(transition['from_point']) == to_point and
-                  str(transition['to_point']) == from_point):
-                return transition
-        
-        return None
+        return self.router.find_transition_info(from_node, to_node)
     
     def format_path_with_floors(self, path: List[str]) -> str:
         """Formatuje ścieżkę z informacjami o piętrach"""
@@ -630,11 +612,7 @@ class GraphPathFinderGUI:
             floor_to, point_to = node_to.split('_')
             
             # Znajdź wagę krawędzi
-            segment_distance = 0
-            for neighbor, weight in self.graph[node_from]:
-                if neighbor == node_to:
-                    segment_distance = weight
-                    break
+            segment_distance = self.router.edge_weight(node_from, node_to)
             
             segment = {
                 "from": node_from,
@@ -858,6 +836,10 @@ class GraphPathFinderGUI:
     
     def return_to_menu(self):
         """Zamyka aplikację i wraca do menu głównego"""
+        if self.shell is not None:
+            self.shell.show_menu()  # W powłoce narzędzie zostaje otwarte w swojej karcie
+            return
+        
         from tkinter import messagebox
         import subprocess
         import sys
@@ -0,0 +1,447 @@
+"""Mapa w bazie SQLite (gps_paths.db) z indeksem przestrzennym R*Tree.
+
+Alternatywny zapis mapy dla dużych wdrożeń: punkty, ścieżki, połączenia,
+etykiety i przejścia są wierszami tabel, a zmiany z Map Managera / Navigatora
+(operacje dziennika z map_store.py) są wykonywane jako aktualizacje wierszy w
+jednej transakcji - bez przepisywania całej mapy. Tabela points_rtree
+(moduł R*Tree wbudowany w SQLite) indeksuje punkty po (x, y, piętro), więc
+zapytania o prostokąt widoku, najbliższy punkt i lasso nie przeglądają
+wszystkich punktów.
+
+MapStore (map_store.py) używa bazy automatycznie, gdy obok mapy istnieje plik
+.db - aplikacje dalej wczytują i zapisują "gps_paths.json".
+
+Użycie:
+    python map_db.py import [gps_paths.json]   # JSON -> gps_paths.db
+    python map_db.py export [gps_paths.json]   # gps_paths.db -> JSON
+    python map_db.py status [gps_paths.json]
+"""
+import json
+import math
+import sqlite3
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from map_store import FLOOR_KEYS, MapStore, database_filename
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS floors (
+    key INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    position INTEGER NOT NULL,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS paths (
+    key INTEGER PRIMARY KEY,
+    floor INTEGER NOT NULL REFERENCES floors(key),
+    path_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS paths_floor ON paths(floor, position);
+CREATE INDEX IF NOT EXISTS paths_id ON paths(floor, path_id);
+CREATE TABLE IF NOT EXISTS points (
+    key INTEGER PRIMARY KEY,
+    path INTEGER NOT NULL REFERENCES paths(key),
+    seq INTEGER NOT NULL,
+    floor INTEGER NOT NULL,
+    node TEXT NOT NULL,
+    id,
+    x,
+    y,
+    record TEXT
+);
+CREATE INDEX IF NOT EXISTS points_path ON points(path, seq);
+CREATE INDEX IF NOT EXISTS points_node ON points(floor, node);
+CREATE VIRTUAL TABLE IF NOT EXISTS points_rtree USING rtree(
+    key, min_x, max_x, min_y, max_y, min_floor, max_floor
+);
+CREATE TABLE IF NOT EXISTS connections (
+    key INTEGER PRIMARY KEY,
+    floor INTEGER NOT NULL,
+    node_from TEXT NOT NULL,
+    node_to TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS connections_from ON connections(floor, node_from);
+CREATE INDEX IF NOT EXISTS connections_to ON connections(floor, node_to);
+CREATE TABLE IF NOT EXISTS labels (
+    key INTEGER PRIMARY KEY,
+    floor INTEGER NOT NULL,
+    node TEXT NOT NULL,
+    label TEXT NOT NULL,
+    UNIQUE(floor, node)
+);
+CREATE TABLE IF NOT EXISTS transitions (
+    key INTEGER PRIMARY KEY,
+    record TEXT NOT NULL
+);
+"""
+
+POINT_KEYS = ('id', 'x', 'y')
+FLOOR_EXTENT = 0.25  # Połowa szerokości piętra w trzecim wymiarze R*Tree
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _point_in_polygon(x: float, y: float, polygon: List[Tuple[float, float]]) -> bool:
+    """Ray casting - ta sama reguła co MapManager._point_in_polygon"""
+    n = len(polygon)
+    inside = False
+    p1x, p1y = polygon[0]
+    for i in range(1, n + 1):
+        p2x, p2y = polygon[i % n]
+        if min(p1y, p2y) < y <= max(p1y, p2y) and x <= max(p1x, p2x):
+            if p1x == p2x:
+                inside = not inside
+            elif p1y != p2y and x <= (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x:
+                inside = not inside
+        p1x, p1y = p2x, p2y
+    return inside
+
+
+class MapDatabase:
+    """Mapa w SQLite: wczytanie, operacje dziennika jako transakcje, zapytania R*Tree"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        try:
+            self.db.executescript(SCHEMA)
+        except sqlite3.OperationalError as e:
+            self.db.close()
+            raise RuntimeError(f"SQLite bez modułu R*Tree ({e}) - użyj mapy JSON") from e
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key: str, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key: str, value):
+        self.db.execute("INSERT INTO meta(key, value) VALUES (?, ?)"
+                        " ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, _dumps(value)))
+
+    def is_empty(self) -> bool:
+        return self._meta('format') is None
+
+    # --- Zapis ---
+
+    def _floor_key(self, floor_id, create: bool = True) -> Optional[int]:
+        floor_id = str(floor_id)
+        row = self.db.execute("SELECT key FROM floors WHERE id = ?", (floor_id,)).fetchone()
+        if row:
+            return row[0]
+        if self._meta('format') == 'single' and floor_id != "0":
+            raise ValueError(f"brak piętra {floor_id} w mapie starego formatu")
+        if not create:
+            return None
+        position = self.db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM floors").fetchone()[0]
+        return self.db.execute("INSERT INTO floors(id, position) VALUES (?, ?)",
+                               (floor_id, position)).lastrowid
+
+    def _insert_points(self, floor: int, path_key: int, points: list, first_seq: int = 0):
+        for seq, point in enumerate(points, first_seq):
+            regular = set(point) == set(POINT_KEYS)
+            key = self.db.execute(
+                "INSERT INTO points(path, seq, floor, node, id, x, y, record) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path_key, seq, floor, str(point.get('id')), point.get('id'),
+                 point.get('x'), point.get('y'), None if regular else _dumps(point))).lastrowid
+            x, y = point.get('x'), point.get('y')
+            if isinstance(x, (int, float)) and isinstance(y, (int, float)):
+                # Piętro jako przedział o niezerowej szerokości: przy zerowej objętości
+                # prostokątów heurystyki R* budują bardzo słabe drzewo
+                self.db.execute("INSERT INTO points_rtree VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (key, x, x, y, y, floor - FLOOR_EXTENT, floor + FLOOR_EXTENT))
+
+    def _insert_path(self, floor: int, path: dict, position: Optional[int] = None):
+        if position is None:
+            position = self.db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM paths WHERE floor = ?",
+                                       (floor,)).fetchone()[0]
+        record = {k: v for k, v in path.items() if k != 'points'}
+        path_key = self.db.execute(
+            "INSERT INTO paths(floor, path_id, position, record) VALUES (?, ?, ?, ?)",
+            (floor, str(path.get('id')), position, _dumps(record))).lastrowid
+        self._insert_points(floor, path_key, path.get('points', []))
+
+    def _delete_points(self, where: str, params: tuple):
+        self.db.execute(f"DELETE FROM points_rtree WHERE key IN (SELECT key FROM points WHERE {where})", params)
+        self.db.execute(f"DELETE FROM points WHERE {where}", params)
+
+    def _delete_path(self, path_key: int):
+        self._delete_points("path = ?", (path_key,))
+        self.db.execute("DELETE FROM paths WHERE key = ?", (path_key,))
+
+    def _add_connection(self, floor: int, connection: dict):
+        self.db.execute("INSERT INTO connections(floor, node_from, node_to, record) VALUES (?, ?, ?, ?)",
+                        (floor, str(connection.get('from')), str(connection.get('to')), _dumps(connection)))
+
+    def _set_label(self, floor: int, node: str, label: Optional[str]):
+        if label is None:
+            self.db.execute("DELETE FROM labels WHERE floor = ? AND node = ?", (floor, node))
+        else:
+            # ON CONFLICT zachowuje kolejność etykiet (jak aktualizacja klucza w dict)
+            self.db.execute("INSERT INTO labels(floor, node, label) VALUES (?, ?, ?)"
+                            " ON CONFLICT(floor, node) DO UPDATE SET label = excluded.label",
+                            (floor, node, label))
+
+    def _delete_floor(self, floor: int):
+        self._delete_points("floor = ?", (floor,))
+        for table in ('paths', 'connections', 'labels'):
+            self.db.execute(f"DELETE FROM {table} WHERE floor = ?", (floor,))
+
+    def _write_floor(self, floor: int, data: dict):
+        extra = {k: v for k, v in data.items() if k not in FLOOR_KEYS}
+        self.db.execute("UPDATE floors SET extra = ? WHERE key = ?", (_dumps(extra) if extra else None, floor))
+        for position, path in enumerate(data.get('paths', [])):
+            self._insert_path(floor, path, position)
+        for connection in data.get('connections', []):
+            self._add_connection(floor, connection)
+        for node, label in data.get('point_labels', {}).items():
+            self._set_label(floor, str(node), label)
+
+    def _transitions(self) -> List[Tuple[int, dict]]:
+        return [(key, json.loads(record)) for key, record in
+                self.db.execute("SELECT key, record FROM transitions ORDER BY key")]
+
+    def replace(self, data: dict):
+        """Zastępuje całą mapę (jedna transakcja)"""
+        with self.db:
+            for table in ('points_rtree', 'points', 'paths', 'connections', 'labels',
+                          'transitions', 'floors', 'meta'):
+                self.db.execute(f"DELETE FROM {table}")
+            if 'floors' in data:
+                self._set_meta('format', 'multi')
+                floors = data['floors']
+                for floor_id in floors:
+                    self._write_floor(self._floor_key(floor_id), floors[floor_id])
+                rest = {k: v for k, v in data.items() if k not in ('floors', 'floor_transitions')}
+            else:
+                self._set_meta('format', 'single')
+                self._write_floor(self._floor_key("0"), {k: data[k] for k in FLOOR_KEYS if k in data})
+                rest = {k: v for k, v in data.items() if k not in FLOOR_KEYS and k != 'floor_transitions'}
+            self._set_meta('rest', rest)
+            if 'floor_transitions' in data:
+                self._set_meta('has_transitions', True)
+            for transition in data.get('floor_transitions', []):
+                self.db.execute("INSERT INTO transitions(record) VALUES (?)", (_dumps(transition),))
+
+    def apply(self, ops: List[dict]):
+        """Wykonuje operacje dziennika (map_store.apply_op) jako jedną transakcję"""
+        with self.db:
+            for op in ops:
+                self._apply(op)
+
+    def _apply(self, op: dict):
+        kind = op['op']
+        db = self.db
+
+        if kind == 'add_transition':
+            self._set_meta('has_transitions', True)
+            db.execute("INSERT INTO transitions(record) VALUES (?)", (_dumps(op['transition']),))
+            return
+        if kind == 'delete_transition':
+            for key, transition in self._transitions():
+                if transition == op['transition']:
+                    db.execute("DELETE FROM transitions WHERE key = ?", (key,))
+                    break
+            return
+        if kind == 'set_building_info':
+            rest = self._meta('rest', {})
+            rest['building_info'] = op['building_info']
+            self._set_meta('rest', rest)
+            return
+        if kind == 'set_floor':
+            floor = self._floor_key(op['floor'], create=op['data'] is not None)
+            if floor is None:
+                return
+            self._delete_floor(floor)
+            if op['data'] is None:
+                db.execute("DELETE FROM floors WHERE key = ?", (floor,))
+            else:
+                self._write_floor(floor, op['data'])
+            return
+
+        floor = self._floor_key(op['floor'])
+        if kind == 'add_path':
+            self._insert_path(floor, op['path'])
+        elif kind == 'set_path':
+            row = db.execute("SELECT key, position FROM paths WHERE floor = ? AND path_id = ?"
+                             " ORDER BY position LIMIT 1", (floor, str(op['path'].get('id')))).fetchone()
+            if row:
+                self._delete_path(row[0])
+                self._insert_path(floor, op['path'], row[1])
+            else:
+                self._insert_path(floor, op['path'])
+        elif kind == 'delete_path':
+            for (path_key,) in db.execute("SELECT key FROM paths WHERE floor = ? AND path_id = ?",
+                                          (floor, str(op['path_id']))).fetchall():
+                self._delete_path(path_key)
+        elif kind == 'add_point':
+            row = db.execute("SELECT key FROM paths WHERE floor = ? AND path_id = ? ORDER BY position LIMIT 1",
+                             (floor, str(op['path_id']))).fetchone()
+            if row is None:
+                raise ValueError(f"brak ścieżki {op['path_id']} na piętrze {op['floor']}")
+            seq = db.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM points WHERE path = ?",
+                             (row[0],)).fetchone()[0]
+            self._insert_points(floor, row[0], [op['point']], seq)
+        elif kind == 'delete_node':
+            node = str(op['point_id'])
+            self._delete_points("floor = ? AND node = ?", (floor, node))
+            db.execute("DELETE FROM connections WHERE floor = ? AND (node_from = ? OR node_to = ?)",
+                       (floor, node, node))
+            self._set_label(floor, node, None)
+            floor_id = str(op['floor'])
+            for key, t in self._transitions():
+                if (str(t.get('from_floor')) == floor_id and str(t.get('from_point')) == node) or \
+                        (str(t.get('to_floor')) == floor_id and str(t.get('to_point')) == node):
+                    db.execute("DELETE FROM transitions WHERE key = ?", (key,))
+        elif kind == 'add_connection':
+            self._add_connection(floor, op['connection'])
+        elif kind == 'delete_connection':
+            connection = op['connection']
+            for key, record in db.execute(
+                    "SELECT key, record FROM connections WHERE floor = ? AND node_from = ? AND node_to = ?"
+                    " ORDER BY key", (floor, str(connection.get('from')), str(connection.get('to')))).fetchall():
+                if json.loads(record) == connection:
+                    db.execute("DELETE FROM connections WHERE key = ?", (key,))
+                    break
+        elif kind == 'set_label':
+            self._set_label(floor, str(op['point_id']), op['label'])
+        else:
+            raise ValueError(f"nieznana operacja dziennika: {kind}")
+
+    # --- Odczyt ---
+
+    def load(self) -> dict:
+        """Mapa w strukturze gps_paths.json"""
+        fmt = self._meta('format')
+        if fmt is None:
+            raise ValueError(f"pusta baza mapy: {self.filename}")
+
+        floors: Dict[int, dict] = {}
+        floor_ids = {}
+        for key, floor_id, extra in self.db.execute("SELECT key, id, extra FROM floors ORDER BY position"):
+            floor = {'paths': [], 'connections': [], 'point_labels': {}}
+            if extra:
+                floor.update(json.loads(extra))
+            floors[key] = floor
+            floor_ids[key] = floor_id
+
+        paths = {}
+        for key, floor, record in self.db.execute("SELECT key, floor, record FROM paths ORDER BY floor, position"):
+            path = json.loads(record)
+            path['points'] = []
+            floors[floor]['paths'].append(path)
+            paths[key] = path['points']
+        for path, point_id, x, y, record in self.db.execute(
+                "SELECT path, id, x, y, record FROM points ORDER BY path, seq"):
+            paths[path].append(json.loads(record) if record else {'id': point_id, 'x': x, 'y': y})
+        for floor, record in self.db.execute("SELECT floor, record FROM connections ORDER BY key"):
+            floors[floor]['connections'].append(json.loads(record))
+        for floor, node, label in self.db.execute("SELECT floor, node, label FROM labels ORDER BY key"):
+            floors[floor]['point_labels'][node] = label
+
+        data = self._meta('rest', {})
+        if fmt == 'single':
+            data.update(next(iter(floors.values()), {'paths': [], 'connections': [], 'point_labels': {}}))
+        else:
+            data['floors'] = {floor_ids[key]: floor for key, floor in floors.items()}
+        if self._meta('has_transitions'):
+            data['floor_transitions'] = [t for _, t in self._transitions()]
+        return data
+
+    def _rect_rows(self, floor_id, x0: float, y0: float, x1: float, y1: float):
+        floor = self._floor_key(floor_id, create=False)
+        if floor is None:
+            return []
+        # R*Tree trzyma współrzędne jako float32 - margines, dokładny test na wartościach z tabeli
+        pad = 1e-3 * max(1.0, abs(x0), abs(x1), abs(y0), abs(y1))
+        return self.db.execute(
+            "SELECT p.id, p.x, p.y FROM points_rtree r JOIN points p ON p.key = r.key"
+            " WHERE r.min_x <= ? AND r.max_x >= ? AND r.min_y <= ? AND r.max_y >= ?"
+            " AND r.min_floor <= ? AND r.max_floor >= ?",
+            (max(x0, x1) + pad, min(x0, x1) - pad, max(y0, y1) + pad, min(y0, y1) - pad,
+             floor, floor)).fetchall()
+
+    def points_in_rect(self, floor_id, x0: float, y0: float, x1: float, y1: float) -> List[dict]:
+        """Punkty piętra w prostokącie (np. widok canvas): [{'id', 'x', 'y'}]"""
+        lo_x, hi_x, lo_y, hi_y = min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1)
+        return [{'id': point_id, 'x': x, 'y': y} for point_id, x, y in self._rect_rows(floor_id, x0, y0, x1, y1)
+                if lo_x <= x <= hi_x and lo_y <= y <= hi_y]
+
+    def points_in_polygon(self, floor_id, polygon: List[Tuple[float, float]]) -> List[dict]:
+        """Punkty piętra wewnątrz wielokąta (lasso): prostokąt z R*Tree + test ray casting"""
+        if len(polygon) < 3:
+            return []
+        xs = [x for x, _ in polygon]
+        ys = [y for _, y in polygon]
+        return [{'id': point_id, 'x': x, 'y': y}
+                for point_id, x, y in self._rect_rows(floor_id, min(xs), min(ys), max(xs), max(ys))
+                if _point_in_polygon(x, y, polygon)]
+
+    def nearest_point(self, floor_id, x: float, y: float,
+                      max_distance: float = float('inf'), start_radius: float = 50.0) -> Optional[dict]:
+        """Najbliższy punkt piętra (okno R*Tree powiększane aż znajdzie kandydata)"""
+        floor = self._floor_key(floor_id, create=False)
+        if floor is None or not self.db.execute(
+                "SELECT 1 FROM points_rtree WHERE min_floor <= ? AND max_floor >= ? LIMIT 1",
+                (floor, floor)).fetchone():
+            return None
+        radius = min(start_radius, max_distance)
+        while True:
+            best = None
+            for point_id, px, py in self._rect_rows(floor_id, x - radius, y - radius, x + radius, y + radius):
+                distance = math.hypot(px - x, py - y)
+                if distance <= radius and distance <= max_distance and (best is None or distance < best[0]):
+                    best = (distance, {'id': point_id, 'x': px, 'y': py})
+            # Punkt w odległości <= radius jest na pewno najbliższy (okno zawiera całe koło)
+            if best is not None:
+                return best[1]
+            if radius >= max_distance:
+                return None
+            radius = min(radius * 4, max_distance)
+
+    def compact(self):
+        """Odzyskuje miejsce po usuniętych wierszach"""
+        self.db.execute("VACUUM")
+
+    def status(self) -> Dict[str, int]:
+        """Liczby wierszy w tabelach"""
+        return {table: self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('floors', 'paths', 'points', 'connections', 'labels', 'transitions')}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('import', 'export', 'status'):
+        print(__doc__)
+        return
+    filename = sys.argv[2] if len(sys.argv) > 2 else "gps_paths.json"
+    db_filename = database_filename(filename)
+
+    if sys.argv[1] == 'import':
+        data = MapStore(filename, use_database=False).load()
+        database = MapDatabase(db_filename)
+        database.replace(data)
+        print(f"✓ Zaimportowano {filename} -> {db_filename} (aplikacje używają teraz bazy)")
+    elif sys.argv[1] == 'export':
+        database = MapDatabase(db_filename)
+        MapStore(filename, use_database=False).write_snapshot(database.load())
+        print(f"✓ Wyeksportowano {db_filename} -> {filename}")
+    else:
+        database = MapDatabase(db_filename)
+    for table, count in database.status().items():
+        print(f"  {table}: {count}")
+    database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,33 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-import json
-import math
+import copy
 import os
 from typing import Dict, List, Tuple, Optional
 
+from compiled_map import load_building_data
+from feedback_store import (DEFAULT_DB as FEEDBACK_DB, LEGACY_JSON, PAGE_SIZE as FEEDBACK_PAGE_SIZE,
+                            FeedbackStore)
+from map_model import (EdgeAdded, EdgeRemoved, FloorReplaced, LabelChanged, MapModel,
+                       MapSession, PointAdded, PointDeleted, PointMoved)
+from map_store import map_exists
+
+CLICK_RADIUS = 15  # Odległość kliknięcia od punktu (px), przy której punkt jest wybierany
+
 class MapManager:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Map Manager - Zarządzanie etykietami (Multi-Floor)")
-        self.root.geometry("1200x800")
+    def __init__(self, root, shell=None):
+        self.root = root  # Okno albo karta powłoki (app_shell.py)
+        self.shell = shell  # Powłoka ze wspólną sesją mapy (None = osobne okno)
+        if shell is None:
+            self.root.title("Map Manager - Zarządzanie etykietami (Multi-Floor)")
+            self.root.geometry("1200x800")
         
         # Dane - Multi-floor support
         self.map_data = None
+        self.model = None  # Model mapy ze zdarzeniami zmian (map_model.py)
         self.map_filename = None
+        self.map_session = None  # Plik mapy z dziennikiem zmian i model (map_model.py)
+        self.saved_map = None  # Stan mapy po ostatnim zapisie (None = bazą zmian jest plik)
+        self.points_moved = False  # Czy punkty przesunięto lub dodano od zapisu (baza jest nieaktualna)
         self.current_floor = "0"  # Aktywne piętro
         self.floors = {}  # Dane wszystkich pięter
         self.floor_transitions = []  # Przejścia między piętrami
@@ -27,6 +41,7 @@ class MapManager:
         # Wizualizacja
         self.selected_point = None
         self.point_objects = {}  # ID punktu -> obiekty canvas
+        self.connection_objects = {}  # ID punktu -> [(linia, koniec, drugi punkt)]
         
         # Lasso mode
         self.lasso_mode = False
@@ -163,6 +178,7 @@ class MapManager:
         self.canvas = tk.Canvas(canvas_frame, bg='#f5f5f5', cursor='hand2')
         self.canvas.pack(fill=tk.BOTH, expand=True)
         self.canvas.bind('<Button-1>', self.on_point_click)
+        self.canvas.bind('<Configure>', self.on_canvas_resize)
         
         # Sidebar (prawa strona)
         sidebar_frame = tk.Frame(main_frame, bg='#fafafa', width=300)
@@ -255,23 +271,28 @@ class MapManager:
         """Wczytuje mapę z pliku JSON"""
         filename = "gps_paths.json"
         
-        if not os.path.exists(filename):
+        if not map_exists(filename):  # JSON albo baza gps_paths.db
             messagebox.showerror("Błąd", f"Nie znaleziono pliku {filename}!\nUtwórz mapę w Map Maker.")
             return False
         
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                self.map_data = json.load(f)
+            if self.shell is not None:
+                # Wspólna sesja powłoki - wszystkie zapisy idą przez nią, więc bazą zmian jest plik
+                self.map_session = self.shell.open_session()
+                self.map_data = self.map_session.model.data
+                self.saved_map = None
+            else:
+                self.map_data = load_building_data(filename)  # Skompilowana mapa albo JSON
+                self.saved_map = copy.deepcopy(self.map_data)
+                self.map_session = MapSession(filename, data=self.map_data)
+            self.points_moved = False
+            self.set_model(self.map_session.model)
             
             self.map_filename = filename
             
             # Sprawdź czy to nowy format wielopiętrowy
             if 'floors' in self.map_data and 'building_info' in self.map_data:
                 # Nowy format - multi-floor
-                self.floors = self.map_data.get('floors', {})
-                self.floor_transitions = self.map_data.get('floor_transitions', [])
-                self.building_info = self.map_data.get('building_info', {})
-                
                 # Załaduj dane aktualnego piętra
                 self.load_floor_data(self.current_floor)
                 
@@ -292,25 +313,8 @@ class MapManager:
                                   f"Etykiety: {total_labels}\n"
                                   f"Przejścia między piętrami: {len(self.floor_transitions)}")
             else:
-                # Stary format - single floor
-                self.all_paths = self.map_data.get('paths', [])
-                self.all_connections = self.map_data.get('connections', [])
-                self.point_labels = self.map_data.get('point_labels', {})
-                
-                # Konwertuj do nowego formatu
-                self.floors = {
-                    "0": {
-                        "paths": self.all_paths,
-                        "connections": self.all_connections,
-                        "point_labels": self.point_labels
-                    }
-                }
-                self.floor_transitions = []
-                self.building_info = {
-                    "name": "Budynek",
-                    "floors": ["0"],
-                    "floor_names": {"0": "Parter"}
-                }
+                # Stary format - single floor (model trzyma go jako piętro "0")
+                self.load_floor_data("0")
                 
                 total_points = sum(len(path['points']) for path in self.all_paths)
                 labeled_points = len(self.point_labels)
@@ -335,78 +339,195 @@ class MapManager:
             messagebox.showerror("Błąd", f"Nie udało się wczytać mapy:\n{e}")
             return False
     
-    def draw_map(self):
-        """Rysuje mapę na canvas"""
-        if not self.all_paths:
+    def set_model(self, model: MapModel):
+        """Podłącza model mapy (piętra, przejścia i zdarzenia zmian)"""
+        if self.model is not None:
+            self.model.unsubscribe(self.on_map_changed)
+        self.model = model
+        self.floors = model.floors
+        self.floor_transitions = model.floor_transitions
+        self.building_info = model.building_info
+        model.subscribe(self.on_map_changed)
+    
+    def on_map_changed(self, event):
+        """Aktualizuje canvas po zmianie modelu (tylko obiekty aktualnego piętra)"""
+        if isinstance(event, (PointAdded, PointMoved)):
+            self.points_moved = True  # Pozycje w bazie mapy są nieaktualne do zapisu
+        if getattr(event, 'floor', None) != self.current_floor:
             return
-        
+        if isinstance(event, (PointMoved, LabelChanged)):
+            self.refresh_point(str(event.point_id))
+        elif isinstance(event, PointDeleted):
+            self.remove_point_items(str(event.point_id))
+        elif isinstance(event, EdgeRemoved):
+            self.remove_connection_item(event.connection)
+        elif isinstance(event, EdgeAdded):
+            self._draw_connection(event.connection)
+        elif isinstance(event, PointAdded):
+            if event.point['x'] != 0 or event.point['y'] != 0:
+                self._draw_point(event.point)
+        elif isinstance(event, FloorReplaced):
+            self.load_floor_data(self.current_floor)
+            self.draw_map()
+    
+    def draw_map(self):
+        """Rysuje całą mapę na canvas od nowa (wczytanie mapy, zmiana piętra)"""
         self.canvas.delete('all')
         self.point_objects.clear()
+        self.connection_objects.clear()
+        
+        if not self.all_paths:
+            return
         
         # Rysuj połączenia
         for connection in self.all_connections:
-            from_id = str(connection['from'])
-            to_id = str(connection['to'])
-            
-            from_point = self.find_point(from_id)
-            to_point = self.find_point(to_id)
-            
-            if from_point and to_point:
-                self.canvas.create_line(
-                    from_point['x'], from_point['y'],
-                    to_point['x'], to_point['y'],
-                    fill='#BDBDBD', width=2, tags='connection'
-                )
-        
-        # Rysuj punkty
-        for path in self.all_paths:
-            for point in path['points']:
-                if point['x'] == 0 and point['y'] == 0:
-                    continue
-                
-                point_id = str(point['id'])
-                x, y = point['x'], point['y']
-                
-                # Kolor zależny od tego czy punkt ma etykietę
-                if point_id in self.point_labels:
-                    color = '#4CAF50'  # Zielony - ma etykietę
-                    radius = 8
-                else:
-                    color = '#2196F3'  # Niebieski - brak etykiety
-                    radius = 6
-                
-                # Rysuj punkt
-                oval = self.canvas.create_oval(
-                    x - radius, y - radius,
-                    x + radius, y + radius,
-                    fill=color, outline='#1565C0', width=2,
-                    tags=('point', f'point_{point_id}')
-                )
-                
-                # Zapisz obiekt
-                self.point_objects[point_id] = {
-                    'oval': oval,
-                    'point': point,
-                    'x': x,
-                    'y': y
-                }
-                
-                # Jeśli ma etykietę, pokaż ją
-                if point_id in self.point_labels:
-                    label_text = self.point_labels[point_id]
-                    self.canvas.create_text(
-                        x, y - 15,
-                        text=label_text,
-                        font=('Arial', 8, 'bold'),
-                        fill='#1B5E20',
-                        tags=('label', f'label_{point_id}')
-                    )
+            self._draw_connection(connection)
+        
+        # Rysuj punkty (z bazy mapy tylko widoczne na canvas - zapytanie R*Tree)
+        database = self._point_database()
+        if database is not None:
+            found = database.points_in_rect(self.current_floor, 0, 0,
+                                            self.canvas.winfo_width(), self.canvas.winfo_height())
+            points = [self.find_point(point['id']) for point in found]
+        else:
+            points = [point for path in self.all_paths for point in path['points']]
+        for point in points:
+            if point is None or (point['x'] == 0 and point['y'] == 0):
+                continue  # Punkt usunięty od zapisu albo bez współrzędnych
+            self._draw_point(point)
+    
+    def _point_database(self):
+        """Baza mapy do zapytań R*Tree (None dla JSON i gdy pozycje w bazie są nieaktualne)"""
+        database = self.map_session.store.database if self.map_session else None
+        return database if database is not None and not self.points_moved else None
+    
+    def on_canvas_resize(self, event=None):
+        """Mapa z bazy rysuje tylko widoczne punkty - po zmianie rozmiaru rysuj od nowa"""
+        if self._point_database() is not None:
+            self.draw_map()
+    
+    def _point_style(self, point_id: str) -> Tuple[str, int]:
+        """Kolor i promień punktu zależne od tego czy punkt ma etykietę"""
+        if point_id in self.point_labels:
+            return '#4CAF50', 8  # Zielony - ma etykietę
+        return '#2196F3', 6  # Niebieski - brak etykiety
+    
+    def _draw_connection(self, connection):
+        """Rysuje linię połączenia i zapamiętuje ją przy obu końcach"""
+        from_id = str(connection['from'])
+        to_id = str(connection['to'])
+        
+        from_point = self.find_point(from_id)
+        to_point = self.find_point(to_id)
+        
+        if from_point and to_point:
+            line = self.canvas.create_line(
+                from_point['x'], from_point['y'],
+                to_point['x'], to_point['y'],
+                fill='#BDBDBD', width=2, tags='connection'
+            )
+            # ID punktu -> lista (linia, koniec linii 0/1, drugi punkt)
+            self.connection_objects.setdefault(from_id, []).append((line, 0, to_id))
+            self.connection_objects.setdefault(to_id, []).append((line, 1, from_id))
+    
+    def _draw_point(self, point):
+        """Rysuje punkt (i jego etykietę) i zapamiętuje obiekty canvas"""
+        point_id = str(point['id'])
+        x, y = point['x'], point['y']
+        color, radius = self._point_style(point_id)
+        
+        oval = self.canvas.create_oval(
+            x - radius, y - radius,
+            x + radius, y + radius,
+            fill=color, outline='#1565C0', width=2,
+            tags=('point', f'point_{point_id}')
+        )
+        
+        # Zapisz obiekt
+        self.point_objects[point_id] = {
+            'oval': oval,
+            'label': None,
+            'point': point,
+            'x': x,
+            'y': y
+        }
+        self._update_label_item(point_id)
+    
+    def _update_label_item(self, point_id: str):
+        """Tworzy, zmienia lub usuwa napis etykiety punktu"""
+        objects = self.point_objects[point_id]
+        label_text = self.point_labels.get(point_id)
+        
+        if label_text is None:
+            if objects['label'] is not None:
+                self.canvas.delete(objects['label'])
+                objects['label'] = None
+        elif objects['label'] is None:
+            objects['label'] = self.canvas.create_text(
+                objects['x'], objects['y'] - 15,
+                text=label_text,
+                font=('Arial', 8, 'bold'),
+                fill='#1B5E20',
+                tags=('label', f'label_{point_id}')
+            )
+        else:
+            self.canvas.itemconfig(objects['label'], text=label_text)
+    
+    def refresh_point(self, point_id: str):
+        """Aktualizuje wygląd punktu po zmianie etykiety lub pozycji"""
+        point_id = str(point_id)
+        objects = self.point_objects.get(point_id)
+        if objects is None:
+            return
+        
+        point = objects['point']
+        x, y = point['x'], point['y']
+        color, radius = self._point_style(point_id)
+        self.canvas.coords(objects['oval'], x - radius, y - radius, x + radius, y + radius)
+        self.canvas.itemconfig(objects['oval'], fill=color)
+        
+        if (x, y) != (objects['x'], objects['y']):
+            objects['x'], objects['y'] = x, y
+            if objects['label'] is not None:
+                self.canvas.coords(objects['label'], x, y - 15)
+            for line, end, _ in self.connection_objects.get(point_id, []):
+                coords = self.canvas.coords(line)
+                coords[end * 2:end * 2 + 2] = [x, y]
+                self.canvas.coords(line, *coords)
+        
+        self._update_label_item(point_id)
+    
+    def remove_point_items(self, point_id: str):
+        """Usuwa z canvas punkt, jego etykietę i połączenia"""
+        objects = self.point_objects.pop(point_id, None)
+        if objects is not None:
+            self.canvas.delete(objects['oval'])
+            if objects['label'] is not None:
+                self.canvas.delete(objects['label'])
+        
+        for line, _, other_id in self.connection_objects.pop(point_id, []):
+            self.canvas.delete(line)
+            if other_id in self.connection_objects:
+                self.connection_objects[other_id] = [
+                    entry for entry in self.connection_objects[other_id] if entry[0] != line
+                ]
+    
+    def remove_connection_item(self, connection):
+        """Usuwa z canvas linię jednego połączenia"""
+        from_id, to_id = str(connection['from']), str(connection['to'])
+        line = next((entry[0] for entry in self.connection_objects.get(from_id, [])
+                     if entry[2] == to_id), None)
+        if line is None:
+            return
+        self.canvas.delete(line)
+        for point_id in (from_id, to_id):
+            if point_id in self.connection_objects:
+                self.connection_objects[point_id] = [
+                    entry for entry in self.connection_objects[point_id] if entry[0] != line
+                ]
     
     def change_floor(self, event=None):
         """Zmienia aktywne piętro"""
-        # Zapisz dane aktualnego piętra
-        self.save_current_floor_data()
-        
         # Reset zaznaczenia i sidebara
         self.selected_point = None
         self.selected_point_label['text'] = "Brak"
@@ -429,32 +550,14 @@ class MapManager:
         floor_names = {"0": "Parter", "1": "Piętro 1", "2": "Piętro 2"}
         self.status_label['text'] = f"🏢 {floor_names.get(new_floor, new_floor)} | Kliknij na punkt aby dodać etykietę"
     
-    def save_current_floor_data(self):
-        """Zapisuje dane aktualnego piętra do struktury floors"""
-        if self.current_floor in self.floors:
-            self.floors[self.current_floor] = {
-                'paths': self.all_paths,
-                'connections': self.all_connections,
-                'point_labels': self.point_labels
-            }
-    
     def load_floor_data(self, floor):
-        """Ładuje dane wybranego piętra"""
-        if floor in self.floors:
-            floor_data = self.floors[floor]
-            self.all_paths = floor_data.get('paths', [])
-            self.all_connections = floor_data.get('connections', [])
-            self.point_labels = floor_data.get('point_labels', {})
-        else:
-            # Utwórz puste piętro
-            self.all_paths = []
-            self.all_connections = []
-            self.point_labels = {}
-            self.floors[floor] = {
-                'paths': [],
-                'connections': [],
-                'point_labels': {}
-            }
+        """Ładuje dane wybranego piętra (listy piętra w modelu, zmieniane w miejscu)"""
+        if self.model.floor(floor) is None:
+            self.model.add_floor(floor)  # Utwórz puste piętro
+        floor_data = self.model.floor(floor)
+        self.all_paths = floor_data.setdefault('paths', [])
+        self.all_connections = floor_data.setdefault('connections', [])
+        self.point_labels = floor_data.setdefault('point_labels', {})
     
     def manage_floor_transitions(self):
         """Okno zarządzania przejściami między piętrami"""
@@ -511,7 +614,7 @@ class MapManager:
             result = messagebox.askyesno("Usuwanie",
                                         f"Czy na pewno usunąć przejście:\n{trans['name']}?")
             if result:
-                self.floor_transitions.pop(idx)
+                self.model.remove_transition(idx)
                 transitions_listbox.delete(idx)
                 messagebox.showinfo("Usunięto", "Przejście zostało usunięte")
         
@@ -568,7 +671,7 @@ class MapManager:
                     "to_point": to_point_entry.get(),
                     "travel_time": 15 if transition_type.get() == "elevator" else 30
                 }
-                self.floor_transitions.append(transition)
+                self.model.add_transition(transition)
                 
                 # Dodaj do listboxa
                 icon = "🪜" if transition['type'] == 'stairs' else "🛗"
@@ -597,26 +700,25 @@ class MapManager:
                  padx=15, pady=8).pack(side=tk.RIGHT, padx=5)
     
     def find_point(self, point_id: str) -> Optional[dict]:
-        """Znajduje punkt po ID"""
-        for path in self.all_paths:
-            for point in path['points']:
-                if str(point['id']) == point_id:
-                    return point
-        return None
+        """Znajduje punkt aktualnego piętra po ID"""
+        return self.model.point(self.current_floor, point_id)
+    
+    def point_at(self, x: float, y: float) -> Optional[str]:
+        """ID punktu aktualnego piętra najbliższego (x, y) w promieniu CLICK_RADIUS"""
+        database = self._point_database()
+        if database is not None:
+            # Zapytanie R*Tree w bazie mapy; punkt usunięty od zapisu pomijamy
+            point = database.nearest_point(self.current_floor, x, y, CLICK_RADIUS)
+            if point is None or self.find_point(point['id']) is None:
+                return None
+            return str(point['id'])
+        index = self.map_session.spatial_indexes.floor(self.current_floor) if self.map_session else None
+        nearest = index.nearest(x, y, CLICK_RADIUS) if index else None
+        return str(nearest[0]) if nearest else None
     
     def on_point_click(self, event):
         """Obsługa kliknięcia na punkt"""
-        # Znajdź najbliższy punkt
-        clicked_item = self.canvas.find_closest(event.x, event.y)[0]
-        tags = self.canvas.gettags(clicked_item)
-        
-        # Sprawdź czy kliknięto na punkt
-        point_id = None
-        for tag in tags:
-            if tag.startswith('point_'):
-                point_id = tag.replace('point_', '')
-                break
-        
+        point_id = self.point_at(event.x, event.y)
         if not point_id or point_id not in self.point_objects:
             return
         
@@ -677,8 +779,7 @@ class MapManager:
         )
         
         if label:
-            self.point_labels[self.selected_point] = label
-            self.draw_map()
+            self.model.set_label(self.current_floor, self.selected_point, label)
             self.select_point(self.selected_point)  # Odśwież sidebar
             
             self.info_label['text'] = f"✓ Dodano etykietę: {label}"
@@ -702,8 +803,7 @@ class MapManager:
             else:
                 label = label_type.capitalize()
             
-            self.point_labels[self.selected_point] = label
-            self.draw_map()
+            self.model.set_label(self.current_floor, self.selected_point, label)
             self.select_point(self.selected_point)
             
             self.info_label['text'] = f"✓ Dodano: {label}"
@@ -726,8 +826,7 @@ class MapManager:
         )
         
         if new_label:
-            self.point_labels[self.selected_point] = new_label
-            self.draw_map()
+            self.model.set_label(self.current_floor, self.selected_point, new_label)
             self.select_point(self.selected_point)
             
             self.info_label['text'] = f"✓ Zaktualizowano: {new_label}"
@@ -744,8 +843,7 @@ class MapManager:
         
         label = self.point_labels[self.selected_point]
         if messagebox.askyesno("Potwierdzenie", f"Usunąć etykietę '{label}'?"):
-            del self.point_labels[self.selected_point]
-            self.draw_map()
+            self.model.set_label(self.current_floor, self.selected_point, None)
             self.select_point(self.selected_point)
             
             self.info_label['text'] = f"✓ Usunięto etykietę"
@@ -806,9 +904,6 @@ class MapManager:
             return
         
         try:
-            # Zapisz dane aktualnego piętra przed zapisem
-            self.save_current_floor_data()
-            
             # Przygotuj dane do zapisu w nowym formacie
             save_data = {
                 'building_info': self.building_info if self.building_info else {
@@ -825,9 +920,11 @@ class MapManager:
                 }
             }
             
-            # Zapisz
-            with open(self.map_filename, 'w', encoding='utf-8') as f:
-                json.dump(save_data, f, indent=2, ensure_ascii=False)
+            # Zapisz tylko zmiany od ostatniego zapisu (dziennik mapy)
+            changes = self.map_session.save(save_data, self.saved_map)
+            if self.shell is None:
+                self.saved_map = copy.deepcopy(save_data)
+            self.points_moved = False
             
             # Statystyki
             total_points = sum(sum(len(path['points']) for path in floor.get('paths', [])) 
@@ -836,7 +933,8 @@ class MapManager:
             total_connections = sum(len(floor.get('connections', [])) for floor in self.floors.values())
             
             messagebox.showinfo("Zapisano",
-                              f"✓ Wszystkie zmiany zapisane do:\n{self.map_filename}\n\n"
+                              f"✓ Wszystkie zmiany zapisane do:\n{self.map_filename}\n"
+                              f"(operacje w dzienniku: {changes})\n\n"
                               f"Piętra: {len(self.floors)}\n"
                               f"Punkty: {total_points}\n"
                               f"Połączenia: {total_connections}\n"
@@ -925,25 +1023,20 @@ class MapManager:
         
         aligned_count = 0
         
-        # Wyrównaj wszystkie punkty we wszystkich ścieżkach
-        for path in self.all_paths:
-            for point in path['points']:
-                old_x, old_y = point['x'], point['y']
-                
-                # Wyrównaj do najbliższego węzła siatki
-                new_x = round(point['x'] / self.grid_size) * self.grid_size
-                new_y = round(point['y'] / self.grid_size) * self.grid_size
-                
-                if new_x != old_x or new_y != old_y:
-                    point['x'] = new_x
-                    point['y'] = new_y
-                    aligned_count += 1
+        # Wyrównaj wszystkie punkty piętra (model odświeży przesunięte punkty na canvas)
+        for point_id, point in self.model.points(self.current_floor).items():
+            old_x, old_y = point['x'], point['y']
+            
+            # Wyrównaj do najbliższego węzła siatki
+            new_x = round(point['x'] / self.grid_size) * self.grid_size
+            new_y = round(point['y'] / self.grid_size) * self.grid_size
+            
+            if new_x != old_x or new_y != old_y:
+                self.model.move_point(self.current_floor, point_id, new_x, new_y)
+                aligned_count += 1
         
         # Przelicz odległości w połączeniach
-        self._recalculate_connections()
-        
-        # Odśwież widok
-        self.draw_map()
+        self.model.recalculate_distances(self.current_floor)
         
         messagebox.showinfo("Wyrównano",
                           f"Wyrównano {aligned_count} punktów do siatki {self.grid_size}px.\n"
@@ -952,26 +1045,6 @@ class MapManager:
         
         self.info_label['text'] = f"✓ Wyrównano {aligned_count} punktów do siatki {self.grid_size}px"
     
-    def _recalculate_connections(self):
-        """Przelicza odległości w połączeniach po zmianie pozycji punktów"""
-        # Stwórz mapę ID -> współrzędne
-        point_coords = {}
-        for path in self.all_paths:
-            for point in path['points']:
-                point_coords[point['id']] = (point['x'], point['y'])
-        
-        # Przelicz odległości
-        for conn in self.all_connections:
-            from_id = conn['from']
-            to_id = conn['to']
-            
-            if from_id in point_coords and to_id in point_coords:
-                x1, y1 = point_coords[from_id]
-                x2, y2 = point_coords[to_id]
-                
-                distance = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-                conn['distance'] = round(distance, 2)
-    
     def toggle_lasso_mode(self):
         """Przełącza tryb lasso do grupowego zaznaczania"""
         self.lasso_mode = not self.lasso_mode
@@ -1041,11 +1114,7 @@ class MapManager:
         self.lasso_points.append(self.lasso_points[0])
         
         # Znajdź punkty wewnątrz polygonu
-        self.selected_points = []
-        for path in self.all_paths:
-            for point in path['points']:
-                if self._point_in_polygon(point['x'], point['y'], self.lasso_points):
-                    self.selected_points.append(point['id'])
+        self.selected_points = self.points_in_lasso(self.lasso_points)
         
         if self.lasso_polygon:
             self.canvas.delete(self.lasso_polygon)
@@ -1053,11 +1122,10 @@ class MapManager:
         
         if self.selected_points:
             # Podświetl zaznaczone punkty
-            self.draw_map()
             for point_id in self.selected_points:
-                if point_id in self.point_objects:
-                    oval, text = self.point_objects[point_id]
-                    self.canvas.itemconfig(oval, fill='#E91E63', width=3)
+                objects = self.point_objects.get(str(point_id))
+                if objects:
+                    self.canvas.itemconfig(objects['oval'], fill='#E91E63', width=3)
             
             # Pokaż dialog przypisania etykiety
             self._show_group_label_dialog()
@@ -1066,6 +1134,24 @@ class MapManager:
         
         self.lasso_points = []
     
+    def _clear_lasso_highlight(self):
+        """Przywraca normalny wygląd punktów zaznaczonych lassem"""
+        for point_id in self.selected_points:
+            objects = self.point_objects.get(str(point_id))
+            if objects:
+                self.canvas.itemconfig(objects['oval'], width=2)
+                self.refresh_point(point_id)
+    
+    def points_in_lasso(self, polygon) -> List:
+        """ID punktów aktualnego piętra wewnątrz lasso"""
+        database = self._point_database()
+        if database is not None:
+            # Zapytanie R*Tree w bazie mapy; punkty usunięte od zapisu pomijamy
+            return [point['id'] for point in database.points_in_polygon(self.current_floor, polygon)
+                    if self.find_point(point['id']) is not None]
+        return [point['id'] for path in self.all_paths for point in path['points']
+                if self._point_in_polygon(point['x'], point['y'], polygon)]
+    
     def _point_in_polygon(self, x, y, polygon):
         """Sprawdza czy punkt (x,y) znajduje się wewnątrz polygonu (ray casting algorithm)"""
         n = len(polygon)
@@ -1142,10 +1228,10 @@ class MapManager:
             
             # Przypisz etykietę do wszystkich zaznaczonych punktów
             for point_id in self.selected_points:
-                self.point_labels[str(point_id)] = label
+                self.model.set_label(self.current_floor, point_id, label)
             
             dialog.destroy()
-            self.draw_map()
+            self._clear_lasso_highlight()
             self.toggle_lasso_mode()  # Wyłącz tryb lasso
             
             messagebox.showinfo("Przypisano",
@@ -1154,7 +1240,7 @@ class MapManager:
         
         def cancel():
             dialog.destroy()
-            self.draw_map()
+            self._clear_lasso_highlight()
         
         btn_frame = tk.Frame(frame)
         btn_frame.pack(fill=tk.X)
@@ -1178,23 +1264,7 @@ class MapManager:
             return
         
         node_id = self.selected_point
-        
-        # Usuń punkt ze ścieżek (natychmiast)
-        for path in self.all_paths:
-            path['points'] = [p for p in path['points'] if p['id'] != node_id]
-        
-        # Usuń puste ścieżki
-        self.all_paths = [p for p in self.all_paths if len(p['points']) > 0]
-        
-        # Usuń połączenia z tym punktem
-        self.all_connections = [
-            c for c in self.all_connections 
-            if c['from'] != node_id and c['to'] != node_id
-        ]
-        
-        # Usuń etykietę jeśli istnieje
-        if str(node_id) in self.point_labels:
-            del self.point_labels[str(node_id)]
+        self.remove_points({node_id})
         
         # Reset wyboru
         self.selected_point = None
@@ -1203,11 +1273,12 @@ class MapManager:
         self.coords_label['text'] = "x: -, y: -"
         self.connections_label['text'] = "0"
         
-        # Natychmiastowa aktualizacja widoku
-        self.draw_map()
-        
         self.info_label['text'] = f"✓ Usunięto węzeł {node_id} (pamiętaj zapisać zmiany)"
     
+    def remove_points(self, point_ids: set):
+        """Usuwa punkty (ID jako str) razem z połączeniami i etykietami (canvas odświeża model)"""
+        self.model.delete_points(self.current_floor, point_ids)
+    
     def delete_lasso_mode(self):
         """Aktywuje tryb usuwania węzłów lassem"""
         if not self.map_data:
@@ -1281,11 +1352,7 @@ class MapManager:
         self.lasso_points.append(self.lasso_points[0])
         
         # Znajdź punkty wewnątrz polygonu
-        nodes_to_delete = []
-        for path in self.all_paths:
-            for point in path['points']:
-                if self._point_in_polygon(point['x'], point['y'], self.lasso_points):
-                    nodes_to_delete.append(point['id'])
+        nodes_to_delete = self.points_in_lasso(self.lasso_points)
         
         if self.lasso_polygon:
             self.canvas.delete(self.lasso_polygon)
@@ -1300,27 +1367,8 @@ class MapManager:
                                         f"{'...' if len(nodes_to_delete) > 10 else ''}")
             
             if result:
-                # Usuń wszystkie punkty
-                for node_id in nodes_to_delete:
-                    # Usuń punkt ze ścieżek
-                    for path in self.all_paths:
-                        path['points'] = [p for p in path['points'] if p['id'] != node_id]
-                    
-                    # Usuń połączenia z tym punktem
-                    self.all_connections = [
-                        c for c in self.all_connections 
-                        if c['from'] != node_id and c['to'] != node_id
-                    ]
-                    
-                    # Usuń etykietę jeśli istnieje
-                    if str(node_id) in self.point_labels:
-                        del self.point_labels[str(node_id)]
-                
-                # Usuń puste ścieżki
-                self.all_paths = [p for p in self.all_paths if len(p['points']) > 0]
-                
-                # Natychmiastowa aktualizacja widoku
-                self.draw_map()
+                # Usuń wszystkie punkty (jednym przebiegiem po ścieżkach i połączeniach)
+                self.remove_points({str(node_id) for node_id in nodes_to_delete})
                 
                 self.info_label['text'] = f"✓ Usunięto {len(nodes_to_delete)} węzłów (pamiętaj zapisać zmiany)"
                 
@@ -1336,59 +1384,93 @@ class MapManager:
         self.lasso_points = []
     
     def show_feedback(self):
-        """Wyświetla okno z feedbackiem od użytkowników"""
-        feedback_file = "route_feedback.json"
-        
-        if not os.path.exists(feedback_file):
+        """Wyświetla okno z feedbackiem od użytkowników (stronami, z filtrem powodu)"""
+        if not os.path.exists(FEEDBACK_DB) and not os.path.exists(LEGACY_JSON):
             messagebox.showinfo("Brak feedbacku",
-                              "Nie znaleziono pliku route_feedback.json\n\n"
+                              "Nie znaleziono bazy route_feedback.db\n\n"
                               "Feedback pojawi się po tym jak użytkownicy\n"
                               "przejdą trasę w aplikacji Navigator.")
             return
         
         try:
-            with open(feedback_file, 'r', encoding='utf-8') as f:
-                feedbacks = json.load(f)
+            store = FeedbackStore()
             
-            if not feedbacks:
+            if not store.count():
+                store.close()
                 messagebox.showinfo("Brak feedbacku",
-                                  "Plik feedbacku jest pusty.\n\n"
+                                  "Baza feedbacku jest pusta.\n\n"
                                   "Brak danych do wyświetlenia.")
                 return
             
             # Utwórz okno feedbacku
             feedback_window = tk.Toplevel(self.root)
             feedback_window.title("Przegląd Feedbacku Użytkowników")
-            feedback_window.geometry("900x600")
+            feedback_window.geometry("900x650")
             feedback_window.transient(self.root)
             
+            def close_window():
+                store.close()
+                feedback_window.destroy()
+            
+            feedback_window.protocol("WM_DELETE_WINDOW", close_window)
+            
             # Header
             tk.Label(feedback_window, text="📊 FEEDBACK OD UŻYTKOWNIKÓW",
                     bg='#673AB7', fg='white', font=('Arial', 14, 'bold'),
                     pady=15).pack(fill=tk.X)
             
-            # Statystyki
+            reason_map = {
+                'crowded': '👥 Zbyt tłoczno',
+                'shorter': '⚡ Krótsza trasa',
+                'blocked': '🚫 Zablokowana',
+                'nonexistent': '❓ Nieistniejąca',
+                'other': '📝 Inny powód',
+                'exploring': '🗺️ Eksploracja'
+            }
+            
+            # Statystyki (zapytania agregujące, bez wczytywania zgłoszeń)
             stats_frame = tk.Frame(feedback_window, bg='#F3E5F5', pady=10)
             stats_frame.pack(fill=tk.X, padx=10, pady=10)
             
-            total = len(feedbacks)
-            deviated = sum(1 for f in feedbacks if f.get('deviated', False))
-            
-            reasons = {}
-            for f in feedbacks:
-                reason = f.get('reason', 'unknown')
-                reasons[reason] = reasons.get(reason, 0) + 1
-            
+            summary = store.summary()
+            total, deviated = summary['total'], summary['deviated']
             stats_text = f"Łącznie odpowiedzi: {total} | Zboczyli z trasy: {deviated} ({deviated*100//total if total else 0}%)"
             tk.Label(stats_frame, text=stats_text,
                     bg='#F3E5F5', font=('Arial', 11, 'bold'),
                     fg='#4A148C').pack()
             
-            reasons_text = "Powody: " + " | ".join([f"{k}: {v}" for k, v in reasons.items()])
+            reasons = store.counts_by_reason()
+            reasons_text = "Powody: " + " | ".join([f"{k}: {v}" for k, v in reasons])
             tk.Label(stats_frame, text=reasons_text,
                     bg='#F3E5F5', font=('Arial', 9),
                     fg='#666').pack(pady=(5, 0))
             
+            skipped = store.counts_by_skipped_node(limit=5)
+            if skipped:
+                skipped_text = "Najczęściej pomijane punkty: " + " | ".join(
+                    [f"{node}: {count}" for node, count in skipped])
+                tk.Label(stats_frame, text=skipped_text,
+                        bg='#F3E5F5', font=('Arial', 9),
+                        fg='#666').pack(pady=(2, 0))
+            
+            # Filtr i nawigacja po stronach
+            nav_frame = tk.Frame(feedback_window)
+            nav_frame.pack(fill=tk.X, padx=10)
+            
+            tk.Label(nav_frame, text="Powód:", font=('Arial', 9)).pack(side=tk.LEFT)
+            all_reasons = "wszystkie"
+            reason_var = tk.StringVar(value=all_reasons)
+            reason_combo = ttk.Combobox(nav_frame, textvariable=reason_var, state='readonly',
+                                        values=[all_reasons] + [k for k, _ in reasons], width=15)
+            reason_combo.pack(side=tk.LEFT, padx=5)
+            
+            page_label = tk.Label(nav_frame, font=('Arial', 9))
+            next_button = tk.Button(nav_frame, text="Następne ▶", font=('Arial', 9))
+            next_button.pack(side=tk.RIGHT)
+            page_label.pack(side=tk.RIGHT, padx=10)
+            prev_button = tk.Button(nav_frame, text="◀ Poprzednie", font=('Arial', 9))
+            prev_button.pack(side=tk.RIGHT)
+            
             # Lista feedbacków
             list_frame = tk.Frame(feedback_window)
             list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -1403,45 +1485,6 @@ class MapManager:
             text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
             scrollbar.config(command=text_widget.yview)
             
-            # Wypełnij feedbackami
-            for i, fb in enumerate(feedbacks, 1):
-                text_widget.insert(tk.END, f"\n{'='*90}\n", 'separator')
-                text_widget.insert(tk.END, f"FEEDBACK #{i}\n", 'header')
-                text_widget.insert(tk.END, f"{'='*90}\n", 'separator')
-                
-                timestamp = fb.get('timestamp', 'Brak daty')
-                text_widget.insert(tk.END, f"Data: {timestamp}\n", 'info')
-                
-                deviated = fb.get('deviated', False)
-                status = "❌ ZBOCZYŁ Z TRASY" if deviated else "✓ Zgodnie z trasą"
-                text_widget.insert(tk.END, f"Status: {status}\n", 'status')
-                
-                reason = fb.get('reason', 'brak')
-                reason_map = {
-                    'crowded': '👥 Zbyt tłoczno',
-                    'shorter': '⚡ Krótsza trasa',
-                    'blocked': '🚫 Zablokowana',
-                    'nonexistent': '❓ Nieistniejąca',
-                    'other': '📝 Inny powód',
-                    'exploring': '🗺️ Eksploracja'
-                }
-                text_widget.insert(tk.END, f"Powód: {reason_map.get(reason, reason)}\n", 'reason')
-                
-                suggested = fb.get('suggested_route', [])
-                text_widget.insert(tk.END, f"Sugerowana trasa: {' → '.join(map(str, suggested))}\n", 'route')
-                
-                visited = fb.get('visited_nodes', [])
-                text_widget.insert(tk.END, f"Faktyczna trasa:  {' → '.join(map(str, visited))}\n", 'route')
-                
-                path_len = fb.get('path_length', 0)
-                text_widget.insert(tk.END, f"Długość ścieżki: {path_len} punktów\n", 'info')
-                
-                notes = fb.get('notes', '')
-                if notes:
-                    text_widget.insert(tk.END, f"Notatki: {notes}\n", 'notes')
-                
-                text_widget.insert(tk.END, "\n")
-            
             # Konfiguruj tagi
             text_widget.tag_config('separator', foreground='#999')
             text_widget.tag_config('header', font=('Courier', 10, 'bold'), foreground='#673AB7')
@@ -1451,11 +1494,68 @@ class MapManager:
             text_widget.tag_config('route', font=('Courier', 8), foreground='#388E3C')
             text_widget.tag_config('notes', foreground='#F57C00', font=('Courier', 9, 'italic'))
             
-            text_widget.config(state=tk.DISABLED)
+            state = {'offset': 0}
+            
+            def show_page():
+                """Wypełnia listę jedną stroną zgłoszeń (najnowsze pierwsze)"""
+                reason = reason_var.get()
+                filters = {'reason': None if reason == all_reasons else reason}
+                count = store.count(**filters)
+                offset = state['offset']
+                
+                text_widget.config(state=tk.NORMAL)
+                text_widget.delete('1.0', tk.END)
+                for feedback_id, fb in store.page(offset, FEEDBACK_PAGE_SIZE, **filters):
+                    text_widget.insert(tk.END, f"\n{'='*90}\n", 'separator')
+                    text_widget.insert(tk.END, f"FEEDBACK #{feedback_id}\n", 'header')
+                    text_widget.insert(tk.END, f"{'='*90}\n", 'separator')
+                    
+                    timestamp = fb.get('timestamp', 'Brak daty')
+                    text_widget.insert(tk.END, f"Data: {timestamp}\n", 'info')
+                    
+                    status = "❌ ZBOCZYŁ Z TRASY" if fb.get('deviated', False) else "✓ Zgodnie z trasą"
+                    text_widget.insert(tk.END, f"Status: {status}\n", 'status')
+                    
+                    reason_text = fb.get('reason', 'brak')
+                    text_widget.insert(tk.END, f"Powód: {reason_map.get(reason_text, reason_text)}\n", 'reason')
+                    
+                    suggested = fb.get('suggested_route', [])
+                    text_widget.insert(tk.END, f"Sugerowana trasa: {' → '.join(map(str, suggested))}\n", 'route')
+                    
+                    visited = fb.get('visited_nodes', [])
+                    text_widget.insert(tk.END, f"Faktyczna trasa:  {' → '.join(map(str, visited))}\n", 'route')
+                    
+                    path_len = fb.get('path_length', 0)
+                    text_widget.insert(tk.END, f"Długość ścieżki: {path_len} punktów\n", 'info')
+                    
+                    notes = fb.get('notes', '')
+                    if notes:
+                        text_widget.insert(tk.END, f"Notatki: {notes}\n", 'notes')
+                    
+                    text_widget.insert(tk.END, "\n")
+                text_widget.config(state=tk.DISABLED)
+                
+                last = min(offset + FEEDBACK_PAGE_SIZE, count)
+                page_label['text'] = f"{offset + 1 if count else 0}-{last} z {count}"
+                prev_button['state'] = tk.NORMAL if offset > 0 else tk.DISABLED
+                next_button['state'] = tk.NORMAL if last < count else tk.DISABLED
+            
+            def change_page(step):
+                state['offset'] = max(0, state['offset'] + step * FEEDBACK_PAGE_SIZE)
+                show_page()
+            
+            def change_reason(event=None):
+                state['offset'] = 0
+                show_page()
+            
+            prev_button['command'] = lambda: change_page(-1)
+            next_button['command'] = lambda: change_page(1)
+            reason_combo.bind('<<ComboboxSelected>>', change_reason)
+            show_page()
             
             # Przycisk zamknij
             tk.Button(feedback_window, text="Zamknij",
-                     command=feedback_window.destroy,
+                     command=close_window,
                      bg='#757575', fg='white',
                      font=('Arial', 10, 'bold'),
                      padx=20, pady=8).pack(pady=10)
@@ -1470,6 +1570,10 @@ class MapManager:
     
     def return_to_menu(self):
         """Zamyka aplikację i wraca do menu głównego"""
+        if self.shell is not None:
+            self.shell.show_menu()  # W powłoce narzędzie zostaje otwarte w swojej karcie
+            return
+        
         import subprocess
         import sys
         import os
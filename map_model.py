@@ -0,0 +1,526 @@
+"""Wspólny model mapy w pamięci z powiadomieniami o zmianach.
+
+MapModel jest właścicielem danych mapy (piętra ze ścieżkami, punktami,
+połączeniami i etykietami oraz przejścia między piętrami) i jedynym miejscem,
+które je zmienia. Każda zmiana publikuje drobne zdarzenie (PointAdded,
+PointMoved, LabelChanged, EdgeAdded...) do subskrybentów, więc indeksy
+przestrzenne, graf tras i obiekty canvas aktualizują tylko to, czego zmiana
+dotyczy, zamiast przebudowy od zera.
+
+Listy ścieżek, połączeń i słowniki etykiet pięter są zmieniane w miejscu -
+odwołania do nich (np. all_paths w aplikacjach) pozostają aktualne.
+
+Gotowi subskrybenci:
+    SpatialIndexes - GridIndex każdego piętra (budowany przy pierwszym użyciu)
+    RoutingGraph - RoutingEngine; wagi i współrzędne poprawiane w miejscu,
+                   zmiany topologii kompilują graf przy następnym użyciu
+
+MapSession łączy plik mapy (MapStore), model i obu subskrybentów - jedna
+sesja na wczytaną mapę, wspólna dla narzędzi w powłoce app_shell.py.
+"""
+import copy
+import math
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from compiled_map import load_building_data
+from map_store import MapStore, apply_op
+from routing import CompiledGraph, RoutingEngine, as_building, node_key
+from spatial_index import GridIndex
+
+
+@dataclass
+class PointAdded:
+    floor: str
+    path_id: object
+    point: dict
+
+
+@dataclass
+class PointMoved:
+    floor: str
+    point_id: object
+    x: float
+    y: float
+    old_x: float
+    old_y: float
+
+
+@dataclass
+class PointDeleted:
+    floor: str
+    point_id: object
+    x: float
+    y: float
+
+
+@dataclass
+class LabelChanged:
+    floor: str
+    point_id: str
+    label: Optional[str]  # None = etykieta usunięta
+    old_label: Optional[str]
+
+
+@dataclass
+class EdgeAdded:
+    floor: str
+    connection: dict
+
+
+@dataclass
+class EdgeRemoved:
+    floor: str
+    connection: dict
+
+
+@dataclass
+class EdgeChanged:
+    floor: str
+    connection: dict
+    old_distance: float
+
+
+@dataclass
+class TransitionAdded:
+    transition: dict
+
+
+@dataclass
+class TransitionRemoved:
+    transition: dict
+
+
+@dataclass
+class FloorReplaced:
+    """Piętro dodane, usunięte lub zmienione w całości"""
+    floor: str
+
+
+Listener = Callable[[object], None]
+
+
+def has_position(x, y) -> bool:
+    """Punkt (0, 0) oznacza brak współrzędnych (jak w CompiledGraph.compile)"""
+    return x != 0 or y != 0
+
+
+class MapModel:
+    """Dane mapy + zdarzenia zmian dla subskrybentów"""
+
+    def __init__(self, data: dict):
+        self.data = as_building(data)
+        self.floors = self.data['floors']
+        self.floor_transitions = self.data.setdefault('floor_transitions', [])
+        self.building_info = self.data['building_info']
+        self.listeners: List[Listener] = []
+        self.version = 0  # Liczba zmian od wczytania
+        self._points: Dict[str, Dict[str, List[dict]]] = {}  # Piętro -> ID (str) -> wystąpienia punktu
+
+    # --- Subskrypcje ---
+
+    def subscribe(self, listener: Listener) -> Listener:
+        """Dodaje odbiorcę zdarzeń (wywoływany z każdym zdarzeniem)"""
+        self.listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener: Listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def _emit(self, event):
+        self.version += 1
+        for listener in list(self.listeners):
+            listener(event)
+
+    # --- Odczyt ---
+
+    def floor(self, floor_id) -> Optional[dict]:
+        """Dane piętra lub None"""
+        floor_id = str(floor_id)
+        return self.floors[floor_id] if floor_id in self.floors else None
+
+    def _occurrences(self, floor_id: str) -> Dict[str, List[dict]]:
+        index = self._points.get(floor_id)
+        if index is None:
+            index = {}
+            floor = self.floor(floor_id)
+            for path in (floor or {}).get('paths', []):
+                for point in path.get('points', []):
+                    index.setdefault(str(point['id']), []).append(point)
+            self._points[floor_id] = index
+        return index
+
+    def point(self, floor_id, point_id) -> Optional[dict]:
+        """Punkt piętra po ID (pierwsze wystąpienie, jak dawny point_index)"""
+        occurrences = self._occurrences(str(floor_id)).get(str(point_id))
+        return occurrences[0] if occurrences else None
+
+    def points(self, floor_id):
+        """Wszystkie punkty piętra (ID str -> punkt)"""
+        return {point_id: points[0] for point_id, points in self._occurrences(str(floor_id)).items()}
+
+    # --- Zmiany ---
+
+    def add_floor(self, floor_id, data: Optional[dict] = None):
+        """Dodaje (lub zastępuje) piętro"""
+        floor_id = str(floor_id)
+        self.floors[floor_id] = data if data is not None else {'paths': [], 'connections': [], 'point_labels': {}}
+        self._points.pop(floor_id, None)
+        self._emit(FloorReplaced(floor_id))
+
+    def add_path(self, floor_id, path: dict):
+        """Dodaje ścieżkę razem z jej punktami"""
+        floor_id = str(floor_id)
+        points = path.get('points', [])
+        path = dict(path, points=[])  # Punkty dochodzą pojedynczo (ze zdarzeniami)
+        self.floors[floor_id].setdefault('paths', []).append(path)
+        for point in points:
+            self.add_point(floor_id, path.get('id'), point, path)
+
+    def add_point(self, floor_id, path_id, point: dict, path: Optional[dict] = None):
+        """Dopisuje punkt na końcu ścieżki"""
+        floor_id = str(floor_id)
+        if path is None:
+            path = next((p for p in self.floors[floor_id].get('paths', [])
+                         if str(p.get('id')) == str(path_id)), None)
+            if path is None:
+                raise ValueError(f"brak ścieżki {path_id} na piętrze {floor_id}")
+        path.setdefault('points', []).append(point)
+        if floor_id in self._points:
+            self._points[floor_id].setdefault(str(point['id']), []).append(point)
+        self._emit(PointAdded(floor_id, path_id, point))
+
+    def move_point(self, floor_id, point_id, x: float, y: float):
+        """Przesuwa punkt (wszystkie jego wystąpienia na piętrze)"""
+        floor_id = str(floor_id)
+        occurrences = self._occurrences(floor_id).get(str(point_id), [])
+        if not occurrences:
+            return
+        old_x, old_y = occurrences[0]['x'], occurrences[0]['y']
+        if (old_x, old_y) == (x, y):
+            return
+        for point in occurrences:
+            point['x'], point['y'] = x, y
+        self._emit(PointMoved(floor_id, occurrences[0]['id'], x, y, old_x, old_y))
+
+    def delete_points(self, floor_id, point_ids: set, drop_empty_paths: bool = True):
+        """Usuwa punkty (ID jako str) z ich połączeniami i etykietami; puste ścieżki znikają"""
+        floor_id = str(floor_id)
+        floor = self.floors[floor_id]
+        occurrences = self._occurrences(floor_id)
+
+        connections = floor.setdefault('connections', [])
+        removed = [c for c in connections if str(c['from']) in point_ids or str(c['to']) in point_ids]
+        if removed:
+            connections[:] = [c for c in connections
+                              if str(c['from']) not in point_ids and str(c['to']) not in point_ids]
+            for connection in removed:
+                self._emit(EdgeRemoved(floor_id, connection))
+
+        labels = floor.setdefault('point_labels', {})
+        for point_id in point_ids:
+            if point_id in labels:
+                self._emit(LabelChanged(floor_id, point_id, None, labels.pop(point_id)))
+
+        paths = floor.setdefault('paths', [])
+        for path in paths:
+            path['points'] = [p for p in path['points'] if str(p['id']) not in point_ids]
+        if drop_empty_paths:
+            paths[:] = [p for p in paths if len(p['points']) > 0]
+
+        for point_id in point_ids:
+            points = occurrences.pop(point_id, None)
+            if points:
+                self._emit(PointDeleted(floor_id, points[0]['id'], points[0]['x'], points[0]['y']))
+
+    def set_label(self, floor_id, point_id, label: Optional[str]):
+        """Ustawia etykietę punktu (None usuwa)"""
+        floor_id = str(floor_id)
+        point_id = str(point_id)
+        labels = self.floors[floor_id].setdefault('point_labels', {})
+        old = labels.get(point_id)
+        if old == label:
+            return
+        if label is None:
+            del labels[point_id]
+        else:
+            labels[point_id] = label
+        self._emit(LabelChanged(floor_id, point_id, label, old))
+
+    def add_connection(self, floor_id, connection: dict):
+        floor_id = str(floor_id)
+        self.floors[floor_id].setdefault('connections', []).append(connection)
+        self._emit(EdgeAdded(floor_id, connection))
+
+    def remove_connection(self, floor_id, connection: dict):
+        """Usuwa pierwsze połączenie równe connection"""
+        floor_id = str(floor_id)
+        connections = self.floors[floor_id].get('connections', [])
+        if connection in connections:
+            removed = connections.pop(connections.index(connection))
+            self._emit(EdgeRemoved(floor_id, removed))
+
+    def recalculate_distances(self, floor_id) -> int:
+        """Przelicza długości połączeń z pozycji punktów; zwraca liczbę zmienionych"""
+        floor_id = str(floor_id)
+        floor = self.floors[floor_id]
+        point_coords = {}
+        for path in floor.get('paths', []):
+            for point in path['points']:
+                point_coords[point['id']] = (point['x'], point['y'])
+
+        changed = 0
+        for connection in floor.get('connections', []):
+            if connection['from'] in point_coords and connection['to'] in point_coords:
+                x1, y1 = point_coords[connection['from']]
+                x2, y2 = point_coords[connection['to']]
+                distance = round(math.sqrt((x2 - x1)**2 + (y2 - y1)**2), 2)
+                old = connection.get('distance')
+                if old != distance:
+                    connection['distance'] = distance
+                    changed += 1
+                    self._emit(EdgeChanged(floor_id, connection, old))
+        return changed
+
+    def add_transition(self, transition: dict):
+        self.floor_transitions.append(transition)
+        self._emit(TransitionAdded(transition))
+
+    def remove_transition(self, index: int):
+        self._emit(TransitionRemoved(self.floor_transitions.pop(index)))
+
+    def replace(self, data: dict):
+        """Zastępuje całą mapę (np. nową mapą z Map Maker); słowniki i listy modelu zostają te same"""
+        data = copy.deepcopy(as_building(data))  # Kopia - wywołujący (Map Maker) dalej edytuje swoje obiekty
+        floors = data['floors']
+        changed = list(self.floors) + [floor_id for floor_id in floors if floor_id not in self.floors]
+        for floor_id in list(self.floors):
+            if floor_id not in floors:
+                del self.floors[floor_id]
+        for floor_id in floors:
+            self.floors[floor_id] = floors[floor_id]
+        self.floor_transitions[:] = data.get('floor_transitions', [])
+        self.building_info.clear()
+        self.building_info.update(data.get('building_info', {}))
+        self._points.clear()
+        for floor_id in changed:
+            self._emit(FloorReplaced(floor_id))
+
+    def apply(self, ops: List[dict]):
+        """Wykonuje operacje dziennika (map_store.py) jako zmiany modelu ze zdarzeniami"""
+        for op in ops:
+            kind = op['op']
+            floor_id = str(op.get('floor', ''))
+            if (kind in ('add_path', 'add_point', 'add_connection', 'delete_connection', 'set_label', 'delete_node')
+                    and floor_id not in self.floors):
+                self.add_floor(floor_id)
+            if kind == 'add_path':
+                self.add_path(floor_id, op['path'])
+            elif kind == 'add_point':
+                self.add_point(floor_id, op['path_id'], op['point'])
+            elif kind == 'add_connection':
+                self.add_connection(floor_id, op['connection'])
+            elif kind == 'delete_connection':
+                self.remove_connection(floor_id, op['connection'])
+            elif kind == 'set_label':
+                self.set_label(floor_id, op['point_id'], op['label'])
+            elif kind == 'add_transition':
+                self.add_transition(op['transition'])
+            elif kind == 'delete_transition':
+                if op['transition'] in self.floor_transitions:
+                    self.remove_transition(self.floor_transitions.index(op['transition']))
+            elif kind == 'delete_node':
+                self.delete_node(floor_id, op['point_id'])
+            elif kind == 'set_building_info':
+                # Ten sam słownik - narzędzia trzymają do niego referencje
+                self.building_info.clear()
+                self.building_info.update(op['building_info'] or {})
+            else:
+                # Pozostałe operacje (set_path, delete_path, set_floor) zmieniają piętro w całości
+                apply_op(self.data, op)
+                self._points.pop(floor_id, None)
+                self._emit(FloorReplaced(floor_id))
+
+    def delete_node(self, floor_id, point_id):
+        """Usuwa węzeł jak operacja dziennika delete_node: z połączeniami, etykietą i przejściami"""
+        floor_id = str(floor_id)
+        point_id = str(point_id)
+        self.delete_points(floor_id, {point_id}, drop_empty_paths=False)
+        for index in reversed(range(len(self.floor_transitions))):
+            transition = self.floor_transitions[index]
+            if ((str(transition.get('from_floor')) == floor_id and str(transition.get('from_point')) == point_id)
+                    or (str(transition.get('to_floor')) == floor_id and str(transition.get('to_point')) == point_id)):
+                self.remove_transition(index)
+
+
+class SpatialIndexes:
+    """Indeksy przestrzenne pięter (klucz: ID punktu) aktualizowane zdarzeniami modelu"""
+
+    def __init__(self, model: MapModel, cell_size: float = 50.0):
+        self.model = model
+        self.cell_size = cell_size
+        self.indexes: Dict[str, GridIndex] = {}
+        model.subscribe(self)
+
+    def floor(self, floor_id) -> Optional[GridIndex]:
+        """Indeks piętra (budowany przy pierwszym użyciu)"""
+        floor_id = str(floor_id)
+        index = self.indexes.get(floor_id)
+        if index is None and self.model.floor(floor_id) is not None:
+            index = GridIndex.from_points(
+                ((point['id'], point['x'], point['y'])
+                 for point in self.model.points(floor_id).values()
+                 if has_position(point.get('x', 0), point.get('y', 0))),
+                self.cell_size)
+            self.indexes[floor_id] = index
+        return index
+
+    def __call__(self, event):
+        floor_id = getattr(event, 'floor', None)
+        index = self.indexes.get(floor_id)
+        if index is None:
+            return  # Indeks piętra powstanie przy pierwszym użyciu
+        if isinstance(event, PointAdded):
+            point = event.point
+            if point['id'] not in index and has_position(point['x'], point['y']):
+                index.insert(point['id'], point['x'], point['y'])
+        elif isinstance(event, PointMoved):
+            if has_position(event.x, event.y):
+                index.move(event.point_id, event.x, event.y)
+            else:
+                index.remove(event.point_id)
+        elif isinstance(event, PointDeleted):
+            index.remove(event.point_id)
+        elif isinstance(event, FloorReplaced):
+            del self.indexes[floor_id]
+
+
+class RoutingGraph:
+    """RoutingEngine modelu mapy aktualizowany zdarzeniami.
+
+    Zmiana długości połączenia lub pozycji punktu poprawia wagi i współrzędne
+    grafu CSR w miejscu. Nowe/usunięte połączenia, punkty grafu i przejścia
+    zmieniają strukturę CSR - graf jest wtedy kompilowany z modelu przy
+    następnym wywołaniu engine().
+    """
+
+    def __init__(self, model: MapModel, map_filename: Optional[str] = None):
+        self.model = model
+        self.map_filename = map_filename  # Plik, z którego graf można wczytać bez zmian modelu
+        self._engine: Optional[RoutingEngine] = None
+        self.stale = False
+        self.revision = 0  # Zmienia się przy każdej zmianie grafu (np. do resetu D* Lite)
+        self.loaded_version = model.version
+        model.subscribe(self)
+
+    def engine(self) -> RoutingEngine:
+        """Aktualny RoutingEngine (kompilowany tylko po zmianie struktury grafu)"""
+        if self._engine is None or self.stale:
+            if self.map_filename and self.model.version == self.loaded_version:
+                self._engine = RoutingEngine.from_file(self.map_filename)
+            else:
+                graph = CompiledGraph.compile(self.model.floors, self.model.floor_transitions)
+                self._engine = RoutingEngine(graph)  # Bez tablic z dysku - graf różni się od pliku
+            self.stale = False
+        return self._engine
+
+    def _invalidate(self):
+        self.stale = True
+        self.revision += 1
+
+    def _derived_changed(self):
+        """Wagi lub współrzędne zmienione w miejscu - indeksy pochodne do przebudowy"""
+        engine = self._engine
+        engine._heuristic = None
+        engine._transition_tables = None
+        engine._contraction = None
+        engine.map_filename = None
+        self.revision += 1
+
+    @staticmethod
+    def _writable(graph: CompiledGraph, name: str) -> array:
+        """Tablica grafu jako array (graf z pliku .map.bin ma widoki tylko do odczytu)"""
+        values = getattr(graph, name)
+        if not isinstance(values, array):
+            values = array('d', values)
+            setattr(graph, name, values)
+        return values
+
+    def _set_weight(self, graph: CompiledGraph, u: int, v: int, old: float, new: float) -> bool:
+        weights = self._writable(graph, 'weights')
+        for k in range(graph.offsets[u], graph.offsets[u + 1]):
+            if graph.targets[k] == v and weights[k] == old:
+                weights[k] = new
+                return True
+        return False
+
+    def __call__(self, event):
+        if self._engine is None or self.stale:
+            return
+        graph = self._engine.graph
+        if isinstance(event, LabelChanged):
+            return
+        if isinstance(event, EdgeChanged):
+            u = graph.index.get(node_key(event.floor, event.connection['from']))
+            v = graph.index.get(node_key(event.floor, event.connection['to']))
+            new = event.connection['distance']
+            if u is not None and v is not None and self._set_weight(graph, u, v, event.old_distance, new) \
+                    and self._set_weight(graph, v, u, event.old_distance, new):
+                self._derived_changed()
+            else:
+                self._invalidate()
+        elif isinstance(event, PointMoved):
+            i = graph.index.get(node_key(event.floor, event.point_id))
+            if i is not None:
+                xs = self._writable(graph, 'xs')
+                ys = self._writable(graph, 'ys')
+                if has_position(event.x, event.y):
+                    xs[i], ys[i] = event.x, event.y
+                else:
+                    xs[i] = ys[i] = float('nan')
+                self._derived_changed()
+        elif isinstance(event, PointAdded):
+            if node_key(event.floor, event.point['id']) in graph.index:
+                self._invalidate()  # Węzeł grafu dostaje współrzędne
+        elif isinstance(event, PointDeleted):
+            if node_key(event.floor, event.point_id) in graph.index:
+                self._invalidate()
+        else:
+            self._invalidate()
+
+
+class MapSession:
+    """Wczytana mapa: plik z dziennikiem zmian, model, indeksy przestrzenne i graf tras"""
+
+    def __init__(self, filename: str = "gps_paths.json", cell_size: float = 50.0,
+                 data: Optional[dict] = None):
+        self.filename = filename
+        self.store = MapStore(filename)
+        if data is None:
+            # Skompilowana mapa (mmap) albo JSON, gdy plik .map.bin jest nieaktualny
+            data = load_building_data(filename)
+        self.model = MapModel(data)
+        self.spatial_indexes = SpatialIndexes(self.model, cell_size)
+        self.routing = RoutingGraph(self.model, filename)
+
+    def append(self, ops: List[dict]):
+        """Dopisuje operacje do dziennika i wykonuje je na modelu"""
+        self.store.append(ops)
+        self.model.apply(ops)
+
+    def save(self, data: Optional[dict] = None, baseline: Optional[dict] = None) -> int:
+        """Zapisuje mapę modelu (lub data) jako zmiany względem baseline; zwraca liczbę operacji.
+
+        Bez baseline bazą jest aktualna zawartość pliku - w jednym procesie
+        wszystkie zapisy przechodzą przez sesję, więc plik to ostatni zapisany stan.
+        """
+        if baseline is None:
+            baseline = self.store.load()
+        return self.store.save(baseline, data if data is not None else self.model.data)
+
+    def replace(self, data: dict):
+        """Zapisuje nową mapę jako migawkę i podmienia ją w modelu"""
+        self.store.write_snapshot(data)
+        self.model.replace(data)
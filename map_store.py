@@ -0,0 +1,519 @@
+"""Zapis mapy jako migawka + dziennik zmian (append-only).
+
+Zmiany mapy (nowa ścieżka, punkt, połączenie, etykieta, przejście, usunięcie
+węzła...) są dopisywane jako operacje JSONL do pliku obok mapy
+(gps_paths.journal.jsonl), zamiast przepisywać cały gps_paths.json. Wczytanie
+mapy to ostatnia migawka + odtworzenie operacji z dziennika. Migawka może być
+też manifestem z osobnym plikiem na każde piętro (floor_shards.py) - wtedy
+piętra są wczytywane przy pierwszym dostępie, a zapis migawki przepisuje tylko
+zmienione piętra. Gdy obok mapy istnieje baza gps_paths.db (map_db.py),
+wczytanie i zapis idą do bazy, a operacje są wykonywane jako transakcje
+SQLite zamiast dopisywania do dziennika. Kompakcja (po
+przekroczeniu rozmiaru dziennika albo ręcznie: python map_store.py compact)
+zapisuje nową migawkę i zaczyna pusty dziennik.
+
+Pierwsza linia dziennika to nagłówek z numerem generacji migawki, do której
+odnoszą się operacje. Numer generacji jest zapisany też w migawce
+(metadata.journal_generation). Dziennik innej generacji jest pomijany przy
+wczytywaniu: po przerwanej kompakcji jego operacje są już w migawce.
+
+Użycie:
+    python map_store.py status [gps_paths.json]
+    python map_store.py compact [gps_paths.json]
+    python map_store.py check [gps_paths.json]   # dziennik przez MapModel.apply == apply_op
+"""
+import copy
+import json
+import os
+import sys
+from collections import Counter
+from typing import Dict, List, Optional
+
+from floor_shards import LazyFloors, is_sharded, open_sharded, write_sharded
+
+
+DEFAULT_COMPACT_BYTES = 1 << 20  # Kompakcja po przekroczeniu 1 MB dziennika
+DEFAULT_COMPACT_ENTRIES = 5000  # ... albo tylu operacji
+
+FLOOR_KEYS = ('paths', 'connections', 'point_labels')
+
+
+def journal_filename(map_filename: str) -> str:
+    """Ścieżka dziennika zmian obok pliku mapy"""
+    base, _ = os.path.splitext(map_filename)
+    return base + ".journal.jsonl"
+
+
+def database_filename(map_filename: str) -> str:
+    """Ścieżka bazy SQLite mapy obok pliku mapy"""
+    base, _ = os.path.splitext(map_filename)
+    return base + ".db"
+
+
+def map_exists(map_filename: str) -> bool:
+    """Czy istnieje mapa (plik JSON albo baza SQLite)"""
+    return os.path.exists(map_filename) or os.path.exists(database_filename(map_filename))
+
+
+def floor_section(data: dict, floor: str, create: bool = True) -> Optional[dict]:
+    """Dane piętra (stary format jednopiętrowy to piętro "0" w korzeniu)"""
+    if 'floors' not in data:
+        return data if str(floor) == "0" else None
+    floors = data['floors']
+    if str(floor) not in floors:
+        if not create:
+            return None
+        floors[str(floor)] = {'paths': [], 'connections': [], 'point_labels': {}}
+    return floors[str(floor)]
+
+
+def _same_id(a, b) -> bool:
+    return str(a) == str(b)
+
+
+def apply_op(data: dict, op: dict):
+    """Wykonuje jedną operację dziennika na danych mapy (w miejscu)"""
+    kind = op['op']
+
+    if kind == 'add_transition':
+        data.setdefault('floor_transitions', []).append(op['transition'])
+        return
+    if kind == 'delete_transition':
+        transitions = data.get('floor_transitions', [])
+        if op['transition'] in transitions:
+            transitions.remove(op['transition'])
+        return
+    if kind == 'set_building_info':
+        data['building_info'] = op['building_info']
+        return
+    if kind == 'set_floor':
+        if op['data'] is None:
+            data.get('floors', {}).pop(str(op['floor']), None)
+        else:
+            data.setdefault('floors', {})[str(op['floor'])] = op['data']
+        return
+
+    floor = floor_section(data, op['floor'])
+    if floor is None:
+        raise ValueError(f"brak piętra {op['floor']} w mapie starego formatu")
+    paths = floor.setdefault('paths', [])
+    connections = floor.setdefault('connections', [])
+    labels = floor.setdefault('point_labels', {})
+
+    if kind == 'add_path':
+        paths.append(op['path'])
+    elif kind == 'set_path':
+        for i, path in enumerate(paths):
+            if _same_id(path.get('id'), op['path'].get('id')):
+                paths[i] = op['path']
+                break
+        else:
+            paths.append(op['path'])
+    elif kind == 'delete_path':
+        floor['paths'] = [p for p in paths if not _same_id(p.get('id'), op['path_id'])]
+    elif kind == 'add_point':
+        for path in paths:
+            if _same_id(path.get('id'), op['path_id']):
+                path.setdefault('points', []).append(op['point'])
+                break
+        else:
+            raise ValueError(f"brak ścieżki {op['path_id']} na piętrze {op['floor']}")
+    elif kind == 'delete_node':
+        # Usunięcie węzła usuwa też jego połączenia, etykietę i przejścia
+        point_id = op['point_id']
+        for path in paths:
+            path['points'] = [p for p in path.get('points', []) if not _same_id(p.get('id'), point_id)]
+        floor['connections'] = [c for c in connections
+                                if not _same_id(c['from'], point_id) and not _same_id(c['to'], point_id)]
+        labels.pop(str(point_id), None)
+        if 'floor_transitions' in data:
+            data['floor_transitions'] = [
+                t for t in data['floor_transitions']
+                if not (_same_id(t.get('from_floor'), op['floor']) and _same_id(t.get('from_point'), point_id))
+                and not (_same_id(t.get('to_floor'), op['floor']) and _same_id(t.get('to_point'), point_id))]
+    elif kind == 'add_connection':
+        connections.append(op['connection'])
+    elif kind == 'delete_connection':
+        if op['connection'] in connections:
+            connections.remove(op['connection'])
+    elif kind == 'set_label':
+        if op['label'] is None:
+            labels.pop(str(op['point_id']), None)
+        else:
+            labels[str(op['point_id'])] = op['label']
+    else:
+        raise ValueError(f"nieznana operacja dziennika: {kind}")
+
+
+def _canonical(item) -> str:
+    return json.dumps(item, sort_keys=True, ensure_ascii=False)
+
+
+def _list_diff(old: list, new: list):
+    """(usunięte, dodane) elementy list porównywanych jako multizbiory"""
+    old_counts = Counter(_canonical(item) for item in old)
+    new_counts = Counter(_canonical(item) for item in new)
+    removed, added = [], []
+    for item in old:
+        key = _canonical(item)
+        if old_counts[key] > new_counts[key]:
+            old_counts[key] -= 1
+            removed.append(item)
+    for item in new:
+        key = _canonical(item)
+        if new_counts[key] > old_counts[key]:
+            new_counts[key] -= 1
+            added.append(item)
+    return removed, added
+
+
+def _floor_point_ids(floor: dict) -> set:
+    return {str(p['id']) for path in floor.get('paths', []) for p in path.get('points', [])}
+
+
+def _unique_path_ids(floor: dict) -> bool:
+    ids = [str(p.get('id')) for p in floor.get('paths', [])]
+    return len(ids) == len(set(ids))
+
+
+def _diff_floor(floor_id: str, old: dict, new: dict, transitions: list) -> List[dict]:
+    """Operacje zmieniające piętro old w new (transitions: przejścia po usunięciach)"""
+    if old == new:
+        return []
+    if not _unique_path_ids(old) or not _unique_path_ids(new):
+        # Powtórzone ID ścieżek - zmiany piętra nie da się przypisać do ścieżek
+        return [{'op': 'set_floor', 'floor': floor_id, 'data': new}]
+
+    ops = []
+    # Usunięte węzły (kaskadowo z połączeniami, etykietami i przejściami)
+    removed_nodes = _floor_point_ids(old) - _floor_point_ids(new)
+    for point_id in sorted(removed_nodes):
+        ops.append({'op': 'delete_node', 'floor': floor_id, 'point_id': point_id})
+    if removed_nodes:
+        old = copy.deepcopy(old)
+        data = {'floors': {floor_id: old}, 'floor_transitions': transitions}
+        for op in ops:
+            apply_op(data, op)
+        transitions[:] = data['floor_transitions']
+
+    old_paths = {str(p.get('id')): p for p in old.get('paths', [])}
+    new_ids = set()
+    for path in new.get('paths', []):
+        path_id = str(path.get('id'))
+        new_ids.add(path_id)
+        before = old_paths.get(path_id)
+        if before is None:
+            ops.append({'op': 'add_path', 'floor': floor_id, 'path': path})
+        elif before != path:
+            old_points = before.get('points', [])
+            new_points = path.get('points', [])
+            same_rest = ({k: v for k, v in before.items() if k != 'points'}
+                         == {k: v for k, v in path.items() if k != 'points'})
+            if same_rest and new_points[:len(old_points)] == old_points:
+                for point in new_points[len(old_points):]:
+                    ops.append({'op': 'add_point', 'floor': floor_id,
+                                'path_id': path.get('id'), 'point': point})
+            else:
+                ops.append({'op': 'set_path', 'floor': floor_id, 'path': path})
+    for path_id, path in old_paths.items():
+        if path_id not in new_ids:
+            ops.append({'op': 'delete_path', 'floor': floor_id, 'path_id': path.get('id')})
+
+    removed, added = _list_diff(old.get('connections', []), new.get('connections', []))
+    ops.extend({'op': 'delete_connection', 'floor': floor_id, 'connection': c} for c in removed)
+    ops.extend({'op': 'add_connection', 'floor': floor_id, 'connection': c} for c in added)
+
+    old_labels = old.get('point_labels', {})
+    new_labels = new.get('point_labels', {})
+    for point_id, label in new_labels.items():
+        if old_labels.get(point_id) != label:
+            ops.append({'op': 'set_label', 'floor': floor_id, 'point_id': point_id, 'label': label})
+    for point_id in old_labels:
+        if point_id not in new_labels:
+            ops.append({'op': 'set_label', 'floor': floor_id, 'point_id': point_id, 'label': None})
+    return ops
+
+
+def diff_maps(old: dict, new: dict) -> Optional[List[dict]]:
+    """Operacje dziennika zmieniające mapę old w new.
+
+    Zwraca None, gdy zmian nie da się zapisać operacjami (zmiana formatu
+    pliku) - wtedy trzeba zapisać migawkę.
+    """
+    if ('floors' in old) != ('floors' in new):
+        return None
+    multifloor = 'floors' in new
+    old_floors = old['floors'] if multifloor else {"0": old}
+    new_floors = new['floors'] if multifloor else {"0": new}
+
+    def extra(floor: dict) -> dict:
+        return {k: v for k, v in floor.items() if k not in FLOOR_KEYS}
+
+    ops = []
+    transitions = copy.deepcopy(old.get('floor_transitions', []))
+    if multifloor and old.get('building_info') != new.get('building_info'):
+        ops.append({'op': 'set_building_info', 'building_info': new.get('building_info')})
+
+    for floor_id, floor in new_floors.items():
+        before = old_floors.get(floor_id)
+        if before is None or (multifloor and extra(before) != extra(floor)):
+            ops.append({'op': 'set_floor', 'floor': floor_id, 'data': floor})
+            continue
+        floor_ops = _diff_floor(floor_id, before, floor, transitions)
+        if not multifloor and any(op['op'] == 'set_floor' for op in floor_ops):
+            return None
+        ops.extend(floor_ops)
+    for floor_id in old_floors:
+        if floor_id not in new_floors:
+            ops.append({'op': 'set_floor', 'floor': floor_id, 'data': None})
+
+    removed, added = _list_diff(transitions, new.get('floor_transitions', []))
+    ops.extend({'op': 'delete_transition', 'transition': t} for t in removed)
+    ops.extend({'op': 'add_transition', 'transition': t} for t in added)
+    return ops
+
+
+class MapStore:
+    """Plik mapy z dziennikiem zmian: load / append / compact"""
+
+    def __init__(self, filename: str = "gps_paths.json",
+                 compact_bytes: int = DEFAULT_COMPACT_BYTES,
+                 compact_entries: int = DEFAULT_COMPACT_ENTRIES,
+                 use_database: bool = True):
+        self.filename = filename
+        self.journal = journal_filename(filename)
+        self.compact_bytes = compact_bytes
+        self.compact_entries = compact_entries
+        self.entries = 0  # Operacje w dzienniku (od ostatniego wczytania)
+        self.base = None  # Generacja migawki, do której dopisujemy operacje
+        self.database = None  # Baza SQLite mapy (map_db.py), gdy istnieje
+        if use_database and os.path.exists(database_filename(filename)):
+            from map_db import MapDatabase  # Import na miejscu: map_db korzysta z tego modułu
+            self.database = MapDatabase(database_filename(filename))
+
+    @staticmethod
+    def generation(data: dict) -> int:
+        """Numer generacji migawki"""
+        return int(data.get('metadata', {}).get('journal_generation', 0))
+
+    def _read_journal(self, generation: int) -> List[dict]:
+        """Operacje dziennika należące do danej generacji migawki"""
+        if not os.path.exists(self.journal):
+            return []
+        ops = []
+        with open(self.journal, 'r', encoding='utf-8') as f:
+            header = f.readline()
+            try:
+                base = json.loads(header).get('base') if header.strip() else None
+            except ValueError:
+                base = None
+            if base != generation:
+                if header.strip():
+                    print(f"⚠ Pominięto dziennik innej migawki: {self.journal}")
+                return []
+            for line_number, line in enumerate(f, 2):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    # Przerwany zapis ostatniej operacji
+                    print(f"⚠ Pominięto uszkodzoną linię {line_number} dziennika {self.journal}")
+        return ops
+
+    def load(self) -> dict:
+        """Migawka mapy z odtworzonymi operacjami dziennika"""
+        if self.database is not None:
+            self.entries = 0
+            return self.database.load()
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if 'floor_files' in data:
+            data = open_sharded(self.filename, data)  # Operacje wczytają tylko swoje piętra
+        self.base = self.generation(data)
+        ops = self._read_journal(self.base)
+        for op in ops:
+            apply_op(data, op)
+        self.entries = len(ops)
+        return data
+
+    def _journal_base(self) -> Optional[int]:
+        """Generacja zapisana w nagłówku dziennika (None gdy brak dziennika)"""
+        if not os.path.exists(self.journal):
+            return None
+        with open(self.journal, 'r', encoding='utf-8') as f:
+            header = f.readline()
+        try:
+            return json.loads(header).get('base')
+        except (ValueError, AttributeError):
+            return None
+
+    def _torn_tail(self) -> bool:
+        """Czy dziennik kończy się niedokończoną linią"""
+        with open(self.journal, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b'\n'
+
+    def _snapshot_generation(self) -> int:
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            return self.generation(json.load(f))
+
+    def append(self, ops: List[dict]):
+        """Dopisuje operacje do dziennika (jeden zapis, fsync)"""
+        if not ops:
+            return
+        if self.database is not None:
+            self.database.apply(ops)  # Jedna transakcja
+            return
+        base = self._journal_base()
+        if base is None or base != self.base:
+            # Dziennik nowy, po kompakcji w innym programie albo nieaktualny
+            self.base = self._snapshot_generation()
+        mode = 'a'
+        lines = []
+        if base != self.base:
+            mode = 'w'  # Operacje starego dziennika są już w migawce
+            lines.append(json.dumps({'base': self.base}))
+        elif self._torn_tail():
+            lines.append('')  # Zakończ przerwaną linię, żeby nie skleiła się z nową operacją
+        lines.extend(json.dumps(op, ensure_ascii=False, separators=(',', ':')) for op in ops)
+        with open(self.journal, mode, encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries += len(ops)
+        if self.should_compact():
+            self.compact()
+
+    def save(self, baseline: dict, data: dict) -> int:
+        """Zapisuje zmiany baseline -> data jako operacje (albo migawkę); zwraca liczbę operacji"""
+        if self.database is not None:
+            exists = not self.database.is_empty()
+        else:
+            exists = os.path.exists(self.filename)
+        ops = diff_maps(baseline, data) if exists else None
+        if ops is None:
+            self.write_snapshot(data)
+            return 0
+        self.append(ops)
+        return len(ops)
+
+    def should_compact(self) -> bool:
+        """Czy dziennik przekroczył próg rozmiaru lub liczby operacji"""
+        if self.entries >= self.compact_entries:
+            return True
+        return os.path.exists(self.journal) and os.path.getsize(self.journal) >= self.compact_bytes
+
+    def write_snapshot(self, data: dict):
+        """Zapisuje pełną migawkę (atomowo) i zaczyna nowy dziennik"""
+        if self.database is not None:
+            self.database.replace(data)
+            return
+        previous = 0
+        if os.path.exists(self.filename):
+            try:
+                previous = self._snapshot_generation()
+            except (OSError, ValueError):
+                pass
+        generation = max(previous, self.generation(data)) + 1
+        data.setdefault('metadata', {})['journal_generation'] = generation
+
+        if is_sharded(self.filename) or isinstance(data.get('floors'), LazyFloors):
+            written = write_sharded(self.filename, data, generation)
+            print(f"✓ Zapisano manifest {self.filename} i {written}/{len(data['floors'])} plików pięter")
+        else:
+            tmp = self.filename + ".tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.filename)
+
+        # Dziennik poprzedniej generacji jest już zbędny
+        if os.path.exists(self.journal):
+            os.remove(self.journal)
+        self.base = generation
+        self.entries = 0
+
+    def compact(self):
+        """Wkłada dziennik do nowej migawki (stan wczytany z dysku)"""
+        if self.database is not None:
+            self.database.compact()
+            print(f"✓ Kompakcja bazy {self.database.filename}")
+            return
+        data = self.load()
+        entries = self.entries
+        self.write_snapshot(data)
+        print(f"✓ Kompakcja mapy {self.filename}: {entries} operacji w nowej migawce")
+
+    def status(self) -> Dict[str, int]:
+        """Rozmiary migawki i dziennika"""
+        journal_size = os.path.getsize(self.journal) if os.path.exists(self.journal) else 0
+        generation = self._snapshot_generation()
+        return {
+            'generation': generation,
+            'snapshot_bytes': os.path.getsize(self.filename),
+            'journal_bytes': journal_size,
+            'journal_entries': len(self._read_journal(generation))
+        }
+
+
+def read_map(filename: str) -> dict:
+    """Wczytuje mapę razem z dziennikiem zmian"""
+    return MapStore(filename).load()
+
+
+def check_model(store: MapStore) -> bool:
+    """Czy MapModel.apply daje z operacji dziennika te same dane co apply_op"""
+    from map_model import MapModel  # Import na miejscu: map_model korzysta z tego modułu
+    from routing import as_building
+
+    with open(store.filename, 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    if 'floor_files' in snapshot:
+        snapshot = open_sharded(store.filename, snapshot)
+        snapshot['floors'] = dict(snapshot['floors'])  # Wszystkie piętra (kopiowane niżej)
+    ops = store._read_journal(store.generation(snapshot))
+
+    expected = as_building(copy.deepcopy(snapshot))
+    expected.setdefault('floor_transitions', [])
+    for op in copy.deepcopy(ops):
+        apply_op(expected, op)
+    model = MapModel(copy.deepcopy(snapshot))
+    model.apply(copy.deepcopy(ops))
+    return model.data == expected
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('status', 'compact', 'check'):
+        print(__doc__)
+        return
+    filename = sys.argv[2] if len(sys.argv) > 2 else "gps_paths.json"
+    store = MapStore(filename)
+    if sys.argv[1] == 'compact':
+        store.compact()
+    if sys.argv[1] == 'check':
+        if store.database is not None:
+            print(f"⚠ Mapa w bazie {store.database.filename} nie ma dziennika do sprawdzenia")
+        elif check_model(store):
+            print(f"✓ MapModel.apply i apply_op dają tę samą mapę ({filename})")
+        else:
+            print(f"✗ MapModel.apply i apply_op dają różne mapy ({filename})")
+            sys.exit(1)
+        return
+    if store.database is not None:
+        counts = store.database.status()
+        print(f"Baza: {store.database.filename} ({os.path.getsize(store.database.filename)} B)")
+        print("  " + ", ".join(f"{table}: {count}" for table, count in counts.items()))
+        return
+    status = store.status()
+    print(f"Migawka: {filename} (generacja {status['generation']}, {status['snapshot_bytes']} B)")
+    print(f"Dziennik: {store.journal} ({status['journal_entries']} operacji, {status['journal_bytes']} B)")
+
+
+if __name__ == "__main__":
+    main()
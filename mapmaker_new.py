@@ -1,12 +1,16 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
 import math
-import json
+import copy
+
+from map_store import MapStore
 
 class GPSPathSimulator:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Symulator Ścieżek GPS - Multi-Floor (Wiele Pięter)")
+    def __init__(self, root, shell=None):
+        self.root = root  # Okno albo karta powłoki (app_shell.py)
+        self.shell = shell  # Powłoka ze wspólną sesją mapy (None = osobne okno)
+        if shell is None:
+            self.root.title("Symulator Ścieżek GPS - Multi-Floor (Wiele Pięter)")
         
         # Parametry
         self.point_radius = 4
@@ -21,6 +25,7 @@ class GPSPathSimulator:
             "2": {"paths": [], "connections": [], "point_labels": {}, "next_id": 1}
         }
         self.floor_transitions = []  # Przejścia między piętrami
+        self.saved_graph = None  # Ostatnio zapisany graf (kolejne zapisy trafiają do dziennika)
         
         # Legacy variables (for current floor)
         self.points = []  # Wszystkie punkty GPS na aktywnym piętrze
@@ -471,8 +476,15 @@ class GPSPathSimulator:
         }
         
         filename = 'gps_paths.json'
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(graph_data, f, indent=2, ensure_ascii=False)
+        if self.shell is not None:
+            # Nowa mapa od razu trafia do wszystkich narzędzi powłoki
+            self.shell.replace_map(graph_data)
+        elif self.saved_graph is None:
+            # Pierwszy zapis w tej sesji zastępuje mapę nową migawką
+            MapStore(filename).write_snapshot(graph_data)
+        else:
+            MapStore(filename).save(self.saved_graph, graph_data)
+        self.saved_graph = copy.deepcopy(graph_data)
         
         # Statystyki
         total_paths = sum(len(self.floors[f]['paths']) for f in self.floors)
@@ -695,6 +707,10 @@ USTAWIENIA:
     
     def return_to_menu(self):
         """Zamyka aplikację i wraca do menu głównego"""
+        if self.shell is not None:
+            self.shell.show_menu()  # W powłoce narzędzie zostaje otwarte w swojej karcie
+            return
+        
         from tkinter import messagebox
         import subprocess
         import sys
@@ -5,14 +5,18 @@ import sys
 import os
 
 class MainMenu:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("GPS Navigation System - Menu Główne")
-        self.root.geometry("600x700")
+    def __init__(self, root, shell=None):
+        self.root = root  # Okno albo karta powłoki (app_shell.py)
+        self.shell = shell  # Powłoka otwierająca narzędzia w kartach (None = osobne procesy)
+        self.authenticated = False  # Hasło administratora podane w tym uruchomieniu
         self.root.configure(bg='#f5f5f5')
         
-        # Centruj okno
-        self.center_window()
+        if shell is None:
+            self.root.title("GPS Navigation System - Menu Główne")
+            self.root.geometry("600x700")
+            
+            # Centruj okno
+            self.center_window()
         
         self.setup_ui()
     
@@ -158,9 +162,10 @@ class MainMenu:
     
     def launch_app(self, command, require_auth):
         """Uruchamia aplikację z opcjonalną autoryzacją"""
-        if require_auth:
+        if require_auth and not self.authenticated:
             if not self.authenticate():
                 return
+            self.authenticated = True
         
         command()
     
@@ -197,7 +202,14 @@ class MainMenu:
         self.open_app("map_manager.py", "Map Manager")
     
     def open_app(self, filename, app_name):
-        """Otwiera wybraną aplikację jako osobny proces"""
+        """Otwiera wybraną aplikację (w karcie powłoki albo jako osobny proces)"""
+        if self.shell is not None:
+            try:
+                self.shell.open_tool(filename, app_name)
+            except Exception as e:
+                messagebox.showerror("Błąd", f"Nie udało się uruchomić {app_name}:\n{e}")
+            return
+        
         script_dir = os.path.dirname(os.path.abspath(__file__))
         app_path = os.path.join(script_dir, filename)
         
@@ -221,9 +233,9 @@ class MainMenu:
             messagebox.showerror("Błąd", f"Nie udało się uruchomić {app_name}:\n{e}")
 
 def main():
-    root = tk.Tk()
-    app = MainMenu(root)
-    root.mainloop()
+    # Wszystkie narzędzia w kartach jednego okna (app_shell.py importuje menu)
+    from app_shell import main as shell_main
+    shell_main()
 
 if __name__ == "__main__":
     main()
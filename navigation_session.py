@@ -0,0 +1,404 @@
+"""Sesja nawigacji po trasie niezależna od Tkinter.
+
+NavigationSession przyjmuje kolejne próbki pozycji użytkownika (x, y, piętro)
+i zwraca listę zdarzeń: osiągnięty punkt trasy, wskazówka, odstępstwo od
+trasy, przejście między piętrami, zmiana piętra i dotarcie do celu (z oceną
+zgodności z trasą). GPS Navigator jest tylko widokiem tych zdarzeń, a
+symulacje i odtwarzanie nagranych przejść używają sesji bez GUI.
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from route_progress import RouteProgress, RouteProgressTracker
+
+
+DEFAULT_PROXIMITY_THRESHOLD = 30  # Odległość w px do uznania że użytkownik dotarł
+DEFAULT_DEVIATION_THRESHOLD = 50  # Odległość od trasy uznawana za odstępstwo
+POSITION_HISTORY = 10  # Ostatnie pozycje pamiętane do wyznaczenia kierunku
+DIRECTION_SAMPLES = 5  # Kierunek ruchu liczony z tylu ostatnich pozycji
+
+
+def node_floor(node: str) -> Optional[str]:
+    """Piętro z ID węzła "piętro_punkt" (None dla starego formatu)"""
+    return node.split('_')[0] if '_' in node else None
+
+
+def resolve_transitions(route: List[str], path_segments: List[dict]):
+    """Przejścia między piętrami: ({(from, to): typ}, {indeks na trasie: typ})"""
+    segment_transitions = {}
+    for segment in path_segments:
+        if segment.get('is_floor_transition', False):
+            key = (segment.get('from'), segment.get('to'))
+            segment_transitions[key] = segment.get('transition_type', 'stairs')
+
+    route_transitions = {}
+    for i in range(len(route) - 1):
+        floor_from, floor_to = node_floor(route[i]), node_floor(route[i + 1])
+        if floor_from is not None and floor_to is not None and floor_from != floor_to:
+            route_transitions[i] = segment_transitions.get(
+                (route[i], route[i + 1]), 'stairs')  # Domyślnie schody
+    return segment_transitions, route_transitions
+
+
+@dataclass
+class RouteCompliance:
+    """Ocena, czy użytkownik przeszedł sugerowaną trasą"""
+    compliant: bool
+    deviated: bool
+    all_visited: bool
+    in_order: bool
+    missing_nodes: List[str] = field(default_factory=list)
+    corrected: bool = False  # Brakujący punkt przejścia uzupełniono automatycznie
+
+
+@dataclass
+class WaypointReached:
+    """Użytkownik osiągnął (lub minął) punkt trasy"""
+    index: int
+    node: str
+    next_node: Optional[str]  # None gdy to był ostatni punkt
+
+
+@dataclass
+class Guidance:
+    """Wskazówka do bieżącego punktu trasy"""
+    index: int
+    node: str
+    dx: float
+    dy: float
+    distance: float
+    direction: Optional[float]  # Kierunek ruchu użytkownika (radiany) lub None
+    progress: Optional[RouteProgress]
+
+
+@dataclass
+class Deviation:
+    """Użytkownik zboczył z trasy (exploring - bardzo daleko, nowe szlaki)"""
+    offset: float
+    exploring: bool
+
+
+@dataclass
+class FloorTransition:
+    """Użytkownik zbliża się do przejścia między piętrami (reached - jest na miejscu)"""
+    node: str
+    next_node: str
+    from_floor: str
+    to_floor: str
+    transition_type: str
+    distance: float
+    reached: bool
+
+
+@dataclass
+class FloorChanged:
+    """Sesja przeszła na inne piętro"""
+    floor: str
+    previous_floor: Optional[str]
+
+
+@dataclass
+class Arrived:
+    """Użytkownik dotarł do celu"""
+    compliance: RouteCompliance
+
+
+class NavigationSession:
+    """Stan nawigacji po jednej trasie (bez GUI)"""
+
+    def __init__(self, route: List[str], nodes_coords: Dict[str, dict],
+                 path_segments: Optional[List[dict]] = None,
+                 proximity_threshold: float = DEFAULT_PROXIMITY_THRESHOLD,
+                 deviation_threshold: float = DEFAULT_DEVIATION_THRESHOLD,
+                 floor: Optional[str] = None):
+        self.proximity_threshold = proximity_threshold
+        self.deviation_threshold = deviation_threshold
+        self._set_route(route, nodes_coords, path_segments)
+        self.start_floor = floor if floor is not None else (
+            node_floor(self.route[0]) if self.route else None)
+        self.reset()
+
+    def _set_route(self, route: List[str], nodes_coords: Dict[str, dict],
+                   path_segments: Optional[List[dict]]):
+        self.route = list(route)
+        self.nodes_coords = nodes_coords
+        self.path_segments = path_segments or []
+        self.tracker = RouteProgressTracker(self.route, nodes_coords, self.path_segments)
+        self.segment_transitions, self.route_transitions = resolve_transitions(
+            self.route, self.path_segments)
+
+    def reset(self):
+        """Wraca na początek trasy (nowa nawigacja)"""
+        self.current_path_index = 0
+        self.current_floor = self.start_floor
+        self.visited_nodes: List[str] = []
+        self.deviated = False  # Użytkownik choć raz zboczył z trasy
+        self.off_route = False  # Użytkownik jest teraz poza trasą
+        self.user_position: Optional[Tuple[float, float]] = None
+        self.user_direction: Optional[float] = None
+        self.last_positions: List[Tuple[float, float]] = []
+        self.progress: Optional[RouteProgress] = None
+        self.step = 0.0  # Droga przebyta przez użytkownika od poprzedniej aktualizacji
+        # Ciągły ruch wzdłuż trasy: (najmniejszy i ostatni dystans wzdłuż trasy)
+        self.route_run: Optional[Tuple[float, float]] = None
+        self.transition_alert_shown = False
+        self.finished = False
+        self.compliance: Optional[RouteCompliance] = None
+        self.reroutes = 0  # Liczba zmian trasy w trakcie nawigacji
+        self.tracker.reset()
+
+    def replace_route(self, route: List[str], nodes_coords: Dict[str, dict],
+                      path_segments: Optional[List[dict]] = None):
+        """Podmienia trasę w trakcie nawigacji (nowa trasa z bieżącej pozycji)"""
+        self._set_route(route, nodes_coords, path_segments)
+        self.current_path_index = 0
+        self.progress = None
+        self.route_run = None
+        self.transition_alert_shown = False
+        self.off_route = False  # Odstępstwo od nowej trasy wykrywane od nowa
+        self.reroutes += 1
+
+    def update(self, x: float, y: float, floor: Optional[str] = None) -> list:
+        """Przetwarza jedną próbkę pozycji"""
+        return self.process([(x, y)], floor)
+
+    def process(self, positions: Iterable[Tuple[float, float]],
+                floor: Optional[str] = None) -> list:
+        """Przetwarza paczkę próbek pozycji jedną aktualizacją nawigacji"""
+        if self.finished:
+            return []
+        events = []
+        if floor is not None and floor != self.current_floor:
+            events.extend(self._enter_floor(floor))
+
+        positions = list(positions)
+        if not positions:
+            return events
+        self.step = 0.0
+        previous = self.user_position
+        for x, y in positions:
+            if previous is not None:
+                self.step += math.hypot(x - previous[0], y - previous[1])
+            previous = (x, y)
+        self.last_positions.extend(positions)
+        if len(self.last_positions) > POSITION_HISTORY:
+            del self.last_positions[:-POSITION_HISTORY]
+        self.user_position = positions[-1]
+
+        # Kierunek ruchu z ostatnich pozycji
+        if len(self.last_positions) >= DIRECTION_SAMPLES:
+            old_x, old_y = self.last_positions[-DIRECTION_SAMPLES]
+            new_x, new_y = self.last_positions[-1]
+            dx, dy = new_x - old_x, new_y - old_y
+            if abs(dx) > 1 or abs(dy) > 1:  # Tylko jeśli jest ruch
+                self.user_direction = math.atan2(dy, dx)
+
+        events.extend(self._check())
+        return events
+
+    def pending_transition(self) -> Optional[Tuple[str, str, str, str]]:
+        """Przejście między piętrami będące następnym krokiem trasy: (węzeł, następny, z, do)"""
+        i = self.current_path_index
+        if i >= len(self.route) - 1 or i not in self.route_transitions:
+            return None
+        node, next_node = self.route[i], self.route[i + 1]
+        return node, next_node, node_floor(node), node_floor(next_node)
+
+    def change_floor(self) -> list:
+        """Przechodzi przez osiągnięte przejście na następne piętro trasy"""
+        transition = self.pending_transition()
+        if transition is None:
+            return []
+        self.current_path_index += 1
+        previous_floor = self.current_floor
+        self.current_floor = transition[3]
+        self.user_position = None
+        self.last_positions = []
+        self.route_run = None
+        self.transition_alert_shown = False
+        return [FloorChanged(self.current_floor, previous_floor)]
+
+    def _enter_floor(self, floor: str) -> list:
+        """Pozycja zgłoszona z innego piętra niż bieżące"""
+        transition = self.pending_transition()
+        if transition is not None and transition[3] == floor:
+            # Użytkownik przeszedł przejściem z trasy
+            if transition[0] not in self.visited_nodes:
+                self.visited_nodes.append(transition[0])
+            return self.change_floor()
+        previous_floor = self.current_floor
+        self.current_floor = floor
+        self.route_run = None
+        self.transition_alert_shown = False
+        return [FloorChanged(floor, previous_floor)]
+
+    def _visit(self, node: str):
+        if node not in self.visited_nodes:
+            self.visited_nodes.append(node)
+
+    def _arrive(self, events: list) -> list:
+        self.finished = True
+        self.compliance = self.check_compliance()
+        events.append(Arrived(self.compliance))
+        return events
+
+    def _check(self) -> list:
+        """Jedna aktualizacja nawigacji dla bieżącej pozycji"""
+        events = []
+        route = self.route
+        if not route:
+            return events
+        user_x, user_y = self.user_position
+        threshold = self.proximity_threshold
+
+        # PRIORYTET 1: Dotarcie do KOŃCOWEGO celu (nawet inną trasą)
+        final_target = route[-1]
+        final_coords = self.nodes_coords.get(final_target)
+        final_floor = node_floor(final_target)
+        if final_coords and (final_floor is None or final_floor == self.current_floor):
+            final_distance = math.hypot(final_coords['x'] - user_x, final_coords['y'] - user_y)
+            if final_distance <= threshold:
+                self._visit(final_target)
+                self.current_path_index = len(route)
+                return self._arrive(events)
+
+        # Rzut pozycji na trasę - minięte węzły uznaj za odwiedzone
+        self.progress = self.tracker.update(user_x, user_y, self.current_floor)
+        progress = self.progress
+        for i in range(self.current_path_index, self._passed_until(progress)):
+            self._visit(route[i])
+            events.append(WaypointReached(i, route[i], route[i + 1]))
+            self.current_path_index = i + 1
+
+        # PRIORYTET 1.5: Zbliża się przejście między piętrami
+        transition = self.pending_transition()
+        if transition is not None:
+            node, next_node, from_floor, to_floor = transition
+            coords = self.nodes_coords.get(node)
+            if coords:
+                distance = math.hypot(coords['x'] - user_x, coords['y'] - user_y)
+                if distance <= threshold * 1.5:  # Większy próg dla alertu
+                    reached = False
+                    if distance <= threshold and not self.transition_alert_shown:
+                        # Punkt przejścia odwiedzony PRZED zmianą piętra
+                        self.transition_alert_shown = True
+                        self._visit(node)
+                        reached = True
+                    events.append(FloorTransition(
+                        node, next_node, from_floor, to_floor,
+                        self.route_transitions[self.current_path_index], distance, reached))
+                    return events
+
+        # PRIORYTET 2: Postęp na trasie (punkty pośrednie)
+        if self.current_path_index >= len(route):
+            return events
+        index = self.current_path_index
+        target = route[index]
+        coords = self.nodes_coords.get(target)
+        if not coords:
+            return events
+        dx, dy = coords['x'] - user_x, coords['y'] - user_y
+        distance = math.hypot(dx, dy)
+
+        if distance <= threshold:
+            self.current_path_index += 1
+            self._visit(target)
+            next_node = route[index + 1] if index + 1 < len(route) else None
+            events.append(WaypointReached(index, target, next_node))
+            if next_node is None:
+                return self._arrive(events)
+            return events
+
+        # PRIORYTET 3: Wskazówki (chyba że użytkownik przeciera nowe szlaki)
+        deviation = self._check_deviation()
+        if deviation is not None and deviation.exploring:
+            events.append(deviation)
+            return events
+        events.append(Guidance(index, target, dx, dy, distance, self.user_direction, progress))
+        if deviation is not None:
+            events.append(deviation)
+        return events
+
+    def _passed_until(self, progress: Optional[RouteProgress]) -> int:
+        """Indeks pierwszego węzła trasy, którego użytkownik jeszcze nie minął.
+
+        Węzeł jest minięty, gdy dystans wzdłuż trasy przeszedł przez niego w
+        sposób ciągły: każdy krok rzutu jest najwyżej o próg dłuższy niż droga
+        przebyta przez użytkownika. Skok rzutu na dalszy odcinek (np. trasa
+        zawracająca obok) zaczyna ciągły ruch od nowa i zalicza najwyżej
+        węzły leżące na drodze przebytej od poprzedniej aktualizacji.
+        """
+        threshold = self.proximity_threshold
+        if progress is None or progress.offset > threshold:
+            self.route_run = None
+            return self.current_path_index
+        run = self.route_run
+        if run is None or progress.covered - run[1] > self.step + threshold:
+            low = progress.covered - self.step
+        else:
+            low = min(run[0], progress.covered)
+        self.route_run = (low, progress.covered)
+
+        prefix = self.tracker.prefix
+        index = self.current_path_index
+        while index < progress.next_node_index and low <= prefix[index] + threshold:
+            index += 1
+        return index
+
+    def _route_offset(self) -> Optional[float]:
+        """Odległość od trasy (bez rzutu na odcinek - od najbliższego węzła trasy na piętrze)"""
+        if self.progress is not None:
+            return self.progress.offset
+        index = self.tracker.node_index.get(self.current_floor)
+        nearest = index.nearest(*self.user_position) if index else None
+        return nearest[1] if nearest else None
+
+    def _check_deviation(self) -> Optional[Deviation]:
+        """Odstępstwo od trasy (zgłaszane ponownie dopiero po powrocie na trasę)"""
+        offset = self._route_offset()
+        if offset is None:  # Brak węzłów trasy na tym piętrze
+            return None
+        if self.off_route:
+            if offset <= self.deviation_threshold:
+                self.off_route = False
+            return None
+        if offset > self.deviation_threshold:
+            self.deviated = True
+            self.off_route = True
+            return Deviation(offset, offset > self.deviation_threshold * 2)
+        return None
+
+    def check_compliance(self) -> RouteCompliance:
+        """Sprawdza czy użytkownik odwiedził wszystkie punkty trasy w kolejności"""
+        expected_nodes = self.route
+        visited_nodes = self.visited_nodes
+        missing_nodes = [node for node in expected_nodes if node not in visited_nodes]
+        all_visited = not missing_nodes
+
+        in_order = True
+        last_index = -1
+        for node in expected_nodes:
+            if node not in visited_nodes:
+                in_order = False
+                break
+            visited_index = visited_nodes.index(node)
+            if visited_index < last_index:
+                in_order = False
+                break
+            last_index = visited_index
+
+        deviated = self.deviated
+        if not deviated and all_visited and in_order:
+            return RouteCompliance(True, False, True, True)
+
+        # Brakujący tylko punkt przejścia na poprzednim piętrze - uznaj za odwiedzony
+        if len(missing_nodes) == 1:
+            missing = missing_nodes[0]
+            index = expected_nodes.index(missing)
+            if index in self.route_transitions:
+                visited_nodes.append(missing)
+                return RouteCompliance(True, deviated, True, in_order,
+                                       missing_nodes, corrected=True)
+
+        return RouteCompliance(False, deviated, all_visited, in_order, missing_nodes)
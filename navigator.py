@@ -4,13 +4,30 @@ import json
 import math
 import datetime
 import os
+import time
+from collections import deque
 from typing import Dict, List, Tuple, Optional
 
+from canvas_layers import RouteLayer, TraceLayer
+from feedback_store import FeedbackStore
+from map_model import MapSession
+from map_store import map_exists
+from navigation_session import (Arrived, Deviation, FloorChanged, FloorTransition, Guidance,
+                                NavigationSession, WaypointReached)
+from path_simplify import DEFAULT_TOLERANCE, PolylineSimplifier, merge_close_points, simplify_polyline
+from spatial_index import GridIndex
+
+SPATIAL_CELL_SIZE = 50  # Bok komórki indeksu przestrzennego w pikselach
+DEFAULT_UPDATE_RATE = 30  # Maksymalna liczba aktualizacji nawigacji na sekundę
+LATENCY_SAMPLES = 200  # Liczba pomiarów opóźnienia do statystyk
+
 class GPSNavigator:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("GPS Navigator - Nawigacja wielopiętrowa")
-        self.root.geometry("1000x800")
+    def __init__(self, root, shell=None):
+        self.root = root  # Okno albo karta powłoki (app_shell.py)
+        self.shell = shell  # Powłoka ze wspólną sesją mapy (None = osobne okno)
+        if shell is None:
+            self.root.title("GPS Navigator - Nawigacja wielopiętrowa")
+            self.root.geometry("1000x800")
         
         # Multi-floor support
         self.floors = {}  # Dane wszystkich pięter
@@ -26,36 +43,49 @@ class GPSNavigator:
         self.path_segments = []
         self.nodes_coords = {}
         self.point_labels = {}  # Etykiety punktów (ID -> nazwa)
+        self.point_index = {}  # ID punktu (str) -> punkt aktualnego piętra
+        
+        # Sesja mapy: plik z dziennikiem, model, indeksy przestrzenne i graf tras
+        self.map_session = None
+        
+        # Stan nawigacji po trasie (postęp, odwiedzone punkty, odstępstwa)
+        self.session = NavigationSession([], {})
+        
+        # Zmiana trasy po zboczeniu (graf mapy i przyrostowe wyszukiwanie do celu)
+        self.routing_engine = None
+        self.reroute_search = None
+        self.reroute_revision = None  # Wersja grafu, dla której liczy reroute_search
         
         # Stan użytkownika
         self.user_position = None
-        self.current_path_index = 0
         self.is_drawing = False
-        self.drawn_path = []
+        self.trace_layer = None  # Narysowana ścieżka (łamana na canvas)
+        self.route_layer = None  # Trasa i znaczniki punktów trasy
         self.proximity_threshold = 30  # Odległość w pikselach do uznania że użytkownik dotarł
         
         # Ścieżki użytkowników do aktualizacji mapy
         self.user_paths_history = []  # Lista wszystkich przejść użytkowników
         self.current_user_path = []  # Aktualna ścieżka użytkownika
+        self.path_simplifier = PolylineSimplifier()  # Uproszczona ścieżka (na bieżąco)
         self.map_filename = None  # Nazwa pliku z mapą
-        
-        # Kierunek ruchu użytkownika (do nawigacji względnej)
-        self.user_direction = None  # Kąt w radianach
-        self.last_positions = []  # Ostatnie kilka pozycji do obliczenia kierunku
+        self.feedback_store = None  # Baza feedbacku (otwierana przy pierwszym zgłoszeniu)
         
         # Kontrola zgodności z trasą
         self.route_deviation_threshold = 50  # Odległość od trasy uznawana za odstępstwo
-        self.deviated_from_route = False  # Czy użytkownik zboczył z trasy
-        self.visited_nodes = []  # Węzły które użytkownik faktycznie odwiedził
         
         # Tryb wolnej eksploracji
         self.free_exploration_mode = False
         
-        # Alerty dla przejść między piętrami
-        self.floor_transition_alert_shown = False
-        self.next_transition = None  # Następne przejście na trasie
+        # Kolejka zdarzeń ruchu - nawigacja liczona najwyżej raz na klatkę
+        self.pending_positions = []  # [(x, y, czas zdarzenia)]
+        self.navigation_update_job = None  # Zaplanowane wywołanie after()
+        self.last_navigation_update = 0.0
+        self.latency_samples = deque(maxlen=LATENCY_SAMPLES)  # Opóźnienia w ms
+        self.events_per_update = deque(maxlen=LATENCY_SAMPLES)
         
         self.setup_ui()
+        self.trace_layer = TraceLayer(self.canvas, tag='user_path', fill='blue', width=4)
+        self.route_layer = RouteLayer(self.canvas)
         
         # Automatycznie wczytaj pliki przy starcie
         self.root.after(100, self.auto_load_files)
@@ -148,18 +178,39 @@ class GPSNavigator:
         
         tk.Frame(settings_frame, width=2, bg='gray').pack(side=tk.LEFT, fill=tk.Y, padx=15)
         
-        tk.Label(settings_frame, text="Próbkowanie ścieżki (co N-ty punkt):", 
+        tk.Label(settings_frame, text="Uproszczenie ścieżki (tolerancja):", 
                 bg='#e8f5e9', font=('Arial', 9)).pack(side=tk.LEFT, padx=5)
         
-        self.sampling_var = tk.IntVar(value=50)
-        sampling_slider = tk.Scale(settings_frame, from_=20, to=100, 
-                                   orient=tk.HORIZONTAL, variable=self.sampling_var,
-                                   length=150, command=self.update_sampling)
-        sampling_slider.pack(side=tk.LEFT, padx=5)
+        self.tolerance_var = tk.IntVar(value=int(DEFAULT_TOLERANCE))
+        tolerance_slider = tk.Scale(settings_frame, from_=2, to=30, 
+                                    orient=tk.HORIZONTAL, variable=self.tolerance_var,
+                                    length=150, command=self.update_tolerance)
+        tolerance_slider.pack(side=tk.LEFT, padx=5)
         
-        self.sampling_label = tk.Label(settings_frame, text="co 50", 
-                                       bg='#e8f5e9', font=('Arial', 9, 'bold'))
-        self.sampling_label.pack(side=tk.LEFT, padx=5)
+        self.tolerance_label = tk.Label(settings_frame, text=f"{int(DEFAULT_TOLERANCE)} px", 
+                                        bg='#e8f5e9', font=('Arial', 9, 'bold'))
+        self.tolerance_label.pack(side=tk.LEFT, padx=5)
+        
+        tk.Frame(settings_frame, width=2, bg='gray').pack(side=tk.LEFT, fill=tk.Y, padx=15)
+        
+        tk.Label(settings_frame, text="Aktualizacje/s:", 
+                bg='#e8f5e9', font=('Arial', 9)).pack(side=tk.LEFT, padx=5)
+        
+        self.update_rate_var = tk.IntVar(value=DEFAULT_UPDATE_RATE)
+        tk.Scale(settings_frame, from_=5, to=60, 
+                 orient=tk.HORIZONTAL, variable=self.update_rate_var,
+                 length=100).pack(side=tk.LEFT, padx=5)
+        
+        self.debug_overlay_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(settings_frame, text="Debug (opóźnienie)", variable=self.debug_overlay_var,
+                      bg='#e8f5e9', font=('Arial', 9),
+                      activebackground='#e8f5e9',
+                      command=self.update_debug_overlay).pack(side=tk.LEFT, padx=5)
+        
+        self.reroute_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(settings_frame, text="Nowa trasa po zboczeniu", variable=self.reroute_var,
+                      bg='#e8f5e9', font=('Arial', 9),
+                      activebackground='#e8f5e9').pack(side=tk.LEFT, padx=5)
         
         # Panel informacyjny - nawigacja
         self.nav_frame = tk.Frame(self.root, bg='#1976D2', pady=15)
@@ -204,34 +255,41 @@ class GPSNavigator:
     def update_threshold(self, value):
         """Aktualizuje próg bliskości"""
         self.proximity_threshold = int(value)
+        self.session.proximity_threshold = self.proximity_threshold
         self.threshold_label['text'] = f"{value} px"
     
-    def update_sampling(self, value):
-        """Aktualizuje częstotliwość próbkowania"""
-        self.sampling_label['text'] = f"co {value}"
+    def update_tolerance(self, value):
+        """Aktualizuje tolerancję upraszczania ścieżki"""
+        self.path_simplifier.tolerance = int(value)
+        self.tolerance_label['text'] = f"{value} px"
         
     def load_map(self):
         """Automatycznie wczytuje mapę z gps_paths.json (multi-floor support)"""
         filename = "gps_paths.json"
         
-        if not os.path.exists(filename):
+        if not map_exists(filename):  # JSON albo baza gps_paths.db
             messagebox.showerror("Błąd", 
                                f"Nie znaleziono pliku: {filename}\n\n"
                                f"Utwórz mapę w Map Maker najpierw.")
             return False
         
         self.map_filename = filename
+        self.routing_engine = None
+        self.reroute_search = None
             
         try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Sprawdź czy to nowy format wielopiętrowy
-            if 'floors' in data and 'building_info' in data:
-                # Nowy format - multi-floor
-                self.floors = data.get('floors', {})
-                self.floor_transitions = data.get('floor_transitions', [])
-                self.building_info = data.get('building_info', {})
+            # W powłoce mapa jest wczytana raz dla wszystkich narzędzi
+            if self.shell is not None:
+                self.map_session = self.shell.open_session()
+            else:
+                self.map_session = MapSession(filename, SPATIAL_CELL_SIZE)
+            model = self.map_session.model
+            
+            # Model trzyma mapę zawsze w formacie wielopiętrowym (stary format to piętro "0")
+            if model.floors:
+                self.floors = model.floors
+                self.floor_transitions = model.floor_transitions
+                self.building_info = model.building_info
                 
                 # Ustaw domyślne piętro
                 floor_list = list(self.floors.keys())
@@ -255,34 +313,17 @@ class GPSNavigator:
                 self.draw_map()
                 return True
             else:
-                # Stary format - single floor
-                self.all_paths = data.get('paths', [])
-                self.all_connections = data.get('connections', [])
-                self.point_labels = data.get('point_labels', {})
-                
-                # Konwertuj na multi-floor
-                self.floors = {
-                    "0": {
-                        "paths": self.all_paths,
-                        "connections": self.all_connections,
-                        "point_labels": self.point_labels
-                    }
-                }
-                self.floor_transitions = []
-                self.building_info = {"name": "Budynek", "floors": ["0"], "floor_names": {"0": "Parter"}}
-                self.current_floor = "0"
-                
-                print(f"✓ Wczytano mapę (stary format): {filename}")
-                print(f"  Ścieżki: {len(self.all_paths)}")
-                print(f"  Połączenia: {len(self.all_connections)}")
-                
-                self.draw_map()
-                return True
+                messagebox.showwarning("Pusta mapa", f"Mapa {filename} nie ma żadnego piętra.")
+                return False
             
         except Exception as e:
             messagebox.showerror("Błąd", f"Nie udało się wczytać mapy:\n{e}")
             return False
     
+    def floor_index(self, floor_id) -> Optional[GridIndex]:
+        """Indeks przestrzenny piętra (budowany przy pierwszym użyciu, aktualizowany przez model)"""
+        return self.map_session.spatial_indexes.floor(floor_id) if self.map_session else None
+    
     def load_floor_data(self, floor_id):
         """Wczytuje dane konkretnego piętra do zmiennych roboczych"""
         if floor_id not in self.floors:
@@ -292,6 +333,14 @@ class GPSNavigator:
         self.all_paths = floor_data.get('paths', [])
         self.all_connections = floor_data.get('connections', [])
         self.point_labels = floor_data.get('point_labels', {})
+        self.rebuild_point_index()
+    
+    def rebuild_point_index(self):
+        """Buduje indeks ID punktu -> punkt dla aktualnego piętra"""
+        self.point_index = {}
+        for path in self.all_paths:
+            for point in path['points']:
+                self.point_index.setdefault(str(point['id']), point)
     
     def on_floor_changed(self, event=None):
         """Obsługa zmiany wybranego piętra"""
@@ -309,12 +358,25 @@ class GPSNavigator:
             
             # Przerysuj mapę
             self.canvas.delete('all')
+            self.trace_layer.clear()
             self.draw_map()
             
             # Jeśli jest trasa, przerysuj ją dla nowego piętra
             if self.shortest_path:
                 self.draw_route()
     
+    def refresh_from_model(self):
+        """Przerysowuje mapę piętra po zmianach w innym narzędziu powłoki"""
+        if self.map_session is None:
+            return
+        if self.current_floor not in self.floors:
+            self.load_map()  # Mapa zastąpiona (np. w Map Maker) - od pierwszego piętra
+            return
+        self.load_floor_data(self.current_floor)
+        self.canvas.delete('map')
+        self.draw_map()
+        self.canvas.tag_lower('map')  # Trasa i ślad użytkownika nad mapą
+    
     def load_route(self):
         """Automatycznie wczytuje trasę z shortest_path.json (multi-floor support)"""
         filename = "shortest_path.json"
@@ -333,6 +395,7 @@ class GPSNavigator:
             self.shortest_path = path_data.get('path', [])
             self.path_segments = data.get('path_segments', [])
             self.nodes_coords = data.get('nodes_coordinates', {})
+            self.session = self.create_session()
             
             if not self.shortest_path:
                 messagebox.showwarning("Pusta trasa", "Nie znaleziono trasy w pliku!")
@@ -409,141 +472,29 @@ class GPSNavigator:
     
     def find_point_coords(self, point_id: str) -> Optional[Tuple[float, float]]:
         """Znajduje współrzędne punktu po ID"""
-        for path in self.all_paths:
-            for point in path['points']:
-                if str(point['id']) == point_id:
-                    return (point['x'], point['y'])
-        return None
+        point = self.point_index.get(str(point_id))
+        if point is None:
+            return None
+        return (point['x'], point['y'])
     
     def draw_route(self):
         """Rysuje trasę do przejścia (tylko punkty z aktualnego piętra)"""
         if not self.nodes_coords:
             return
         
-        # Usuń poprzednią trasę
-        self.canvas.delete('route')
-        self.canvas.delete('markers')
-        self.canvas.delete('floor_transition_marker')
-        
-        # Filtruj punkty do aktualnego piętra
-        route_on_floor = []
-        for node in self.shortest_path:
-            if '_' in node:
-                node_floor = node.split('_')[0]
-                if node_floor == self.route_floor:
-                    route_on_floor.append(node)
-            else:
-                # Stary format bez prefiksu piętra
-                route_on_floor.append(node)
-        
-        # Rysuj trasę jako czerwoną linię (tylko w obrębie piętra)
-        for i in range(len(self.shortest_path) - 1):
-            node_from = self.shortest_path[i]
-            node_to = self.shortest_path[i + 1]
-            
-            # Sprawdź czy oba punkty są na tym samym piętrze
-            if '_' in node_from and '_' in node_to:
-                floor_from = node_from.split('_')[0]
-                floor_to = node_to.split('_')[0]
-                
-                # Rysuj tylko jeśli oba na aktualnym piętrze
-                if floor_from == self.route_floor and floor_to == self.route_floor:
-                    if node_from in self.nodes_coords and node_to in self.nodes_coords:
-                        from_coords = self.nodes_coords[node_from]
-                        to_coords = self.nodes_coords[node_to]
-                        
-                        self.canvas.create_line(
-                            from_coords['x'], from_coords['y'],
-                            to_coords['x'], to_coords['y'],
-                            fill='red', width=5, tags='route'
-                        )
-            else:
-                # Stary format
-                if node_from in self.nodes_coords and node_to in self.nodes_coords:
-                    from_coords = self.nodes_coords[node_from]
-                    to_coords = self.nodes_coords[node_to]
-                    
-                    self.canvas.create_line(
-                        from_coords['x'], from_coords['y'],
-                        to_coords['x'], to_coords['y'],
-                        fill='red', width=5, tags='route'
-                    )
-        
-        # Zaznacz punkty (tylko z aktualnego piętra)
-        for i, node in enumerate(self.shortest_path):
-            # Sprawdź czy punkt jest na aktualnym piętrze
-            if '_' in node:
-                node_floor = node.split('_')[0]
-                if node_floor != self.route_floor:
-                    continue
-                node_id = node.split('_')[1]
-            else:
-                node_id = node
-            
-            if node in self.nodes_coords:
-                coords = self.nodes_coords[node]
-                x, y = coords['x'], coords['y']
-                
-                # Pobierz etykietę jeśli istnieje
-                label = self.point_labels.get(node_id, f"#{node_id}")
-                
-                # Sprawdź czy to punkt przejścia między piętrami
-                is_transition = self.is_floor_transition_point(node, i)
-                
-                if i == 0:  # Start
-                    self.canvas.create_oval(x-10, y-10, x+10, y+10,
-                                          fill='green', outline='darkgreen',
-                                          width=2, tags='markers')
-                    self.canvas.create_text(x, y-20, text=f'START\n{label}',
-                                          fill='green', font=('Arial', 9, 'bold'),
-                                          tags='markers')
-                elif i == len(self.shortest_path) - 1:  # Cel
-                    self.canvas.create_oval(x-10, y-10, x+10, y+10,
-                                          fill='red', outline='darkred',
-                                          width=2, tags='markers')
-                    self.canvas.create_text(x, y-20, text=f'CEL\n{label}',
-                                          fill='red', font=('Arial', 9, 'bold'),
-                                          tags='markers')
-                elif is_transition:  # Punkt przejścia między piętrami
-                    self.canvas.create_rectangle(x-12, y-12, x+12, y+12,
-                                                fill='purple', outline='darkviolet',
-                                                width=3, tags='floor_transition_marker')
-                    trans_icon = "🪜" if is_transition == "stairs" else "🛗"
-                    self.canvas.create_text(x, y-18, text=f'{trans_icon}\n{label}',
-                                          fill='purple', font=('Arial', 9, 'bold'),
-                                          tags='floor_transition_marker')
-                else:  # Punkt pośredni
-                    self.canvas.create_oval(x-6, y-6, x+6, y+6,
-                                          fill='orange', outline='darkorange',
-                                          width=2, tags='markers')
-                    # Pokazuj etykietę dla punktów pośrednich jeśli istnieje
-                    if node_id in self.point_labels:
-                        self.canvas.create_text(x, y-12, text=label,
-                                              fill='orange', font=('Arial', 7),
-                                              tags='markers')
+        self.route_layer.draw(self.shortest_path, self.nodes_coords, self.route_floor,
+                              self.point_labels, self.session.route_transitions,
+                              self.session.current_path_index)
+    
+    def create_session(self) -> NavigationSession:
+        """Tworzy sesję nawigacji dla wczytanej trasy"""
+        return NavigationSession(self.shortest_path, self.nodes_coords, self.path_segments,
+                                 proximity_threshold=self.proximity_threshold,
+                                 deviation_threshold=self.route_deviation_threshold)
     
     def is_floor_transition_point(self, node, node_index):
         """Sprawdza czy punkt jest przejściem między piętrami"""
-        if node_index >= len(self.shortest_path) - 1:
-            return False
-        
-        current_node = self.shortest_path[node_index]
-        next_node = self.shortest_path[node_index + 1]
-        
-        if '_' in current_node and '_' in next_node:
-            current_floor = current_node.split('_')[0]
-            next_floor = next_node.split('_')[0]
-            
-            if current_floor != next_floor:
-                # Znajdź typ przejścia
-                for segment in self.path_segments:
-                    if (segment.get('from') == current_node and 
-                        segment.get('to') == next_node and
-                        segment.get('is_floor_transition', False)):
-                        return segment.get('transition_type', 'stairs')
-                return 'stairs'  # Domyślnie schody
-        
-        return False
+        return self.session.route_transitions.get(node_index, False)
     
     def start_navigation(self):
         """Rozpoczyna nawigację"""
@@ -553,13 +504,13 @@ class GPSNavigator:
             return
         
         # Reset stanu
-        self.current_path_index = 0
-        self.drawn_path = []
+        self.session.reset()
+        self.session.current_floor = self.current_floor
         self.user_position = None
-        self.canvas.delete('user_path')
+        self.trace_layer.clear()
         self.canvas.delete('user_marker')
-        self.deviated_from_route = False
-        self.visited_nodes = []
+        if self.route_layer.reached:
+            self.draw_route()  # Znaczniki bez oznaczeń z poprzedniej nawigacji
         
         # Podłącz eventy myszy
         self.canvas.bind('<ButtonPress-1>', self.start_drawing)
@@ -588,14 +539,11 @@ class GPSNavigator:
         self.free_exploration_mode = True
         
         # Reset stanu
-        self.current_path_index = 0
-        self.drawn_path = []
         self.user_position = None
-        self.canvas.delete('user_path')
+        self.trace_layer.clear()
         self.canvas.delete('user_marker')
-        self.deviated_from_route = False
-        self.visited_nodes = []
         self.shortest_path = []  # Brak trasy do podążania
+        self.session = self.create_session()
         
         # Podłącz eventy myszy
         self.canvas.bind('<ButtonPress-1>', self.start_drawing)
@@ -620,51 +568,83 @@ class GPSNavigator:
         """Rozpoczyna rysowanie ścieżki użytkownika"""
         self.is_drawing = True
         self.user_position = (event.x, event.y)
-        self.drawn_path = [(event.x, event.y)]
+        self.trace_layer.start_stroke(event.x, event.y)
         self.current_user_path = [(event.x, event.y)]
+        self.path_simplifier.reset()
+        self.path_simplifier.add(event.x, event.y)
     
     def draw_user_path(self, event):
-        """Rysuje ścieżkę użytkownika"""
+        """Zapisuje pozycję z ruchu myszy; nawigacja jest liczona zbiorczo raz na klatkę"""
         if not self.is_drawing:
             return
         
-        # Dodaj punkt do ścieżki
+        # Każda próbka trafia do zapisu ścieżki, nawet jeśli nie będzie osobnej aktualizacji
         x, y = event.x, event.y
+        self.current_user_path.append((x, y))
+        self.path_simplifier.add(x, y)
+        self.pending_positions.append((x, y, time.perf_counter()))
+        self.schedule_navigation_update()
+    
+    def schedule_navigation_update(self):
+        """Planuje przetworzenie zebranych pozycji (najwyżej raz na 1/rate s)"""
+        if self.navigation_update_job is not None:
+            return
         
-        if self.drawn_path:
-            prev_x, prev_y = self.drawn_path[-1]
-            
-            # Rysuj linię
-            self.canvas.create_line(prev_x, prev_y, x, y,
-                                  fill='blue', width=4, tags='user_path')
+        interval = 1.0 / max(1, self.update_rate_var.get())
+        delay = self.last_navigation_update + interval - time.perf_counter()
+        if delay > 0:
+            self.navigation_update_job = self.root.after(int(delay * 1000), self.process_pending_positions)
+        else:
+            self.navigation_update_job = self.root.after_idle(self.process_pending_positions)
+    
+    def flush_pending_positions(self):
+        """Natychmiast przetwarza zaległe pozycje (np. po puszczeniu myszy)"""
+        if self.navigation_update_job is not None:
+            self.root.after_cancel(self.navigation_update_job)
+        self.process_pending_positions()
+    
+    def process_pending_positions(self):
+        """Rysuje zebrane pozycje i wykonuje jedną aktualizację nawigacji"""
+        self.navigation_update_job = None
+        positions = self.pending_positions
+        if not positions:
+            return
+        self.pending_positions = []
+        self.last_navigation_update = time.perf_counter()
         
-        self.drawn_path.append((x, y))
-        self.current_user_path.append((x, y))
-        self.user_position = (x, y)
-        
-        # Aktualizuj kierunek ruchu użytkownika
-        self.last_positions.append((x, y))
-        if len(self.last_positions) > 10:  # Zachowaj ostatnie 10 pozycji
-            self.last_positions.pop(0)
-        
-        # Oblicz kierunek z ostatnich pozycji
-        if len(self.last_positions) >= 5:
-            # Weź pierwszą i ostatnią pozycję z ostatnich 5
-            old_pos = self.last_positions[-5]
-            new_pos = self.last_positions[-1]
-            
-            dx = new_pos[0] - old_pos[0]
-            dy = new_pos[1] - old_pos[1]
-            
-            # Oblicz kąt ruchu użytkownika (w radianach)
-            if abs(dx) > 1 or abs(dy) > 1:  # Tylko jeśli jest ruch
-                self.user_direction = math.atan2(dy, dx)
+        # Dopisz próbki do łamanej ścieżki (jeden obiekt canvas)
+        for x, y, _ in positions:
+            self.trace_layer.add(x, y)
+        self.user_position = positions[-1][:2]
         
         # Sprawdź nawigację
-        self.check_navigation()
+        self.check_navigation([position[:2] for position in positions])
+        
+        # Opóźnienie: od najstarszego zdarzenia w paczce do gotowej wskazówki
+        self.latency_samples.append((time.perf_counter() - positions[0][2]) * 1000)
+        self.events_per_update.append(len(positions))
+        self.update_debug_overlay()
+    
+    def update_debug_overlay(self):
+        """Pokazuje statystyki opóźnienia zdarzenie -> wskazówka w rogu mapy"""
+        self.canvas.delete('debug_overlay')
+        if not self.debug_overlay_var.get() or not self.latency_samples:
+            return
+        
+        samples = sorted(self.latency_samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        average = sum(samples) / len(samples)
+        events = sum(self.events_per_update) / len(self.events_per_update)
+        self.canvas.create_text(
+            10, 10, anchor=tk.NW,
+            text=(f"Opóźnienie: śr {average:.1f} ms | p95 {p95:.1f} ms | max {samples[-1]:.1f} ms\n"
+                  f"Zdarzeń na aktualizację: {events:.1f} | limit {self.update_rate_var.get()}/s"),
+            font=('Courier', 9), fill='#D32F2F', tags='debug_overlay'
+        )
     
     def stop_drawing(self, event):
         """Kończy rysowanie ścieżki użytkownika"""
+        self.flush_pending_positions()
         self.is_drawing = False
         
         # Zaznacz aktualną pozycję
@@ -694,8 +674,8 @@ class GPSNavigator:
             self.nav_label['text'] = "Eksploracja zakończona"
             self.distance_label['text'] = ""
     
-    def check_navigation(self):
-        """Sprawdza postęp nawigacji i daje wskazówki"""
+    def check_navigation(self, positions):
+        """Przekazuje pozycje do sesji nawigacji i pokazuje zwrócone zdarzenia"""
         if not self.user_position:
             return
         
@@ -705,309 +685,243 @@ class GPSNavigator:
             self.distance_label['text'] = f"🗺️ Utworzono {path_length} punktów trasy"
             return
         
-        # PRIORYTET 1: Sprawdź czy użytkownik dotarł do KOŃCOWEGO celu (ostatni punkt)
-        final_target = self.shortest_path[-1] if self.shortest_path else None
-        
-        if final_target and final_target in self.nodes_coords:
-            final_coords = self.nodes_coords[final_target]
-            final_x, final_y = final_coords['x'], final_coords['y']
-            user_x, user_y = self.user_position
-            
-            final_distance = math.sqrt((final_x - user_x)**2 + (final_y - user_y)**2)
-            
-            # Jeśli użytkownik dotarł do końcowego celu (nawet inną trasą)
-            if final_distance <= self.proximity_threshold:
-                # Oznacz jako odwiedzony
-                if final_target not in self.visited_nodes:
-                    self.visited_nodes.append(final_target)
-                
-                # KONIEC NAWIGACJI
-                self.current_path_index = len(self.shortest_path)  # Ustaw na koniec
-                
+        self.show_navigation_events(self.session.process(positions, self.current_floor))
+    
+    def show_navigation_events(self, events):
+        """Widok zdarzeń sesji nawigacji (etykiety, znaczniki, dialogi)"""
+        for event in events:
+            if isinstance(event, WaypointReached):
+                # Oznacz osiągnięty punkt (tylko jego znacznik)
+                self.route_layer.mark_reached(event.index)
+                if event.next_node is not None:
+                    next_label = self.point_labels.get(event.next_node, f"punkt {event.next_node}")
+                    self.nav_label['text'] = f"✓ Dobra robota! Teraz idź do: {next_label}"
+            elif isinstance(event, Guidance):
+                self.show_guidance(event)
+            elif isinstance(event, Deviation):
+                if event.exploring:
+                    # Użytkownik przeciera nowe szlaki - bez wskazówek nawigacyjnych
+                    final_target = self.shortest_path[-1]
+                    target_label = self.point_labels.get(final_target, f"punkt {final_target}")
+                    self.nav_label['text'] = f"🗺️ Przecierasz nowe szlaki! (Cel: {target_label})"
+                    self.distance_label['text'] = "🗺️ PRZECIERASZ NOWE SZLAKI!"
+                elif self.reroute_var.get() and self.reroute_from_position():
+                    self.nav_label['text'] = "🔀 Zboczyłeś z trasy - wyznaczono nową trasę do celu"
+                else:
+                    self.distance_label['text'] += " ⚠️ ODSTĘPSTWO OD TRASY"
+            elif isinstance(event, FloorTransition):
+                self.show_floor_transition(event)
+            elif isinstance(event, FloorChanged):
+                if event.floor != self.current_floor:
+                    self.switch_floor_view(event.floor)
+            elif isinstance(event, Arrived):
                 self.nav_label['text'] = "🎉 GRATULACJE! Dotarłeś do celu!"
                 self.distance_label['text'] = ""
                 
                 # Sprawdź czy użytkownik poszedł sugerowaną trasą
-                self.check_route_compliance()
-                return
-        
-        # PRIORYTET 1.5: Sprawdź czy zbliża się przejście między piętrami
-        if self.current_path_index < len(self.shortest_path) - 1:
-            current_node = self.shortest_path[self.current_path_index]
-            next_node = self.shortest_path[self.current_path_index + 1]
-            
-            # Sprawdź czy następny krok to zmiana piętra
-            if '_' in current_node and '_' in next_node:
-                current_floor = current_node.split('_')[0]
-                next_floor = next_node.split('_')[0]
-                
-                if current_floor != next_floor:
-                    # To jest przejście między piętrami!
-                    if current_node in self.nodes_coords:
-                        trans_coords = self.nodes_coords[current_node]
-                        trans_x, trans_y = trans_coords['x'], trans_coords['y']
-                        user_x, user_y = self.user_position
-                        
-                        trans_distance = math.sqrt((trans_x - user_x)**2 + (trans_y - user_y)**2)
-                        
-                        # Jeśli blisko przejścia
-                        if trans_distance <= self.proximity_threshold * 1.5:  # Większy próg dla alertu
-                            trans_type = self.get_transition_type(current_node, next_node)
-                            trans_icon = "🪜" if trans_type == "stairs" else "🛗"
-                            floor_from_name = self.building_info.get('floor_names', {}).get(current_floor, f"Piętro {current_floor}")
-                            floor_to_name = self.building_info.get('floor_names', {}).get(next_floor, f"Piętro {next_floor}")
-                            
-                            self.nav_label['text'] = f"⚠️ {trans_icon} Zmiana piętra! {floor_from_name} → {floor_to_name}"
-                            self.distance_label['text'] = f"Przejdź przez {trans_type} ({trans_distance:.1f} px)"
-                            
-                            # Po dotarciu do punktu przejścia - zaproponuj zmianę piętra
-                            if trans_distance <= self.proximity_threshold:
-                                if not self.floor_transition_alert_shown:
-                                    self.floor_transition_alert_shown = True
-                                    
-                                    # WAŻNE: Oznacz punkt przejścia jako odwiedzony PRZED zmianą piętra
-                                    if current_node not in self.visited_nodes:
-                                        self.visited_nodes.append(current_node)
-                                        print(f"✓ Punkt przejścia odwiedzony: {current_node}")
-                                    
-                                    result = messagebox.askyesno(
-                                        "Zmiana piętra",
-                                        f"Dotarłeś do przejścia między piętrami!\n\n"
-                                        f"{trans_icon} Typ: {trans_type}\n"
-                                        f"Z: {floor_from_name}\n"
-                                        f"Do: {floor_to_name}\n\n"
-                                        f"Czy chcesz przełączyć widok na {floor_to_name}?"
-                                    )
-                                    
-                                    if result:
-                                        # Przejdź do następnego punktu (na nowym piętrze)
-                                        self.current_path_index += 1
-                                        
-                                        # Zmień piętro
-                                        self.current_floor = next_floor
-                                        self.route_floor = next_floor
-                                        
-                                        # Zaktualizuj combobox
-                                        floor_list = list(self.floors.keys())
-                                        if next_floor in floor_list:
-                                            idx = floor_list.index(next_floor)
-                                            floor_names = self.floor_combo['values']
-                                            if idx < len(floor_names):
-                                                self.floor_combo.set(floor_names[idx])
-                                        
-                                        # Wczytaj dane nowego piętra
-                                        self.load_floor_data(next_floor)
-                                        
-                                        # Wyczyść pozycję użytkownika na nowym piętrze
-                                        self.user_position = None
-                                        self.canvas.delete('user_marker')
-                                        self.canvas.delete('user_path')
-                                        
-                                        # Przerysuj mapę
-                                        self.canvas.delete('all')
-                                        self.draw_map()
-                                        self.draw_route()
-                                        
-                                        # Reset alertu
-                                        self.floor_transition_alert_shown = False
-                                        
-                                        messagebox.showinfo("Piętro zmienione", 
-                                                          f"Jesteś teraz na: {floor_to_name}\n\n"
-                                                          f"Zacznij rysować swoją pozycję na nowym piętrze\n"
-                                                          f"aby kontynuować nawigację do celu!")
-                                        return
-                            return
-        
-        # PRIORYTET 2: Sprawdź postęp na sugerowanej trasie (punkty pośrednie)
-        if self.current_path_index >= len(self.shortest_path):
-            return
-        
-        # Pobierz aktualny cel na sugerowanej trasie
-        current_target = self.shortest_path[self.current_path_index]
-        
-        if current_target not in self.nodes_coords:
-            return
-        
-        target_coords = self.nodes_coords[current_target]
-        target_x, target_y = target_coords['x'], target_coords['y']
-        user_x, user_y = self.user_position
-        
-        # Oblicz odległość do bieżącego punktu pośredniego
-        distance = math.sqrt((target_x - user_x)**2 + (target_y - user_y)**2)
-        
-        # Sprawdź czy użytkownik dotarł do punktu pośredniego
-        if distance <= self.proximity_threshold:
-            self.current_path_index += 1
-            
-            # Zapisz odwiedzony węzeł
-            if current_target not in self.visited_nodes:
-                self.visited_nodes.append(current_target)
-            
-            # Usuń osiągnięty punkt
-            self.canvas.delete('markers')
-            self.draw_route()
-            
-            # Sprawdź czy to był ostatni punkt
-            if self.current_path_index >= len(self.shortest_path):
-                self.nav_label['text'] = "🎉 GRATULACJE! Dotarłeś do celu!"
-                self.distance_label['text'] = ""
-                self.check_route_compliance()
-                return
-            else:
-                # Następny punkt pośredni
-                next_target = self.shortest_path[self.current_path_index]
-                next_label = self.point_labels.get(next_target, f"punkt {next_target}")
-                self.nav_label['text'] = f"✓ Dobra robota! Teraz idź do: {next_label}"
-                return
-        
-        # PRIORYTET 3: Nawigacja - wskazówki jak dojść do punktu
-        # Sprawdź czy użytkownik nie zboczył z trasy
-        deviation_status = self.check_route_deviation()
-        
-        # Jeśli użytkownik przeciera nowe szlaki, nie dawaj wskazówek nawigacyjnych
-        if deviation_status == "exploring":
-            target_label = self.point_labels.get(final_target if final_target else current_target, 
-                                                 f"punkt {final_target if final_target else current_target}")
-            self.nav_label['text'] = f"🗺️ Przecierasz nowe szlaki! (Cel: {target_label})"
-            return
-        
-        # Wskazówki kierunkowe względem kierunku ruchu użytkownika
-        dx = target_x - user_x
-        dy = target_y - user_y
-        
+                self.check_route_compliance(event.compliance)
+    
+    def show_guidance(self, event: Guidance):
+        """Wskazówki kierunkowe względem kierunku ruchu użytkownika"""
         # Określ kierunek (względny lub absolutny)
-        if self.user_direction is not None:
-            direction = self.get_relative_direction(dx, dy)
+        if event.direction is not None:
+            direction = self.get_relative_direction(event.dx, event.dy)
         else:
             # Jeśli nie znamy kierunku użytkownika, użyj kierunków absolutnych
-            direction = self.get_absolute_direction(dx, dy)
+            direction = self.get_absolute_direction(event.dx, event.dy)
         
         # Przygotuj nazwę celu
-        target_label = self.point_labels.get(current_target, f"punkt {current_target}")
+        target_label = self.point_labels.get(event.node, f"punkt {event.node}")
         
         self.nav_label['text'] = f"🧭 {direction} do: {target_label}"
-        self.distance_label['text'] = f"Odległość: {distance:.1f} px (próg: {self.proximity_threshold} px)"
+        self.distance_label['text'] = f"Odległość: {event.distance:.1f} px (próg: {self.proximity_threshold} px)"
+        if event.progress:
+            eta = int(event.progress.eta)
+            self.distance_label['text'] += (f" | Do celu: {event.progress.remaining:.0f} px, "
+                                            f"~{eta // 60}:{eta % 60:02d} min")
     
-    def check_route_deviation(self):
-        """Sprawdza czy użytkownik zboczył z sugerowanej trasy
+    def show_floor_transition(self, event: FloorTransition):
+        """Alert o zbliżającym się przejściu; na miejscu proponuje zmianę piętra"""
+        trans_type = self.get_transition_type(event.node, event.next_node)
+        trans_icon = "🪜" if event.transition_type == "stairs" else "🛗"
+        floor_names = self.building_info.get('floor_names', {})
+        floor_from_name = floor_names.get(event.from_floor, f"Piętro {event.from_floor}")
+        floor_to_name = floor_names.get(event.to_floor, f"Piętro {event.to_floor}")
+        
+        self.nav_label['text'] = f"⚠️ {trans_icon} Zmiana piętra! {floor_from_name} → {floor_to_name}"
+        self.distance_label['text'] = f"Przejdź przez {trans_type} ({event.distance:.1f} px)"
+        
+        if not event.reached:
+            return
+        print(f"✓ Punkt przejścia odwiedzony: {event.node}")
         
-        Returns:
-            str: "exploring" jeśli przeciera nowe szlaki, "deviated" jeśli zboczył, None jeśli na trasie
-        """
-        if not self.user_position or self.deviated_from_route:
-            return None
+        result = messagebox.askyesno(
+            "Zmiana piętra",
+            f"Dotarłeś do przejścia między piętrami!\n\n"
+            f"{trans_icon} Typ: {trans_type}\n"
+            f"Z: {floor_from_name}\n"
+            f"Do: {floor_to_name}\n\n"
+            f"Czy chcesz przełączyć widok na {floor_to_name}?"
+        )
         
-        # Sprawdź odległość od najbliższego punktu na sugerowanej trasie
-        min_distance = float('inf')
+        if result:
+            self.show_navigation_events(self.session.change_floor())
+            messagebox.showinfo("Piętro zmienione", 
+                              f"Jesteś teraz na: {floor_to_name}\n\n"
+                              f"Zacznij rysować swoją pozycję na nowym piętrze\n"
+                              f"aby kontynuować nawigację do celu!")
+    
+    def switch_floor_view(self, floor_id):
+        """Przełącza widok na piętro, na które przeszedł użytkownik"""
+        self.current_floor = floor_id
+        self.route_floor = floor_id
+        
+        # Zaktualizuj combobox
+        floor_list = list(self.floors.keys())
+        if floor_id in floor_list:
+            idx = floor_list.index(floor_id)
+            floor_names = self.floor_combo['values']
+            if idx < len(floor_names):
+                self.floor_combo.set(floor_names[idx])
+        
+        # Wczytaj dane nowego piętra
+        self.load_floor_data(floor_id)
+        
+        # Wyczyść pozycję użytkownika na nowym piętrze
+        self.user_position = None
+        self.canvas.delete('user_marker')
+        self.trace_layer.clear()
         
-        for node in self.shortest_path:
-            if node not in self.nodes_coords:
-                continue
-            
-            coords = self.nodes_coords[node]
-            nx, ny = coords['x'], coords['y']
-            ux, uy = self.user_position
-            
-            dist = math.sqrt((nx - ux)**2 + (ny - uy)**2)
-            if dist < min_distance:
-                min_distance = dist
+        # Przerysuj mapę
+        self.canvas.delete('all')
+        self.draw_map()
+        self.draw_route()
+    
+    def nearest_graph_node(self, x, y) -> Optional[str]:
+        """Najbliższy punkt aktualnego piętra należący do grafu tras"""
+        index = self.floor_index(self.current_floor)
+        if index is None:
+            return None
+        graph_index = self.routing_engine.graph.index
+        for point_id, _ in index.k_nearest(x, y, 8):
+            node = f"{self.current_floor}_{point_id}"
+            if node in graph_index:
+                return node
+        return None
+    
+    def reroute_from_position(self) -> bool:
+        """Wyznacza nową trasę od najbliższego punktu do celu (bez zapisu pliku)"""
+        if not self.user_position or not self.shortest_path or not self.map_filename:
+            return False
         
-        # Jeśli użytkownik jest daleko od trasy
-        if min_distance > self.route_deviation_threshold:
-            self.deviated_from_route = True
-            
-            # Jeśli BARDZO daleko (2x próg), to przeciera nowe szlaki
-            exploration_threshold = self.route_deviation_threshold * 2
-            if min_distance > exploration_threshold:
-                self.distance_label['text'] = "🗺️ PRZECIERASZ NOWE SZLAKI!"
-                return "exploring"
-            else:
-                self.distance_label['text'] += " ⚠️ ODSTĘPSTWO OD TRASY"
-                return "deviated"
+        try:
+            routing = self.map_session.routing
+            self.routing_engine = routing.engine()
+            graph = self.routing_engine.graph
+            goal = self.shortest_path[-1]
+            if self.reroute_search is None or self.reroute_revision != routing.revision \
+                    or graph.node_ids[self.reroute_search.goal] != goal:
+                # Nowy cel albo graf zmieniony od ostatniego wyszukiwania
+                self.reroute_search = self.routing_engine.incremental(goal)
+                self.reroute_revision = routing.revision
+                if self.reroute_search is None:
+                    return False
+            
+            start = self.nearest_graph_node(*self.user_position)
+            if start is None:
+                return False
+            path, distance = self.reroute_search.route(graph.index[start])
+        except Exception as e:
+            print(f"✗ Błąd wyznaczania nowej trasy: {e}")
+            return False
+        if not path or len(path) < 2:
+            return False
         
-        return None
+        route = [graph.node_ids[i] for i in path]
+        if route == self.shortest_path:
+            return False  # Najbliższy punkt to wciąż początek obecnej trasy
+        self.nodes_coords, self.path_segments = self.build_route_details(route)
+        self.shortest_path = route
+        self.session.replace_route(route, self.nodes_coords, self.path_segments)
+        self.draw_route()
+        
+        print(f"✓ Nowa trasa od {start}: {len(route)} punktów, {distance:.1f} px "
+              f"(rozwinięto {self.reroute_search.expanded} węzłów)")
+        return True
+    
+    def build_route_details(self, route):
+        """Współrzędne węzłów i odcinki trasy (jak w shortest_path.json z Graph Analyzer)"""
+        engine = self.routing_engine
+        graph = engine.graph
+        floor_names = self.building_info.get('floor_names', {})
+        nodes_coords = {}
+        for node in route:
+            i = graph.index[node]
+            if not graph.has_coords(i):
+                continue
+            floor, point = node.split('_', 1)
+            nodes_coords[node] = {
+                "x": round(graph.xs[i], 2),
+                "y": round(graph.ys[i], 2),
+                "floor": floor,
+                "floor_name": floor_names.get(floor, f"Piętro {floor}"),
+                "point_id": point,
+                "point_label": self.floors.get(floor, {}).get('point_labels', {}).get(point, "")
+            }
+        
+        path_segments = []
+        for node_from, node_to in zip(route, route[1:]):
+            floor_from = node_from.split('_', 1)[0]
+            floor_to = node_to.split('_', 1)[0]
+            segment = {
+                "from": node_from,
+                "to": node_to,
+                "distance": round(engine.edge_weight(node_from, node_to), 2),
+                "from_floor": floor_from,
+                "to_floor": floor_to,
+                "is_floor_transition": floor_from != floor_to
+            }
+            if floor_from != floor_to:
+                transition_info = engine.find_transition_info(node_from, node_to)
+                if transition_info:
+                    segment["transition_type"] = transition_info['type']
+                    segment["transition_name"] = transition_info.get('name', '')
+            for key, node in (("from_coords", node_from), ("to_coords", node_to)):
+                if node in nodes_coords:
+                    segment[key] = {"x": nodes_coords[node]['x'], "y": nodes_coords[node]['y']}
+            path_segments.append(segment)
+        return nodes_coords, path_segments
     
-    def check_route_compliance(self):
-        """Sprawdza czy użytkownik przeszedł sugerowaną trasą i pyta o powód jeśli nie"""
-        # Sprawdź czy użytkownik odwiedził wszystkie punkty z sugerowanej trasy (w kolejności)
-        expected_nodes = self.shortest_path
-        visited_nodes = self.visited_nodes
-        
-        # Sprawdź czy użytkownik odwiedził wszystkie punkty pośrednie
-        all_nodes_visited = all(node in visited_nodes for node in expected_nodes)
-        
-        # Znajdź brakujące punkty
-        missing_nodes = [node for node in expected_nodes if node not in visited_nodes]
-        
-        # Sprawdź czy użytkownik odwiedził je w tej samej kolejności
-        in_correct_order = True
-        last_expected_index = -1
-        
-        for expected_node in expected_nodes:
-            try:
-                visited_index = visited_nodes.index(expected_node)
-                if visited_index < last_expected_index:
-                    in_correct_order = False
-                    break
-                last_expected_index = visited_index
-            except ValueError:
-                # Węzeł nie został odwiedzony
-                in_correct_order = False
-                break
-        
-        # Jeśli użytkownik zboczył, nie odwiedził wszystkich punktów, lub nie w kolejności
-        if self.deviated_from_route or not all_nodes_visited or not in_correct_order:
+    def check_route_compliance(self, compliance):
+        """Pokazuje wynik zgodności z trasą i pyta o powód jeśli użytkownik zboczył"""
+        if not compliance.compliant:
             # Pokaż dialog z pytaniem o powód
             print(f"  Wykryto odstępstwo:")
-            print(f"    Zboczył z trasy: {self.deviated_from_route}")
-            print(f"    Wszystkie punkty odwiedzone: {all_nodes_visited}")
-            print(f"    Poprawna kolejność: {in_correct_order}")
-            print(f"    Brakujące punkty: {missing_nodes}")
-            print(f"    Oczekiwane: {expected_nodes}")
-            print(f"    Odwiedzone: {visited_nodes}")
-            
-            # Sprawdź czy brakujący punkt to tylko punkt przejścia na poprzednim piętrze
-            if len(missing_nodes) == 1 and '_' in missing_nodes[0]:
-                missing_node = missing_nodes[0]
-                # Sprawdź czy to punkt przejścia
-                is_transition = False
-                for i, node in enumerate(expected_nodes):
-                    if node == missing_node and i < len(expected_nodes) - 1:
-                        next_node = expected_nodes[i + 1]
-                        if '_' in next_node:
-                            missing_floor = missing_node.split('_')[0]
-                            next_floor = next_node.split('_')[0]
-                            if missing_floor != next_floor:
-                                is_transition = True
-                                print(f"    ℹ️ Brakujący punkt {missing_node} to punkt przejścia między piętrami")
-                                # Automatycznie dodaj ten punkt jako odwiedzony
-                                self.visited_nodes.append(missing_node)
-                                print(f"    ✓ Automatycznie oznaczono {missing_node} jako odwiedzony")
-                                
-                                # Sprawdź ponownie
-                                all_nodes_visited = all(node in self.visited_nodes for node in expected_nodes)
-                                if all_nodes_visited:
-                                    print(f"  ✓ Po korekcie: wszystkie punkty odwiedzone")
-                                    # Nie pokazuj dialogu odstępstwa
-                                    if self.auto_update_var.get():
-                                        self.update_map_with_user_path()
-                                    messagebox.showinfo("Sukces!", 
-                                                      "🎉 Gratulacje!\n\nDotarłeś do celu!\n\n"
-                                                      "Twoja trasa została dodana do mapy.")
-                                    return
-            
+            print(f"    Zboczył z trasy: {compliance.deviated}")
+            print(f"    Wszystkie punkty odwiedzone: {compliance.all_visited}")
+            print(f"    Poprawna kolejność: {compliance.in_order}")
+            print(f"    Brakujące punkty: {compliance.missing_nodes}")
+            print(f"    Oczekiwane: {self.shortest_path}")
+            print(f"    Odwiedzone: {self.session.visited_nodes}")
             self.ask_deviation_reason()
+            return
+        
+        if compliance.corrected:
+            # Brakował tylko punkt przejścia między piętrami
+            print(f"    ℹ️ Brakujący punkt {compliance.missing_nodes[0]} to punkt przejścia między piętrami")
+            print(f"  ✓ Po korekcie: wszystkie punkty odwiedzone")
+            message = "🎉 Gratulacje!\n\nDotarłeś do celu!\n\nTwoja trasa została dodana do mapy."
         else:
             # Użytkownik przeszedł dokładnie sugerowaną trasą
             print(f"  ✓ Użytkownik przeszedł zgodnie z trasą")
-            
-            # Aktualizuj mapę
-            if self.auto_update_var.get():
-                self.update_map_with_user_path()
-            
-            messagebox.showinfo("Sukces!", 
-                              "🎉 Gratulacje!\n\nDotarłeś do celu zgodnie z trasą!\n\n"
-                              "Twoja trasa została dodana do mapy.")
+            message = ("🎉 Gratulacje!\n\nDotarłeś do celu zgodnie z trasą!\n\n"
+                       "Twoja trasa została dodana do mapy.")
+        
+        # Aktualizuj mapę
+        if self.auto_update_var.get():
+            self.update_map_with_user_path()
+        
+        messagebox.showinfo("Sukces!", message)
     
     def ask_deviation_reason(self):
         """Pyta użytkownika o powód odstępstwa od trasy"""
@@ -1170,33 +1084,20 @@ class GPSNavigator:
         feedback_data = {
             "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "suggested_route": self.shortest_path,
-            "visited_nodes": self.visited_nodes,
-            "deviated": self.deviated_from_route,
+            "visited_nodes": self.session.visited_nodes,
+            "deviated": self.session.deviated,
             "reason": reason,
             "notes": notes,
             "path_length": len(self.current_user_path)
         }
         
-        # Zapisz do pliku JSON
-        import os
-        feedback_file = "route_feedback.json"
-        
+        # Jeden INSERT do bazy feedbacku (bez przepisywania wszystkich zgłoszeń)
         try:
-            # Wczytaj istniejące feedbacki
-            if os.path.exists(feedback_file):
-                with open(feedback_file, 'r', encoding='utf-8') as f:
-                    all_feedback = json.load(f)
-            else:
-                all_feedback = []
-            
-            # Dodaj nowy feedback
-            all_feedback.append(feedback_data)
+            if self.feedback_store is None:
+                self.feedback_store = FeedbackStore()
+            self.feedback_store.add(feedback_data)
             
-            # Zapisz
-            with open(feedback_file, 'w', encoding='utf-8') as f:
-                json.dump(all_feedback, f, indent=2, ensure_ascii=False)
-            
-            print(f"✓ Feedback zapisany do {feedback_file}")
+            print(f"✓ Feedback zapisany do {self.feedback_store.filename}")
             print(f"  Powód: {reason}")
             if notes:
                 print(f"  Uwagi: {notes}")
@@ -1210,7 +1111,7 @@ class GPSNavigator:
         target_angle = math.atan2(dy, dx)
         
         # Różnica między kierunkiem ruchu a kierunkiem do celu
-        angle_diff = target_angle - self.user_direction
+        angle_diff = target_angle - self.session.user_direction
         
         # Normalizuj do zakresu -π do π
         while angle_diff > math.pi:
@@ -1271,7 +1172,7 @@ class GPSNavigator:
         """Stara funkcja - pozostawiona dla kompatybilności"""
         return self.get_absolute_direction(dx, dy)
     
-    def merge_user_path_with_existing(self, user_points_coords, existing_points):
+    def merge_user_path_with_existing(self, user_points_coords, existing_index: GridIndex):
         """Łączy punkty użytkownika z istniejącymi punktami (jak 'Połącz korytarze')"""
         merge_threshold = 40  # Ten sam próg co w mapmaker
         
@@ -1280,24 +1181,14 @@ class GPSNavigator:
         
         # Dla każdego punktu użytkownika sprawdź czy jest blisko istniejącego
         for i, (ux, uy) in enumerate(user_points_coords):
-            closest_existing = None
-            min_dist = float('inf')
-            
             # Znajdź najbliższy istniejący punkt
-            for existing in existing_points:
-                if existing['x'] == 0 and existing['y'] == 0:
-                    continue
-                    
-                dist = math.sqrt((existing['x'] - ux)**2 + (existing['y'] - uy)**2)
-                
-                if dist <= merge_threshold and dist < min_dist:
-                    min_dist = dist
-                    closest_existing = existing
+            closest_existing = existing_index.nearest(ux, uy, max_distance=merge_threshold)
             
             if closest_existing:
                 # Użyj istniejącego punktu
-                merged_to_existing[i] = closest_existing['id']
-                merged_points.append((closest_existing['x'], closest_existing['y']))
+                point_id = closest_existing[0]
+                merged_to_existing[i] = point_id
+                merged_points.append(existing_index.position(point_id))
             else:
                 # Zachowaj oryginalny punkt użytkownika
                 merged_points.append((ux, uy))
@@ -1306,37 +1197,7 @@ class GPSNavigator:
     
     def simplify_user_path_points(self, points_coords):
         """Upraszcza punkty ścieżki użytkownika grupując bliskie punkty"""
-        if len(points_coords) <= 2:
-            return points_coords
-        
-        merge_threshold = 40
-        simplified = []
-        used_indices = set()
-        
-        for i, (x1, y1) in enumerate(points_coords):
-            if i in used_indices:
-                continue
-            
-            # Znajdź klaster bliskich punktów
-            cluster = [(x1, y1)]
-            used_indices.add(i)
-            
-            for j, (x2, y2) in enumerate(points_coords):
-                if j <= i or j in used_indices:
-                    continue
-                
-                dist = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-                
-                if dist <= merge_threshold:
-                    cluster.append((x2, y2))
-                    used_indices.add(j)
-            
-            # Średnia pozycja klastra
-            avg_x = sum(p[0] for p in cluster) / len(cluster)
-            avg_y = sum(p[1] for p in cluster) / len(cluster)
-            simplified.append((avg_x, avg_y))
-        
-        return simplified
+        return merge_close_points(points_coords, radius=40)
     
     def update_map_with_user_path(self):
         """Aktualizuje oryginalną mapę GPS o ścieżkę użytkownika"""
@@ -1344,51 +1205,36 @@ class GPSNavigator:
             return
         
         try:
-            # Wczytaj aktualną mapę
-            with open(self.map_filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # Wczytaj aktualną mapę (migawka + dziennik zmian)
+            data = self.map_session.store.load()
             
-            # Użyj wartości z suwaka próbkowania
-            sampling_rate = self.sampling_var.get()
-            
-            # Co N-ty punkt z narysowanej ścieżki (kontrolowane suwakiem)
-            sampled_indices = range(0, len(self.current_user_path), sampling_rate)
-            sampled_path = [self.current_user_path[i] for i in sampled_indices]
-            
-            # Zawsze dodaj ostatni punkt
-            if len(self.current_user_path) > 0 and self.current_user_path[-1] not in sampled_path:
-                sampled_path.append(self.current_user_path[-1])
-            
-            # Filtruj punkty które są za blisko siebie
-            filtered_path = []
-            min_distance = 30
-            
-            for point in sampled_path:
-                if not filtered_path:
-                    filtered_path.append(point)
-                else:
-                    last_point = filtered_path[-1]
-                    dist = math.sqrt((point[0] - last_point[0])**2 + (point[1] - last_point[1])**2)
-                    if dist >= min_distance:
-                        filtered_path.append(point)
-            
-            sampled_path = filtered_path
+            # Dane piętra, na którym użytkownik narysował ścieżkę
+            if 'floors' in data:
+                floor_data = data['floors'][self.current_floor]
+            else:
+                floor_data = data  # Stary format - single floor
+            floor_data.setdefault('paths', [])
+            floor_data.setdefault('connections', [])
+            connections_before = len(floor_data['connections'])
+            
+            # Ścieżka uproszczona w trakcie rysowania (tolerancja z suwaka)
+            if len(self.path_simplifier) and self.path_simplifier.added == len(self.current_user_path):
+                sampled_path = self.path_simplifier.points()
+            else:
+                sampled_path = simplify_polyline(self.current_user_path, self.path_simplifier.tolerance)
             
             print(f"  Oryginalnych punktów: {len(self.current_user_path)}")
-            print(f"  Po próbkowaniu co {sampling_rate}: {len([self.current_user_path[i] for i in sampled_indices])}")
-            print(f"  Po filtrowaniu (min {min_distance}px): {len(sampled_path)}")
+            print(f"  Po uproszczeniu (tolerancja {self.path_simplifier.tolerance} px): {len(sampled_path)}")
             
             # NOWA FUNKCJONALNOŚĆ: Połącz korytarze (2 razy)
-            # Zbierz wszystkie istniejące punkty
-            existing_points = []
-            for path in data['paths']:
-                for point in path['points']:
-                    if point['x'] != 0 or point['y'] != 0:
-                        existing_points.append(point)
+            # Istniejące punkty piętra z indeksu przestrzennego
+            existing_index = self.floor_index(self.current_floor)
+            if existing_index is None:
+                existing_index = GridIndex(SPATIAL_CELL_SIZE)  # Piętro dopiero powstanie
             
             # 1. Połącz ścieżkę użytkownika z istniejącymi punktami
             print(f"  Łączenie z istniejącymi punktami...")
-            merged_with_existing, merged_map = self.merge_user_path_with_existing(sampled_path, existing_points)
+            merged_with_existing, merged_map = self.merge_user_path_with_existing(sampled_path, existing_index)
             print(f"  Po połączeniu z mapą: {len(merged_with_existing)} punktów, {len(merged_map)} zmapowanych")
             
             # 2. Uprość wewnętrzne punkty ścieżki użytkownika (grupuj bliskie)
@@ -1398,8 +1244,8 @@ class GPSNavigator:
             
             # Konwertuj finalne punkty na format JSON
             # Sprawdź które punkty zostały zmapowane na istniejące
-            new_path_id = len(data['paths']) + 1
-            point_id_start = max([p['id'] for path in data['paths'] for p in path['points']], default=0) + 1
+            new_path_id = len(floor_data['paths']) + 1
+            point_id_start = max([p['id'] for path in floor_data['paths'] for p in path['points']], default=0) + 1
             
             reused_points = {}  # ID istniejącego punktu -> lista indeksów użytkownika
             new_points = []
@@ -1407,13 +1253,9 @@ class GPSNavigator:
             for i, (x, y) in enumerate(final_path):
                 # Sprawdź czy ten punkt jest bardzo blisko istniejącego (ponowna weryfikacja)
                 matched_existing = None
-                for existing in existing_points:
-                    if existing['x'] == 0 and existing['y'] == 0:
-                        continue
-                    dist = math.sqrt((existing['x'] - x)**2 + (existing['y'] - y)**2)
-                    if dist < 5:  # Bardzo blisko = ten sam punkt
-                        matched_existing = existing['id']
-                        break
+                nearest = existing_index.nearest(x, y, max_distance=5)
+                if nearest and nearest[1] < 5:  # Bardzo blisko = ten sam punkt
+                    matched_existing = nearest[0]
                 
                 if matched_existing:
                     # Reużyj istniejący punkt
@@ -1435,7 +1277,7 @@ class GPSNavigator:
                     'points': new_points,
                     'color': 'blue'  # Ścieżki użytkowników w kolorze niebieskim
                 }
-                data['paths'].append(new_path)
+                floor_data['paths'].append(new_path)
                 
                 # Dodaj połączenia między punktami w nowej ścieżce
                 for i in range(len(new_points) - 1):
@@ -1445,22 +1287,24 @@ class GPSNavigator:
                     distance = math.sqrt((point2['x'] - point1['x'])**2 + 
                                        (point2['y'] - point1['y'])**2)
                     
-                    data['connections'].append({
+                    floor_data['connections'].append({
                         'from': point1['id'],
                         'to': point2['id'],
                         'distance': round(distance, 2)
                     })
                 
                 # Połącz nową ścieżkę z istniejącymi punktami (tylko początki/końce)
-                self.connect_to_existing_points(data, new_points)
+                self.connect_to_existing_points(floor_data, new_points, existing_index)
             
-            # Zapisz zaktualizowaną mapę
-            with open(self.map_filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            # Zaktualizuj lokalną kopię
-            self.all_paths = data['paths']
-            self.all_connections = data['connections']
+            # Dopisz zmiany do dziennika mapy (bez przepisywania całego pliku)
+            ops = []
+            if new_points:
+                ops.append({'op': 'add_path', 'floor': self.current_floor, 'path': new_path})
+            ops.extend({'op': 'add_connection', 'floor': self.current_floor, 'connection': connection}
+                       for connection in floor_data['connections'][connections_before:])
+            # Te same operacje na modelu: indeks przestrzenny i graf tras dostaną zdarzenia
+            self.map_session.append(ops)
+            self.load_floor_data(self.current_floor)
             
             added_msg = f"dodano {len(new_points)} nowych punktów"
             reused_msg = f"reużyto {len(reused_points)} istniejących" if reused_points else ""
@@ -1476,53 +1320,41 @@ class GPSNavigator:
             messagebox.showwarning("Błąd aktualizacji", 
                                  f"Nie udało się zaktualizować mapy:\n{e}")
     
-    def connect_to_existing_points(self, data, new_points):
+    def connect_to_existing_points(self, floor_data, new_points, existing_index: GridIndex):
         """Łączy nową ścieżkę z istniejącymi punktami - gwarantuje połączenia"""
-        # Zbierz wszystkie istniejące punkty (oprócz nowo dodanych)
-        existing_points = []
-        for path in data['paths'][:-1]:  # Ostatnia ścieżka to właśnie dodana
-            for point in path['points']:
-                if point['x'] != 0 or point['y'] != 0:
-                    existing_points.append(point)
-        
-        if not new_points or not existing_points:
+        # Indeks zawiera tylko istniejące punkty (bez nowo dodanych)
+        if not new_points or not len(existing_index):
             return
         
+        connected = {(c['from'], c['to']) for c in floor_data['connections']}
+        
         def find_and_connect(target_point, point_type, initial_threshold=60):
             """Znajduje i łączy punkt z istniejącymi - z fallbackiem na większy promień"""
             connections_made = 0
             thresholds = [initial_threshold, 100, 150, 200]  # Próbuj coraz większe promienie
             
             for threshold in thresholds:
-                # Znajdź wszystkie punkty w promieniu threshold
-                candidates = []
-                for existing in existing_points:
-                    dist = math.sqrt((existing['x'] - target_point['x'])**2 + 
-                                   (existing['y'] - target_point['y'])**2)
-                    if dist <= threshold:
-                        candidates.append((existing, dist))
+                # Znajdź wszystkie punkty w promieniu threshold (posortowane po odległości)
+                candidates = existing_index.within(target_point['x'], target_point['y'], threshold)
                 
                 if candidates:
-                    # Sortuj po odległości i połącz z 1-3 najbliższymi
-                    candidates.sort(key=lambda x: x[1])
+                    # Połącz z 1-3 najbliższymi
                     max_connections = min(3, len(candidates))  # Max 3 połączenia
                     
-                    for existing, dist in candidates[:max_connections]:
+                    for existing_id, dist in candidates[:max_connections]:
                         # Sprawdź czy to połączenie już nie istnieje
-                        connection_exists = any(
-                            (c['from'] == target_point['id'] and c['to'] == existing['id']) or
-                            (c['from'] == existing['id'] and c['to'] == target_point['id'])
-                            for c in data['connections']
-                        )
+                        connection_exists = ((target_point['id'], existing_id) in connected or
+                                             (existing_id, target_point['id']) in connected)
                         
                         if not connection_exists:
-                            data['connections'].append({
+                            floor_data['connections'].append({
                                 'from': target_point['id'],
-                                'to': existing['id'],
+                                'to': existing_id,
                                 'distance': round(dist, 2)
                             })
+                            connected.add((target_point['id'], existing_id))
                             connections_made += 1
-                            print(f"  Połączono {point_type} z punktem {existing['id']} (odległość: {dist:.1f}px, próg: {threshold}px)")
+                            print(f"  Połączono {point_type} z punktem {existing_id} (odległość: {dist:.1f}px, próg: {threshold}px)")
                     
                     break  # Znaleziono połączenia, wyjdź z pętli progów
             
@@ -1541,17 +1373,18 @@ class GPSNavigator:
     
     def clear_user_path(self):
         """Czyści tylko ścieżkę użytkownika"""
-        self.canvas.delete('user_path')
+        if self.navigation_update_job is not None:
+            self.root.after_cancel(self.navigation_update_job)
+            self.navigation_update_job = None
+        self.pending_positions = []
+        self.trace_layer.clear()
         self.canvas.delete('user_marker')
-        self.drawn_path = []
         self.current_user_path = []
+        self.path_simplifier.reset()
         self.user_position = None
-        self.current_path_index = 0
         self.is_drawing = False
-        self.user_direction = None
-        self.last_positions = []
-        self.deviated_from_route = False
-        self.visited_nodes = []
+        self.session.reset()
+        self.session.current_floor = self.current_floor
         
         # Reset trybu wolnej eksploracji
         if self.free_exploration_mode:
@@ -1573,20 +1406,19 @@ class GPSNavigator:
     
     def get_transition_type(self, from_node, to_node):
         """Zwraca typ przejścia między piętrami (stairs/elevator)"""
-        for segment in self.path_segments:
-            if (segment.get('from') == from_node and 
-                segment.get('to') == to_node and
-                segment.get('is_floor_transition', False)):
-                trans_type = segment.get('transition_type', 'stairs')
-                if trans_type == 'stairs':
-                    return 'schody'
-                elif trans_type == 'elevator':
-                    return 'winda'
-                return trans_type
-        return 'schody'  # Domyślnie
+        trans_type = self.session.segment_transitions.get((from_node, to_node), 'stairs')
+        if trans_type == 'stairs':
+            return 'schody'
+        elif trans_type == 'elevator':
+            return 'winda'
+        return trans_type
     
     def return_to_menu(self):
         """Zamyka aplikację i wraca do menu głównego"""
+        if self.shell is not None:
+            self.shell.show_menu()  # W powłoce narzędzie zostaje otwarte w swojej karcie
+            return
+        
         import subprocess
         import sys
         import os
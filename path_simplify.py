@@ -0,0 +1,175 @@
+"""Upraszczanie narysowanej ścieżki do kilku dobrze rozmieszczonych punktów.
+
+PolylineSimplifier usuwa punkty zachłannie według największego odchylenia:
+punkty są dodawane na bieżąco (np. z ruchu myszy), a punkt pośredni jest
+usuwany, gdy wszystkie pominięte punkty leżą bliżej niż tolerancja od odcinka
+łączącego jego sąsiadów. Kandydaci do usunięcia czekają w kopcu (od najmniej
+istotnego). max_spacing ogranicza długość odcinka, a max_skipped liczbę
+oryginalnych punktów, które jeden odcinek może pominąć - ocena punktu
+kosztuje więc O(max_skipped), a add() zamortyzowane O(log n) także przy
+staniu w miejscu i drganiach pozycji. Narożniki korytarzy odchylone o więcej
+niż tolerancję zostają, a długie proste korytarze dostają punkty pośrednie co
+najwyżej co max_spacing do łączenia z mapą.
+"""
+import heapq
+import math
+from typing import List, Tuple
+
+from spatial_index import GridIndex
+
+
+DEFAULT_TOLERANCE = 8.0  # Dopuszczalne odchylenie uproszczonej ścieżki (px)
+DEFAULT_MAX_SPACING = 100.0  # Najdłuższy odcinek po uproszczeniu (px)
+DEFAULT_MAX_SKIPPED = 64  # Najwięcej oryginalnych punktów pominiętych przez jeden odcinek
+
+
+class PolylineSimplifier:
+    """Strumieniowe upraszczanie łamanej z tolerancją w pikselach"""
+
+    def __init__(self, tolerance: float = DEFAULT_TOLERANCE,
+                 max_spacing: float = DEFAULT_MAX_SPACING,
+                 max_skipped: int = DEFAULT_MAX_SKIPPED):
+        self.tolerance = tolerance
+        self.max_spacing = max_spacing
+        self.max_skipped = max_skipped
+        self.reset()
+
+    def reset(self):
+        """Zaczyna nową ścieżkę"""
+        self.xs: List[float] = []
+        self.ys: List[float] = []
+        self.prev: List[int] = []
+        self.next: List[int] = []
+        self.version: List[int] = []  # Wersja kosztu punktu (wpisy w kopcu są leniwe)
+        self.heap: List[Tuple[float, int, int]] = []  # (koszt usunięcia, wersja, punkt)
+        self.kept = 0
+        self.added = 0
+
+    def __len__(self):
+        return self.kept
+
+    def _cost(self, i: int) -> float:
+        """Największe odchylenie pominiętych punktów po usunięciu punktu i.
+
+        Sprawdzane są wszystkie oryginalne punkty między sąsiadami, więc
+        uproszczona ścieżka nigdy nie odchodzi od narysowanej o więcej niż
+        tolerancja (inf gdy odcinek byłby dłuższy niż max_spacing albo
+        pominąłby więcej niż max_skipped punktów).
+        """
+        p, n = self.prev[i], self.next[i]
+        if n - p - 1 > self.max_skipped:
+            return float('inf')
+        xs, ys = self.xs, self.ys
+        ax, ay, bx, by = xs[p], ys[p], xs[n], ys[n]
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        if length2 > self.max_spacing * self.max_spacing:
+            return float('inf')
+        if length2 == 0:
+            return max(math.hypot(xs[k] - ax, ys[k] - ay) for k in range(p + 1, n))
+
+        # Porównujemy kwadraty odległości (bez pierwiastka w pętli)
+        limit2 = self.tolerance * self.tolerance
+        worst2 = 0.0
+        for k in range(p + 1, n):
+            px, py = xs[k] - ax, ys[k] - ay
+            t = (px * dx + py * dy) / length2
+            if t < 0.0:
+                t = 0.0
+            elif t > 1.0:
+                t = 1.0
+            ex, ey = px - t * dx, py - t * dy
+            d2 = ex * ex + ey * ey
+            if d2 > worst2:
+                worst2 = d2
+                if worst2 >= limit2:
+                    break
+        return math.sqrt(worst2)
+
+    def _schedule(self, i: int):
+        """Przelicza koszt punktu pośredniego i wstawia go do kopca"""
+        self.version[i] += 1
+        if self.prev[i] < 0 or self.next[i] < 0:
+            return  # Końce ścieżki zostają zawsze
+        cost = self._cost(i)
+        if cost < self.tolerance:
+            heapq.heappush(self.heap, (cost, self.version[i], i))
+
+    def add(self, x: float, y: float):
+        """Dodaje kolejny punkt ścieżki i usuwa punkty, które przestały być potrzebne"""
+        self.added += 1
+        last = len(self.xs) - 1
+        if last >= 0 and self.xs[last] == x and self.ys[last] == y:
+            return  # Powtórzona pozycja
+
+        i = last + 1
+        self.xs.append(x)
+        self.ys.append(y)
+        self.prev.append(last)
+        self.next.append(-1)
+        self.version.append(0)
+        self.kept += 1
+        if last >= 0:
+            self.next[last] = i
+            self._schedule(last)  # Poprzedni punkt ma teraz obu sąsiadów
+        self._drain()
+
+    def _drain(self):
+        """Usuwa punkty o koszcie poniżej tolerancji (od najmniej istotnego)"""
+        heap = self.heap
+        while heap:
+            cost, version, i = heapq.heappop(heap)
+            if version != self.version[i]:
+                continue  # Wpis nieaktualny
+            p, n = self.prev[i], self.next[i]
+            self.next[p] = n
+            self.prev[n] = p
+            self.version[i] = -1  # Punkt usunięty
+            self.kept -= 1
+            self._schedule(p)
+            self._schedule(n)
+
+    def points(self) -> List[Tuple[float, float]]:
+        """Punkty uproszczonej ścieżki w kolejności rysowania"""
+        result = []
+        i = 0 if self.xs else -1
+        while i >= 0:
+            result.append((self.xs[i], self.ys[i]))
+            i = self.next[i]
+        return result
+
+
+def simplify_polyline(points: List[Tuple[float, float]], tolerance: float = DEFAULT_TOLERANCE,
+                      max_spacing: float = DEFAULT_MAX_SPACING,
+                      max_skipped: int = DEFAULT_MAX_SKIPPED) -> List[Tuple[float, float]]:
+    """Upraszcza całą łamaną naraz"""
+    simplifier = PolylineSimplifier(tolerance, max_spacing, max_skipped)
+    for x, y in points:
+        simplifier.add(x, y)
+    return simplifier.points()
+
+
+def merge_close_points(points: List[Tuple[float, float]],
+                       radius: float = 40.0) -> List[Tuple[float, float]]:
+    """Grupuje bliskie punkty (np. powrót tym samym korytarzem) w ich średnią.
+
+    Punkt trafia do najwcześniejszej grupy, której pierwszy punkt leży w
+    promieniu radius, albo zaczyna nową grupę. Indeks siatki zastępuje
+    porównywanie każdej pary punktów.
+    """
+    if len(points) <= 2:
+        return list(points)
+
+    seeds = GridIndex(radius)
+    clusters: List[List[float]] = []  # [suma x, suma y, liczba punktów]
+    for x, y in points:
+        candidates = seeds.within(x, y, radius)
+        if candidates:
+            cluster = clusters[min(key for key, _ in candidates)]
+            cluster[0] += x
+            cluster[1] += y
+            cluster[2] += 1
+        else:
+            seeds.insert(len(clusters), x, y)
+            clusters.append([x, y, 1])
+    return [(sx / count, sy / count) for sx, sy, count in clusters]
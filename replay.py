@@ -0,0 +1,250 @@
+"""Odtwarzanie nagranych przejść (ślady JSONL) przez silnik nawigacji bez GUI.
+
+Każda linia śladu to jedna próbka pozycji, np.
+    {"floor": "0", "x": 120.5, "y": 88.0, "t": 1.25}
+(t w sekundach od początku nagrania). Próbki są podawane do NavigationSession
+tak szybko jak się da albo w czasie rzeczywistym (--realtime, odstępy wg t).
+Dla każdego śladu raport zawiera zdarzenia nawigacji, wynik zgodności z trasą
+(jak check_route_compliance w GPS Navigatorze) i percentyle czasu
+przetwarzania próbki. Wiele śladów jest odtwarzanych w puli procesów.
+
+Użycie:
+    python replay.py walks/*.jsonl --route shortest_path.json
+    python replay.py walk.jsonl --realtime --events
+    python replay.py --synthetic 500 --workers 4 --report replay_report.json
+"""
+import argparse
+import json
+import math
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+
+from navigation_session import (Arrived, Guidance, NavigationSession, DEFAULT_DEVIATION_THRESHOLD,
+                                DEFAULT_PROXIMITY_THRESHOLD, node_floor)
+
+
+Sample = Tuple[Optional[str], float, float, float]  # (piętro, x, y, t)
+
+_route = None  # Trasa w procesie roboczym: (route, nodes_coords, path_segments)
+
+
+def load_route(filename: str) -> Tuple[List[str], Dict[str, dict], List[dict]]:
+    """Wczytuje trasę z pliku shortest_path.json"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    route = data.get('shortest_path', {}).get('path', [])
+    return route, data.get('nodes_coordinates', {}), data.get('path_segments', [])
+
+
+def read_trace(filename: str) -> List[Sample]:
+    """Wczytuje ślad JSONL (puste linie są pomijane)"""
+    samples = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                floor = record.get('floor')
+                samples.append((None if floor is None else str(floor),
+                                float(record['x']), float(record['y']),
+                                float(record.get('t', len(samples)))))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{filename}:{line_number}: nieprawidłowa próbka ({e})")
+    return samples
+
+
+def synthetic_trace(route: List[str], nodes_coords: Dict[str, dict], step: float = 5.0,
+                    speed: float = 40.0, jitter: float = 0.0, seed: int = 0) -> List[Sample]:
+    """Ślad przejścia wzdłuż trasy (próbka co step px, szum jitter px)"""
+    rng = random.Random(seed)
+    samples = []
+    t = 0.0
+    for a, b in zip(route, route[1:]):
+        ca, cb = nodes_coords.get(a), nodes_coords.get(b)
+        if not ca or not cb or node_floor(a) != node_floor(b):
+            continue  # Przejście między piętrami - brak próbek na schodach/w windzie
+        floor = node_floor(a)
+        length = math.hypot(cb['x'] - ca['x'], cb['y'] - ca['y'])
+        count = max(1, int(length / step))
+        for k in range(count + 1):
+            f = k / count
+            samples.append((floor,
+                            ca['x'] + (cb['x'] - ca['x']) * f + rng.uniform(-jitter, jitter),
+                            ca['y'] + (cb['y'] - ca['y']) * f + rng.uniform(-jitter, jitter),
+                            t + f * length / speed))
+        t += length / speed
+    return samples
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentyl p (0-100) z listy wartości (najbliższy ranking)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(math.ceil(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """Percentyle czasu przetwarzania próbki (ms)"""
+    return {
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies) if latencies else 0.0
+    }
+
+
+def replay(samples: List[Sample], route: List[str], nodes_coords: Dict[str, dict],
+           path_segments: Optional[List[dict]] = None, realtime: bool = False,
+           proximity_threshold: float = DEFAULT_PROXIMITY_THRESHOLD,
+           deviation_threshold: float = DEFAULT_DEVIATION_THRESHOLD,
+           keep_latencies: bool = False) -> dict:
+    """Odtwarza jeden ślad i zwraca raport (zdarzenia, zgodność, opóźnienia)"""
+    session = NavigationSession(route, nodes_coords, path_segments,
+                                proximity_threshold=proximity_threshold,
+                                deviation_threshold=deviation_threshold)
+    latencies = []
+    counts = Counter()
+    log = []  # Zdarzenia poza wskazówkami: (indeks próbki, nazwa, pola)
+    perf_counter = time.perf_counter
+    started = perf_counter()
+    first_t = samples[0][3] if samples else 0.0
+
+    for i, (floor, x, y, t) in enumerate(samples):
+        if realtime:
+            delay = (t - first_t) - (perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        before = perf_counter()
+        events = session.update(x, y, floor)
+        latencies.append((perf_counter() - before) * 1000)
+        for event in events:
+            name = type(event).__name__
+            counts[name] += 1
+            if not isinstance(event, (Guidance, Arrived)):
+                log.append((i, name, asdict(event)))
+        if session.finished:
+            break
+
+    result = {
+        'samples': len(latencies),
+        'elapsed': perf_counter() - started,
+        'arrived': session.finished,
+        'compliance': asdict(session.compliance) if session.compliance else None,
+        'visited': len(session.visited_nodes),
+        'route_length': len(route),
+        'events': dict(counts),
+        'event_log': log,
+        'latency_ms': latency_summary(latencies)
+    }
+    if keep_latencies:
+        result['latencies'] = latencies
+    return result
+
+
+def _init_worker(route_filename: str):
+    """Inicjalizacja procesu roboczego: trasa wczytana raz"""
+    global _route
+    _route = load_route(route_filename)
+
+
+def _replay_job(job) -> Tuple[str, dict]:
+    """Odtwarza ślad w procesie roboczym: job = (nazwa, plik lub None, próbki, opcje)"""
+    name, filename, samples, options = job
+    if filename is not None:
+        samples = read_trace(filename)
+    route, nodes_coords, path_segments = _route
+    return name, replay(samples, route, nodes_coords, path_segments,
+                        keep_latencies=True, **options)
+
+
+def replay_many(jobs: list, route_filename: str,
+                workers: Optional[int] = None) -> List[Tuple[str, dict]]:
+    """Odtwarza wiele śladów (w puli procesów, gdy jest więcej niż jeden)"""
+    if len(jobs) <= 1 or workers == 1:
+        _init_worker(route_filename)
+        return [_replay_job(job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(route_filename,)) as pool:
+        chunksize = max(1, len(jobs) // ((workers or 1) * 8))
+        return list(pool.map(_replay_job, jobs, chunksize=chunksize))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Odtwarzanie nagranych przejść przez nawigację")
+    parser.add_argument('traces', nargs='*', help="pliki śladów JSONL (floor, x, y, t)")
+    parser.add_argument('--route', default="shortest_path.json", help="plik trasy")
+    parser.add_argument('--realtime', action='store_true',
+                        help="odstępy między próbkami wg t (domyślnie najszybciej jak się da)")
+    parser.add_argument('--workers', type=int, help="liczba procesów (domyślnie liczba rdzeni)")
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help="dodatkowo N syntetycznych przejść wzdłuż trasy")
+    parser.add_argument('--jitter', type=float, default=3.0,
+                        help="szum pozycji syntetycznych przejść (px)")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_PROXIMITY_THRESHOLD,
+                        help="próg bliskości punktu (px)")
+    parser.add_argument('--events', action='store_true', help="wypisz zdarzenia każdego śladu")
+    parser.add_argument('--report', help="zapisz pełny raport do pliku JSON")
+    args = parser.parse_args()
+
+    route, nodes_coords, _ = load_route(args.route)
+    if not route:
+        print(f"✗ Brak trasy w pliku {args.route}")
+        return
+
+    options = {'realtime': args.realtime, 'proximity_threshold': args.threshold}
+    jobs = [(filename, filename, None, options) for filename in args.traces]
+    for seed in range(args.synthetic):
+        samples = synthetic_trace(route, nodes_coords, jitter=args.jitter, seed=seed)
+        jobs.append((f"synthetic_{seed}", None, samples, options))
+    if not jobs:
+        print("✗ Podaj pliki śladów lub --synthetic N")
+        return
+
+    started = time.perf_counter()
+    results = replay_many(jobs, args.route, args.workers)
+    elapsed = time.perf_counter() - started
+
+    all_latencies = []
+    compliant = 0
+    for name, result in results:
+        all_latencies.extend(result.pop('latencies'))
+        compliance = result['compliance']
+        if compliance and compliance['compliant']:
+            compliant += 1
+        if result['arrived']:
+            status = "✓ zgodnie z trasą" if compliance['compliant'] else "✗ odstępstwo od trasy"
+        else:
+            status = "✗ nie dotarł do celu"
+        latency = result['latency_ms']
+        print(f"{name}: {status} | próbek {result['samples']} | "
+              f"punkty {result['visited']}/{result['route_length']} | "
+              f"p50 {latency['p50']:.3f} ms, p99 {latency['p99']:.3f} ms")
+        if args.events:
+            for index, event_name, fields in result['event_log']:
+                print(f"    [{index}] {event_name} {fields}")
+
+    total = latency_summary(all_latencies)
+    print(f"\n✓ Odtworzono {len(results)} śladów ({len(all_latencies)} próbek) w {elapsed:.2f} s"
+          f" - {len(all_latencies) / elapsed:.0f} próbek/s")
+    print(f"  Zgodnie z trasą: {compliant}/{len(results)}")
+    print(f"  Czas próbki: p50 {total['p50']:.3f} ms | p95 {total['p95']:.3f} ms | "
+          f"p99 {total['p99']:.3f} ms | max {total['max']:.3f} ms")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'route': args.route, 'latency_ms': total,
+                       'traces': dict(results)}, f, indent=2, ensure_ascii=False)
+        print(f"✓ Zapisano raport: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Śledzenie postępu na trasie przez rzutowanie pozycji na odcinki trasy.
+
+Trasa (shortest_path + nodes_coordinates) jest zamieniana na łamaną: odcinek i
+łączy węzły i oraz i + 1. Pozycja użytkownika jest rzutowana tylko na kilka
+odcinków wokół bieżącego (okno), a sumy prefiksowe długości odcinków dają
+pozostały dystans i szacowany czas dotarcia w O(1) na zdarzenie.
+"""
+import math
+from typing import Dict, List, NamedTuple, Optional
+
+from spatial_index import GridIndex
+
+
+DEFAULT_WALKING_SPEED = 40.0  # Prędkość marszu w px/s (do szacowania czasu)
+SEARCH_WINDOW = 3  # Liczba odcinków sprawdzanych przed i za bieżącym
+RELOCATE_DISTANCE = 50.0  # Odległość od trasy, po której szukamy odcinka od nowa
+
+
+class RouteProgress(NamedTuple):
+    """Wynik rzutowania pozycji na trasę"""
+    segment_index: int  # Odcinek, na który rzutowano pozycję
+    next_node_index: int  # Indeks węzła trasy, do którego zmierza użytkownik
+    offset: float  # Odległość pozycji od trasy
+    covered: float  # Dystans przebyty wzdłuż trasy
+    remaining: float  # Dystans pozostały do celu
+    eta: float  # Szacowany czas dotarcia (s)
+
+
+class RouteProgressTracker:
+    """Rzutuje kolejne pozycje użytkownika na odcinki trasy"""
+
+    def __init__(self, route: List[str], nodes_coords: Dict[str, dict],
+                 path_segments: Optional[List[dict]] = None,
+                 window: int = SEARCH_WINDOW,
+                 walking_speed: float = DEFAULT_WALKING_SPEED):
+        self.route = route
+        self.window = window
+        self.walking_speed = walking_speed
+
+        # Odcinki trasy: początek, wektor, kwadrat długości i piętro
+        # (None dla przejść między piętrami i węzłów bez współrzędnych)
+        count = max(0, len(route) - 1)
+        self.ax = [0.0] * count
+        self.ay = [0.0] * count
+        self.dx = [0.0] * count
+        self.dy = [0.0] * count
+        self.length2 = [0.0] * count
+        self.floors: List[Optional[str]] = [None] * count
+        self.prefix = [0.0] * len(route)  # Dystans od startu do węzła i
+
+        segment_distances = {}
+        for segment in path_segments or []:
+            segment_distances[(segment.get('from'), segment.get('to'))] = segment.get('distance', 0)
+
+        node_floors = [self._node_floor(node, nodes_coords) for node in route]
+        self.node_index: Dict[str, GridIndex] = {}  # Piętro -> węzły trasy (indeksy)
+        for i, node in enumerate(route):
+            coords = nodes_coords.get(node)
+            if coords:
+                floor = node_floors[i]
+                if floor not in self.node_index:
+                    self.node_index[floor] = GridIndex(RELOCATE_DISTANCE)
+                self.node_index[floor].insert(i, coords['x'], coords['y'])
+
+        for i in range(count):
+            a = nodes_coords.get(route[i])
+            b = nodes_coords.get(route[i + 1])
+            length = segment_distances.get((route[i], route[i + 1]), 0)
+            if a and b and node_floors[i] == node_floors[i + 1]:
+                self.ax[i], self.ay[i] = a['x'], a['y']
+                self.dx[i], self.dy[i] = b['x'] - a['x'], b['y'] - a['y']
+                self.length2[i] = self.dx[i] ** 2 + self.dy[i] ** 2
+                self.floors[i] = node_floors[i]
+                length = math.sqrt(self.length2[i])
+            self.prefix[i + 1] = self.prefix[i] + length
+
+        self.total = self.prefix[-1] if route else 0.0
+        self.segment = 0
+
+    @staticmethod
+    def _node_floor(node: str, nodes_coords: Dict[str, dict]) -> str:
+        coords = nodes_coords.get(node) or {}
+        return str(coords.get('floor', node.split('_')[0]))
+
+    def reset(self):
+        """Wraca na początek trasy (nowa nawigacja)"""
+        self.segment = 0
+
+    def _project(self, i: int, x: float, y: float):
+        """Rzut punktu na odcinek i: (odległość od odcinka, dystans od początku odcinka)"""
+        length2 = self.length2[i]
+        if length2 == 0:
+            t = 0.0
+        else:
+            t = ((x - self.ax[i]) * self.dx[i] + (y - self.ay[i]) * self.dy[i]) / length2
+            t = min(1.0, max(0.0, t))
+        px = self.ax[i] + t * self.dx[i]
+        py = self.ay[i] + t * self.dy[i]
+        return math.hypot(x - px, y - py), t * math.sqrt(length2)
+
+    def _best_in_window(self, center: int, x: float, y: float, floor: str):
+        """Najbliższy odcinek piętra w oknie wokół center: (odległość, odcinek, dystans)"""
+        best = None
+        lo = max(0, center - self.window)
+        hi = min(len(self.floors), center + self.window + 1)
+        for i in range(lo, hi):
+            if self.floors[i] is None or self.floors[i] != floor:
+                continue  # Przejście między piętrami, węzeł bez współrzędnych albo inne piętro
+            offset, along = self._project(i, x, y)
+            if best is None or offset < best[0]:
+                best = (offset, i, along)
+        return best
+
+    def update(self, x: float, y: float, floor: str) -> Optional[RouteProgress]:
+        """Rzutuje pozycję (x, y) na piętrze floor na trasę"""
+        if not self.floors:
+            return None
+
+        best = self._best_in_window(self.segment, x, y, floor)
+        if best is None or best[0] > RELOCATE_DISTANCE:
+            # Użytkownik poza oknem (np. zmiana piętra) - skok do najbliższego węzła trasy
+            index = self.node_index.get(floor)
+            nearest = index.nearest(x, y) if index else None
+            if nearest is not None:
+                candidate = self._best_in_window(nearest[0], x, y, floor)
+                if candidate is not None and (best is None or candidate[0] < best[0]):
+                    best = candidate
+        if best is None:
+            return None
+
+        offset, i, along = best
+        self.segment = i
+        covered = self.prefix[i] + along
+        remaining = max(0.0, self.total - covered)
+        eta = remaining / self.walking_speed if self.walking_speed > 0 else 0.0
+        return RouteProgress(i, i + 1, offset, covered, remaining, eta)
@@ -0,0 +1,636 @@
+"""Silnik wyznaczania tras bez GUI (headless).
+
+Mapa z gps_paths.json jest kompilowana raz do niezmiennego grafu
+indeksowanego liczbami całkowitymi (listy sąsiedztwa w formacie CSR),
+a zapytania route(start, end) działają już tylko na tablicach.
+"""
+import hashlib
+import heapq
+import math
+import os
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from map_store import database_filename, journal_filename, read_map
+
+
+DEFAULT_TRAVEL_TIME = 30  # Domyślny koszt przejścia między piętrami
+
+
+def node_key(floor_id, point_id) -> str:
+    """Tworzy globalne ID węzła w formacie "piętro_punkt" """
+    return f"{floor_id}_{point_id}"
+
+
+def split_node(node: str) -> Tuple[str, str]:
+    """Rozbija ID węzła "piętro_punkt" na (piętro, punkt)"""
+    floor_id, _, point_id = node.partition('_')
+    return floor_id, point_id
+
+
+def file_hash(filename: str) -> str:
+    """Zwraca skrót SHA-256 zawartości pliku mapy (razem z dziennikiem zmian albo bazą SQLite)"""
+    digest = hashlib.sha256()
+    if os.path.exists(database_filename(filename)):
+        filename = database_filename(filename)  # Mapa w bazie (map_db.py)
+    for part in (filename, journal_filename(filename)):
+        if part != filename and not os.path.exists(part):
+            continue
+        with open(part, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_building(filename: str) -> dict:
+    """Wczytuje mapę (z dziennikiem zmian) i zwraca ją zawsze w formacie wielopiętrowym"""
+    return as_building(read_map(filename))
+
+
+def as_building(data: dict) -> dict:
+    """Dane mapy w formacie wielopiętrowym (stary format to piętro "0")"""
+    if 'floors' in data and 'building_info' in data:
+        return data
+
+    # Stary format - single floor
+    return {
+        'building_info': {"name": "Budynek", "floors": ["0"], "floor_names": {"0": "Parter"}},
+        'floors': {
+            "0": {
+                "paths": data.get('paths', []),
+                "connections": data.get('connections', []),
+                "point_labels": data.get('point_labels', {})
+            }
+        },
+        'floor_transitions': []
+    }
+
+
+class CompiledGraph:
+    """Niezmienny graf budynku w formacie CSR.
+
+    Węzły są internowane: ID "piętro_punkt" -> indeks 0..N-1. Sąsiedzi węzła i
+    to targets[offsets[i]:offsets[i + 1]] z wagami w weights pod tymi samymi
+    indeksami. Współrzędne brakujących punktów mają wartość NaN.
+    """
+
+    def __init__(self, node_ids, node_floors, floor_ids, xs, ys,
+                 offsets, targets, weights, transitions):
+        self.node_ids = node_ids  # indeks -> "piętro_punkt"
+        self.index = {node: i for i, node in enumerate(node_ids)}
+        self.node_floors = node_floors  # indeks -> indeks piętra
+        self.floor_ids = floor_ids  # indeks piętra -> ID piętra
+        self.xs = xs
+        self.ys = ys
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.transitions = transitions  # (indeks_z, indeks_do) -> opis przejścia
+
+    @classmethod
+    def compile(cls, floors: dict, floor_transitions: list) -> 'CompiledGraph':
+        """Kompiluje dane pięter i przejść do grafu CSR"""
+        node_ids = []
+        index = {}
+        node_floors = array('i')
+        floor_ids = list(floors.keys())
+        floor_index = {floor_id: i for i, floor_id in enumerate(floor_ids)}
+        coords = {}
+        edges = []  # (u, v, waga) - krawędzie nieskierowane
+
+        def intern(floor_id, point_id):
+            node = node_key(floor_id, point_id)
+            i = index.get(node)
+            if i is None:
+                i = len(node_ids)
+                index[node] = i
+                node_ids.append(node)
+                if floor_id not in floor_index:
+                    floor_index[floor_id] = len(floor_ids)
+                    floor_ids.append(floor_id)
+                node_floors.append(floor_index[floor_id])
+            return i
+
+        for floor_id, floor_data in floors.items():
+            for path in floor_data.get('paths', []):
+                # Obsługa nowego formatu: path ma 'points'
+                if isinstance(path, dict) and 'points' in path:
+                    for point in path['points']:
+                        if isinstance(point, dict) and 'id' in point:
+                            x = point.get('x', 0)
+                            y = point.get('y', 0)
+                            if x != 0 or y != 0:
+                                coords[node_key(floor_id, point['id'])] = (x, y)
+
+            for conn in floor_data.get('connections', []):
+                u = intern(floor_id, conn['from'])
+                v = intern(floor_id, conn['to'])
+                edges.append((u, v, conn['distance']))
+
+        transitions = {}
+        for transition in floor_transitions:
+            u = intern(transition['from_floor'], transition['from_point'])
+            v = intern(transition['to_floor'], transition['to_point'])
+            edges.append((u, v, transition.get('travel_time', DEFAULT_TRAVEL_TIME)))
+            transitions.setdefault((u, v), transition)
+            transitions.setdefault((v, u), transition)
+
+        n = len(node_ids)
+        nan = float('nan')
+        xs = array('d', [nan]) * n
+        ys = array('d', [nan]) * n
+        for node, (x, y) in coords.items():
+            i = index.get(node)
+            if i is not None:
+                xs[i] = x
+                ys[i] = y
+
+        # Zlicz stopnie i rozłóż krawędzie do tablic CSR
+        offsets = array('i', [0]) * (n + 1)
+        for u, v, _ in edges:
+            offsets[u + 1] += 1
+            offsets[v + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+
+        fill = array('i', offsets[:n])
+        targets = array('i', [0]) * len(edges) * 2
+        weights = array('d', [0.0]) * len(edges) * 2
+        for u, v, w in edges:
+            targets[fill[u]] = v
+            weights[fill[u]] = w
+            fill[u] += 1
+            targets[fill[v]] = u
+            weights[fill[v]] = w
+            fill[v] += 1
+
+        return cls(node_ids, node_floors, floor_ids, xs, ys,
+                   offsets, targets, weights, transitions)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def has_coords(self, i: int) -> bool:
+        """Czy węzeł ma zapisane współrzędne"""
+        return self.xs[i] == self.xs[i]  # NaN != NaN
+
+    def floor_of(self, i: int) -> str:
+        """Zwraca ID piętra węzła"""
+        return self.floor_ids[self.node_floors[i]]
+
+    def edge_weight(self, u: int, v: int) -> Optional[float]:
+        """Zwraca wagę pierwszej krawędzi u -> v (jak dawny self.graph)"""
+        for k in range(self.offsets[u], self.offsets[u + 1]):
+            if self.targets[k] == v:
+                return self.weights[k]
+        return None
+
+    def adjacency(self) -> Dict[str, List[Tuple[str, float]]]:
+        """Zwraca graf jako słownik list (na potrzeby wizualizacji)"""
+        node_ids = self.node_ids
+        return {
+            node: [(node_ids[self.targets[k]], self.weights[k])
+                   for k in range(self.offsets[i], self.offsets[i + 1])]
+            for i, node in enumerate(node_ids)
+        }
+
+    def point_coords(self) -> Dict[str, Tuple[float, float]]:
+        """Zwraca współrzędne węzłów, które je posiadają"""
+        return {node: (self.xs[i], self.ys[i])
+                for i, node in enumerate(self.node_ids) if self.has_coords(i)}
+
+
+class FloorHeuristic:
+    """Dopuszczalne dolne ograniczenie odległości do celu dla A*.
+
+    Na piętrze celu jest to odległość euklidesowa (przeskalowana tak, by nie
+    przekraczała wag krawędzi). Z innych pięter trzeba dojść do jednego z
+    punktów przejścia, więc ograniczeniem jest min po przejściach e piętra:
+    odległość do e + dolne ograniczenie drogi z e do celu, liczone raz na
+    zapytanie na małym grafie samych punktów przejść (travel_time).
+    """
+
+    def __init__(self, graph: CompiledGraph):
+        self.graph = graph
+        offsets = graph.offsets
+        targets = graph.targets
+        weights = graph.weights
+        node_floors = graph.node_floors
+        xs, ys = graph.xs, graph.ys
+
+        # Skala: min(waga / odległość) po krawędziach w obrębie piętra.
+        # Piętro z punktami bez współrzędnych nie ma ograniczenia geometrycznego.
+        self.scale = [1.0] * len(graph.floor_ids)
+        self.exits = [[] for _ in graph.floor_ids]  # piętro -> punkty przejść
+
+        for u in range(len(graph)):
+            fu = node_floors[u]
+            is_exit = False
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if node_floors[v] != fu:
+                    is_exit = True
+                    continue
+                if not (graph.has_coords(u) and graph.has_coords(v)):
+                    self.scale[fu] = 0.0
+                    continue
+                length = math.hypot(xs[u] - xs[v], ys[u] - ys[v])
+                if length > 0:
+                    self.scale[fu] = max(0.0, min(self.scale[fu], weights[k] / length))
+            if is_exit:
+                self.exits[fu].append(u)
+
+    def _bound(self, u: int, v: int) -> float:
+        """Dolne ograniczenie drogi między węzłami tego samego piętra"""
+        graph = self.graph
+        if not (graph.has_coords(u) and graph.has_coords(v)):
+            return 0.0
+        scale = self.scale[graph.node_floors[u]]
+        return scale * math.hypot(graph.xs[u] - graph.xs[v], graph.ys[u] - graph.ys[v])
+
+    def exit_bounds(self, t: int) -> Dict[int, float]:
+        """Dolne ograniczenie odległości z każdego punktu przejścia do t"""
+        graph = self.graph
+        offsets = graph.offsets
+        targets = graph.targets
+        weights = graph.weights
+        node_floors = graph.node_floors
+
+        dist = {t: 0.0}
+        pq = [(0.0, t)]
+        inf = float('inf')
+        while pq:
+            d, u = heapq.heappop(pq)
+            if d > dist[u]:
+                continue
+            fu = node_floors[u]
+
+            # W obrębie piętra: do każdego innego punktu przejścia
+            for v in self.exits[fu]:
+                if v != u:
+                    nd = d + self._bound(u, v)
+                    if nd < dist.get(v, inf):
+                        dist[v] = nd
+                        heapq.heappush(pq, (nd, v))
+
+            # Przejścia między piętrami (krawędzie CSR na inne piętro)
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if node_floors[v] != fu:
+                    nd = d + weights[k]
+                    if nd < dist.get(v, inf):
+                        dist[v] = nd
+                        heapq.heappush(pq, (nd, v))
+        return dist
+
+    def for_target(self, t: int):
+        """Zwraca funkcję h(v) dla zadanego celu"""
+        graph = self.graph
+        node_floors = graph.node_floors
+        xs, ys = graph.xs, graph.ys
+        scale = self.scale
+        target_floor = node_floors[t]
+        t_coords = graph.has_coords(t)
+        tx, ty = xs[t], ys[t]
+        hypot = math.hypot
+        inf = float('inf')
+
+        bounds = self.exit_bounds(t)
+        floor_exits = [
+            [(xs[e], ys[e], graph.has_coords(e), bounds[e]) for e in exits if e in bounds]
+            for exits in self.exits
+        ]
+
+        def h(v: int) -> float:
+            f = node_floors[v]
+            s = scale[f]
+            has = xs[v] == xs[v]
+            x, y = xs[v], ys[v]
+            best = inf
+            if f == target_floor:
+                best = s * hypot(x - tx, y - ty) if has and t_coords else 0.0
+            for ex, ey, e_has, lb in floor_exits[f]:
+                if lb >= best:
+                    continue
+                term = lb + s * hypot(x - ex, y - ey) if has and e_has else lb
+                if term < best:
+                    best = term
+            return best
+
+        return h
+
+
+class RoutingEngine:
+    """Wyznacza najkrótsze trasy na skompilowanym grafie budynku"""
+
+    METHODS = {
+        'dijkstra': "Dijkstra",
+        'bidirectional': "Dijkstra dwukierunkowy",
+        'astar': "A*",
+        'tables': "Tablice przejść",
+        'ch': "Contraction Hierarchies",
+    }
+
+    def __init__(self, graph: CompiledGraph, map_filename: Optional[str] = None):
+        self.graph = graph
+        self.map_filename = map_filename  # Plik mapy (do zapisu tablic obok niego)
+        self._heuristic = None
+        self._transition_tables = None
+        self._contraction = None
+        self.stats = {}  # Statystyki ostatniego zapytania
+
+    @classmethod
+    def from_file(cls, filename: str = "gps_paths.json") -> 'RoutingEngine':
+        """Wczytuje graf ze skompilowanej mapy (mmap) albo mapę z pliku i kompiluje graf"""
+        from compiled_map import load_compiled  # compiled_map importuje routing
+        compiled = load_compiled(filename)
+        if compiled is not None:
+            return cls(compiled.graph(), filename)
+        data = load_building(filename)
+        graph = CompiledGraph.compile(data.get('floors', {}), data.get('floor_transitions', []))
+        return cls(graph, filename)
+
+    @property
+    def heuristic(self) -> FloorHeuristic:
+        """Heurystyka A* (budowana przy pierwszym użyciu)"""
+        if self._heuristic is None:
+            self._heuristic = FloorHeuristic(self.graph)
+        return self._heuristic
+
+    @property
+    def transition_tables(self):
+        """Tablice przejść (wczytywane z pliku obok mapy lub budowane)"""
+        if self._transition_tables is None:
+            from transition_tables import TransitionTables
+            if self.map_filename and os.path.exists(self.map_filename):
+                self._transition_tables = TransitionTables.for_map(self.graph, self.map_filename)
+            else:
+                self._transition_tables = TransitionTables.build(self.graph)
+        return self._transition_tables
+
+    @property
+    def contraction(self):
+        """Indeks Contraction Hierarchies (wczytywany z pliku obok mapy lub budowany)"""
+        if self._contraction is None:
+            from contraction import ContractionHierarchy
+            if self.map_filename and os.path.exists(self.map_filename):
+                self._contraction = ContractionHierarchy.for_map(self.graph, self.map_filename)
+            else:
+                self._contraction = ContractionHierarchy.build(self.graph)
+        return self._contraction
+
+    def route(self, start: str, end: str,
+              method: str = 'dijkstra') -> Tuple[Optional[List[str]], float]:
+        """Najkrótsza ścieżka między węzłami "piętro_punkt" """
+        graph = self.graph
+        s = graph.index.get(start)
+        t = graph.index.get(end)
+        self.stats = {'method': method, 'settled': 0}
+        if s is None or t is None:
+            return None, float('inf')
+
+        if method == 'dijkstra':
+            path, distance = self._dijkstra(s, t)
+        elif method == 'bidirectional':
+            path, distance = self._bidirectional(s, t)
+        elif method == 'astar':
+            path, distance = self._astar(s, t)
+        elif method == 'tables':
+            path, distance = self.transition_tables.route(s, t)
+        elif method == 'ch':
+            path, distance = self.contraction.route(s, t)
+            self.stats['settled'] = self.contraction.settled
+        else:
+            raise ValueError(f"Nieznana metoda wyznaczania trasy: {method}")
+
+        if path is None:
+            return None, float('inf')
+        return [graph.node_ids[i] for i in path], distance
+
+    def _dijkstra(self, s: int, t: int) -> Tuple[Optional[List[int]], float]:
+        """Algorytm Dijkstry na tablicach CSR ze wskaźnikami poprzedników.
+
+        Odległości i poprzednicy są trzymani w słownikach uzupełnianych
+        leniwie (tylko odwiedzone węzły), a ścieżka jest odtwarzana raz,
+        po dotarciu do celu.
+        """
+        offsets = self.graph.offsets
+        targets = self.graph.targets
+        weights = self.graph.weights
+
+        dist = {s: 0.0}
+        parent = {s: -1}
+        pq = [(0.0, s)]
+        inf = float('inf')
+        get_dist = dist.get
+        push = heapq.heappush
+        pop = heapq.heappop
+        settled = 0
+
+        try:
+            while pq:
+                d, u = pop(pq)
+                if d > dist[u]:
+                    continue  # Nieaktualny wpis w kolejce
+                settled += 1
+
+                if u == t:
+                    return self._unwind(parent, t), d
+
+                for k in range(offsets[u], offsets[u + 1]):
+                    v = targets[k]
+                    nd = d + weights[k]
+                    if nd < get_dist(v, inf):
+                        dist[v] = nd
+                        parent[v] = u
+                        push(pq, (nd, v))
+
+            return None, inf
+        finally:
+            self.stats['settled'] = settled
+
+    def _bidirectional(self, s: int, t: int) -> Tuple[Optional[List[int]], float]:
+        """Dijkstra dwukierunkowy: fronty od startu i od celu (graf nieskierowany).
+
+        Zawsze rozwijany jest kierunek z mniejszym minimum w kolejce. Wyszukiwanie
+        kończy się, gdy suma minimów obu kolejek nie jest mniejsza od najlepszej
+        znalezionej drogi przez węzeł spotkania.
+        """
+        offsets = self.graph.offsets
+        targets = self.graph.targets
+        weights = self.graph.weights
+
+        inf = float('inf')
+        dist = ({s: 0.0}, {t: 0.0})
+        parent = ({s: -1}, {t: -1})
+        queues = ([(0.0, s)], [(0.0, t)])
+        best, meet = (0.0, s) if s == t else (inf, -1)
+        push = heapq.heappush
+        pop = heapq.heappop
+        settled = 0
+
+        try:
+            while queues[0] and queues[1]:
+                if queues[0][0][0] + queues[1][0][0] >= best:
+                    break  # Warunek spotkania w środku
+                side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+                d, u = pop(queues[side])
+                own = dist[side]
+                if d > own[u]:
+                    continue
+                settled += 1
+
+                other = dist[1 - side]
+                own_parent = parent[side]
+                pq = queues[side]
+                for k in range(offsets[u], offsets[u + 1]):
+                    v = targets[k]
+                    nd = d + weights[k]
+                    if nd < own.get(v, inf):
+                        own[v] = nd
+                        own_parent[v] = u
+                        push(pq, (nd, v))
+                        through = other.get(v)
+                        if through is not None and nd + through < best:
+                            best, meet = nd + through, v
+
+            if meet == -1:
+                return None, inf
+            path = self._unwind(parent[0], meet)
+            u = parent[1][meet]
+            while u != -1:
+                path.append(u)
+                u = parent[1][u]
+            return path, best
+        finally:
+            self.stats['settled'] = settled
+
+    def _astar(self, s: int, t: int) -> Tuple[Optional[List[int]], float]:
+        """A* z heurystyką uwzględniającą piętra (FloorHeuristic).
+
+        Węzeł może zostać rozwinięty ponownie, gdy znajdzie się do niego
+        krótsza droga, więc wynik jest dokładny także wtedy, gdy heurystyka
+        jest tylko dopuszczalna (a nie spójna).
+        """
+        offsets = self.graph.offsets
+        targets = self.graph.targets
+        weights = self.graph.weights
+        h = self.heuristic.for_target(t)
+
+        inf = float('inf')
+        h_start = h(s)
+        if h_start == inf:
+            return None, inf  # Piętro celu jest nieosiągalne
+
+        dist = {s: 0.0}
+        parent = {s: -1}
+        h_cache = {s: h_start}
+        pq = [(h_start, -0.0, s)]
+        get_dist = dist.get
+        push = heapq.heappush
+        pop = heapq.heappop
+        settled = 0
+
+        try:
+            while pq:
+                _, d, u = pop(pq)
+                d = -d
+                if d > dist[u]:
+                    continue
+                settled += 1
+
+                if u == t:
+                    return self._unwind(parent, t), d
+
+                for k in range(offsets[u], offsets[u + 1]):
+                    v = targets[k]
+                    nd = d + weights[k]
+                    if nd < get_dist(v, inf):
+                        hv = h_cache.get(v)
+                        if hv is None:
+                            hv = h_cache[v] = h(v)
+                        if hv == inf:
+                            continue
+                        dist[v] = nd
+                        parent[v] = u
+                        push(pq, (nd + hv, -nd, v))  # Remisy: głębsze węzły najpierw
+
+            return None, inf
+        finally:
+            self.stats['settled'] = settled
+
+    def one_to_many(self, start: str, ends: List[str]) -> Dict[str, float]:
+        """Odległości ze startu do wielu celów jednym przebiegiem Dijkstry.
+
+        Wyszukiwanie kończy się po rozwinięciu wszystkich osiągalnych celów;
+        nieosiągalne cele mają odległość inf.
+        """
+        graph = self.graph
+        offsets = graph.offsets
+        targets = graph.targets
+        weights = graph.weights
+        inf = float('inf')
+        result = {end: inf for end in ends}
+        s = graph.index.get(start)
+        if s is None:
+            return result
+
+        pending = {}
+        for end in ends:
+            t = graph.index.get(end)
+            if t is not None:
+                pending.setdefault(t, []).append(end)
+
+        dist = {s: 0.0}
+        pq = [(0.0, s)]
+        get_dist = dist.get
+        push = heapq.heappush
+        pop = heapq.heappop
+        while pq and pending:
+            d, u = pop(pq)
+            if d > dist[u]:
+                continue
+            for end in pending.pop(u, ()):
+                result[end] = d
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                nd = d + weights[k]
+                if nd < get_dist(v, inf):
+                    dist[v] = nd
+                    push(pq, (nd, v))
+        return result
+
+    def incremental(self, end: str):
+        """Przyrostowe wyszukiwanie tras do celu end (D* Lite) lub None"""
+        t = self.graph.index.get(end)
+        if t is None:
+            return None
+        from dstar_lite import DStarLite
+        return DStarLite(self.graph, t, self.heuristic)
+
+    @staticmethod
+    def _unwind(parent: Dict[int, int], t: int) -> List[int]:
+        """Odtwarza ścieżkę od źródła do t po wskaźnikach poprzedników"""
+        path = []
+        while t != -1:
+            path.append(t)
+            t = parent[t]
+        path.reverse()
+        return path
+
+    def edge_weight(self, from_node: str, to_node: str) -> float:
+        """Waga krawędzi między sąsiednimi węzłami (0 jeśli brak)"""
+        u = self.graph.index.get(from_node)
+        v = self.graph.index.get(to_node)
+        if u is None or v is None:
+            return 0
+        weight = self.graph.edge_weight(u, v)
+        return weight if weight is not None else 0
+
+    def find_transition_info(self, from_node: str, to_node: str) -> Optional[dict]:
+        """Znajduje informacje o przejściu między węzłami (w obu kierunkach)"""
+        u = self.graph.index.get(from_node)
+        v = self.graph.index.get(to_node)
+        if u is None or v is None:
+            return None
+        return self.graph.transitions.get((u, v))
@@ -0,0 +1,152 @@
+"""Indeks przestrzenny punktów mapy (jednorodna siatka kubełków).
+
+Punkty są przypisane do kwadratowych komórek o boku cell_size, więc
+zapytania o najbliższy punkt, punkty w promieniu i k najbliższych
+przeglądają tylko komórki wokół zapytania zamiast wszystkich punktów.
+Indeks można aktualizować przyrostowo (insert/remove/move).
+"""
+import heapq
+import math
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class GridIndex:
+    """Siatka kubełków: (kx, ky) -> {klucz: (x, y)}"""
+
+    def __init__(self, cell_size: float = 50.0):
+        self.cell_size = float(cell_size)
+        self.cells: Dict[Tuple[int, int], Dict[Hashable, Tuple[float, float]]] = {}
+        self.positions: Dict[Hashable, Tuple[float, float]] = {}
+        self._bounds = None  # (min_kx, min_ky, max_kx, max_ky) lub None
+
+    @classmethod
+    def from_points(cls, points: Iterable[Tuple[Hashable, float, float]],
+                    cell_size: float = 50.0) -> 'GridIndex':
+        """Buduje indeks z par (klucz, x, y)"""
+        index = cls(cell_size)
+        for key, x, y in points:
+            index.insert(key, x, y)
+        return index
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+
+    def position(self, key) -> Optional[Tuple[float, float]]:
+        """Współrzędne punktu lub None"""
+        return self.positions.get(key)
+
+    def insert(self, key, x: float, y: float):
+        """Dodaje punkt (lub przesuwa istniejący)"""
+        if key in self.positions:
+            self.remove(key)
+        cell = self._cell(x, y)
+        self.cells.setdefault(cell, {})[key] = (x, y)
+        self.positions[key] = (x, y)
+        if self._bounds is None:
+            self._bounds = (cell[0], cell[1], cell[0], cell[1])
+        else:
+            min_kx, min_ky, max_kx, max_ky = self._bounds
+            self._bounds = (min(min_kx, cell[0]), min(min_ky, cell[1]),
+                            max(max_kx, cell[0]), max(max_ky, cell[1]))
+
+    def remove(self, key):
+        """Usuwa punkt (brak punktu nie jest błędem)"""
+        position = self.positions.pop(key, None)
+        if position is None:
+            return
+        cell = self._cell(*position)
+        bucket = self.cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self.cells[cell]
+        if not self.positions:
+            self._bounds = None
+
+    def move(self, key, x: float, y: float):
+        """Zmienia pozycję punktu"""
+        self.insert(key, x, y)
+
+    def _rings(self, x: float, y: float):
+        """Kolejne pierścienie komórek wokół (x, y): (promień, lista komórek)"""
+        if self._bounds is None:
+            return
+        cx, cy = self._cell(x, y)
+        min_kx, min_ky, max_kx, max_ky = self._bounds
+        max_ring = max(cx - min_kx, max_kx - cx, cy - min_ky, max_ky - cy, 0)
+        for r in range(max_ring + 1):
+            if r == 0:
+                ring = [(cx, cy)]
+            else:
+                ring = [(cx + dx, cy - r) for dx in range(-r, r + 1)]
+                ring += [(cx + dx, cy + r) for dx in range(-r, r + 1)]
+                ring += [(cx - r, cy + dy) for dy in range(-r + 1, r)]
+                ring += [(cx + r, cy + dy) for dy in range(-r + 1, r)]
+            yield r, ring
+
+    def nearest(self, x: float, y: float, max_distance: float = float('inf'),
+                exclude=None) -> Optional[Tuple[Hashable, float]]:
+        """Najbliższy punkt (klucz, odległość) w zasięgu max_distance lub None"""
+        found = self.k_nearest(x, y, 1, max_distance, exclude)
+        return found[0] if found else None
+
+    def k_nearest(self, x: float, y: float, k: int, max_distance: float = float('inf'),
+                  exclude=None) -> List[Tuple[Hashable, float]]:
+        """k najbliższych punktów [(klucz, odległość)] posortowanych rosnąco"""
+        if k <= 0:
+            return []
+        exclude = exclude or ()
+        best = []  # kopiec (-odległość, licznik, klucz) z k najlepszymi
+        counter = 0
+        cells = self.cells
+        hypot = math.hypot
+
+        for r, ring in self._rings(x, y):
+            # Punkty z pierścienia r są odległe o co najmniej (r - 1) * cell_size
+            bound = (r - 1) * self.cell_size
+            if bound > max_distance or (len(best) == k and bound >= -best[0][0]):
+                break
+            for cell in ring:
+                bucket = cells.get(cell)
+                if not bucket:
+                    continue
+                for key, (px, py) in bucket.items():
+                    if key in exclude:
+                        continue
+                    d = hypot(px - x, py - y)
+                    if d > max_distance:
+                        continue
+                    counter += 1
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, counter, key))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, counter, key))
+
+        return [(key, -neg) for neg, _, key in sorted(best, key=lambda e: (-e[0], e[1]))]
+
+    def within(self, x: float, y: float, radius: float) -> List[Tuple[Hashable, float]]:
+        """Wszystkie punkty w promieniu [(klucz, odległość)] posortowane rosnąco"""
+        if self._bounds is None:
+            return []
+        min_kx, min_ky = self._cell(x - radius, y - radius)
+        max_kx, max_ky = self._cell(x + radius, y + radius)
+        min_kx, min_ky = max(min_kx, self._bounds[0]), max(min_ky, self._bounds[1])
+        max_kx, max_ky = min(max_kx, self._bounds[2]), min(max_ky, self._bounds[3])
+        hypot = math.hypot
+        found = []
+        for kx in range(min_kx, max_kx + 1):
+            for ky in range(min_ky, max_ky + 1):
+                bucket = self.cells.get((kx, ky))
+                if not bucket:
+                    continue
+                for key, (px, py) in bucket.items():
+                    d = hypot(px - x, py - y)
+                    if d <= radius:
+                        found.append((key, d))
+        found.sort(key=lambda e: e[1])
+        return found
@@ -0,0 +1,314 @@
+"""Prekomputowane tablice odległości do punktów przejść między piętrami.
+
+Dla każdego piętra liczona jest tablica najkrótszych odległości (w obrębie
+piętra) z każdego punktu do każdego końca schodów/windy z floor_transitions.
+Końce przejść tworzą mały graf nakładkowy (overlay), dla którego odległości
+liczone są dla wszystkich par. Zapytanie między piętrami to już tylko
+min po parach przejść: d(start, e1) + overlay(e1, e2) + d(e2, cel).
+
+Tablice są zapisywane obok pliku mapy (gps_paths.transitions.json) razem ze
+skrótem SHA-256 mapy i przebudowywane, gdy zawartość mapy się zmieni.
+"""
+import heapq
+import json
+import os
+from array import array
+from typing import List, Optional, Tuple
+
+from routing import CompiledGraph, file_hash
+
+
+FORMAT_VERSION = 1
+
+
+def tables_filename(map_filename: str) -> str:
+    """Ścieżka pliku z tablicami obok pliku mapy"""
+    base, _ = os.path.splitext(map_filename)
+    return base + ".transitions.json"
+
+
+class TransitionTables:
+    """Tablice odległości punkt <-> punkty przejść oraz graf nakładkowy.
+
+    floor_nodes[f] to węzły piętra f (indeksy globalne), a dla każdego
+    punktu przejścia e: dist[e][j] / parent[e][j] opisują drzewo najkrótszych
+    ścieżek z e do j-tego węzła piętra (parent to indeks lokalny, -1 = brak).
+    """
+
+    def __init__(self, graph: CompiledGraph, map_hash: str,
+                 floor_nodes, exits, dist, parent, overlay_dist, overlay_parent):
+        self.graph = graph
+        self.map_hash = map_hash
+        self.floor_nodes = floor_nodes  # piętro -> lista węzłów
+        self.exits = exits  # piętro -> punkty przejść
+        self.dist = dist  # punkt przejścia -> odległości do węzłów piętra
+        self.parent = parent  # punkt przejścia -> poprzednicy (indeksy lokalne)
+        self.overlay_dist = overlay_dist  # e1 -> {e2: odległość}
+        self.overlay_parent = overlay_parent  # e1 -> {e2: poprzednik e2}
+
+        self.local = array('i', [0]) * len(graph)  # węzeł -> indeks lokalny
+        for nodes in floor_nodes:
+            for j, v in enumerate(nodes):
+                self.local[v] = j
+
+    @classmethod
+    def build(cls, graph: CompiledGraph, map_hash: str = "") -> 'TransitionTables':
+        """Liczy tablice pięter i odległości w grafie nakładkowym"""
+        offsets = graph.offsets
+        targets = graph.targets
+        node_floors = graph.node_floors
+
+        floor_nodes = [[] for _ in graph.floor_ids]
+        exits = [[] for _ in graph.floor_ids]
+        for u in range(len(graph)):
+            fu = node_floors[u]
+            floor_nodes[fu].append(u)
+            if any(node_floors[targets[k]] != fu for k in range(offsets[u], offsets[u + 1])):
+                exits[fu].append(u)
+
+        tables = cls(graph, map_hash, floor_nodes, exits, {}, {}, {}, {})
+        for floor_exits in exits:
+            for e in floor_exits:
+                tables.dist[e], tables.parent[e] = tables._floor_tree(e)
+        tables._build_overlay()
+        return tables
+
+    def _floor_tree(self, source: int) -> Tuple[array, array]:
+        """Dijkstra z punktu przejścia ograniczona do jego piętra"""
+        graph = self.graph
+        offsets = graph.offsets
+        targets = graph.targets
+        weights = graph.weights
+        node_floors = graph.node_floors
+        local = self.local
+        floor = node_floors[source]
+
+        inf = float('inf')
+        size = len(self.floor_nodes[floor])
+        dist = array('d', [inf]) * size
+        parent = array('i', [-1]) * size
+        dist[local[source]] = 0.0
+        pq = [(0.0, source)]
+        while pq:
+            d, u = heapq.heappop(pq)
+            lu = local[u]
+            if d > dist[lu]:
+                continue
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if node_floors[v] != floor:
+                    continue
+                nd = d + weights[k]
+                lv = local[v]
+                if nd < dist[lv]:
+                    dist[lv] = nd
+                    parent[lv] = lu
+                    heapq.heappush(pq, (nd, v))
+        return dist, parent
+
+    def _build_overlay(self):
+        """Odległości między wszystkimi parami punktów przejść"""
+        graph = self.graph
+        offsets = graph.offsets
+        targets = graph.targets
+        weights = graph.weights
+        node_floors = graph.node_floors
+        inf = float('inf')
+
+        # Krawędzie nakładki: przejścia między piętrami + drogi w obrębie piętra
+        overlay = {}
+        for floor_exits in self.exits:
+            for u in floor_exits:
+                edges = overlay[u] = {}
+                for v in floor_exits:
+                    d = self.dist[v][self.local[u]]
+                    if v != u and d < inf:
+                        edges[v] = d
+                for k in range(offsets[u], offsets[u + 1]):
+                    v = targets[k]
+                    if node_floors[v] != node_floors[u] and weights[k] < edges.get(v, inf):
+                        edges[v] = weights[k]
+
+        for source in overlay:
+            dist = {source: 0.0}
+            parent = {source: -1}
+            pq = [(0.0, source)]
+            while pq:
+                d, u = heapq.heappop(pq)
+                if d > dist[u]:
+                    continue
+                for v, w in overlay[u].items():
+                    nd = d + w
+                    if nd < dist.get(v, inf):
+                        dist[v] = nd
+                        parent[v] = u
+                        heapq.heappush(pq, (nd, v))
+            self.overlay_dist[source] = dist
+            self.overlay_parent[source] = parent
+
+    def route(self, s: int, t: int) -> Tuple[Optional[List[int]], float]:
+        """Najkrótsza ścieżka z tablic: wyszukiwanie w obrębie piętra + nakładka"""
+        graph = self.graph
+        local = self.local
+        inf = float('inf')
+        fs = graph.node_floors[s]
+        ft = graph.node_floors[t]
+        ls, lt = local[s], local[t]
+
+        best, best_pair = inf, None
+        path = None
+        if fs == ft:
+            # Na tym samym piętrze trasa zwykle nie opuszcza piętra
+            path, best = self._floor_search(s, t)
+
+        to_exit = [(e, self.dist[e][ls]) for e in self.exits[fs] if self.dist[e][ls] < inf]
+        from_exit = [(e, self.dist[e][lt]) for e in self.exits[ft] if self.dist[e][lt] < inf]
+        for e1, d1 in to_exit:
+            if d1 >= best:
+                continue
+            row = self.overlay_dist[e1]
+            for e2, d2 in from_exit:
+                d = d1 + row.get(e2, inf) + d2
+                if d < best:
+                    best, best_pair = d, (e1, e2)
+
+        if best_pair is None:
+            return path, best
+
+        e1, e2 = best_pair
+        path = self._tree_path(e1, s)  # s ... e1
+        overlay = [e2]
+        while overlay[-1] != e1:
+            overlay.append(self.overlay_parent[e1][overlay[-1]])
+        overlay.reverse()
+        for u, v in zip(overlay, overlay[1:]):
+            if graph.node_floors[u] == graph.node_floors[v]:
+                path.extend(self._tree_path(v, u)[1:])
+            else:
+                path.append(v)
+        path.extend(reversed(self._tree_path(e2, t)[:-1]))  # e2 ... t
+        return path, best
+
+    def _tree_path(self, e: int, v: int) -> List[int]:
+        """Ścieżka v -> e po drzewie najkrótszych ścieżek punktu przejścia e"""
+        nodes = self.floor_nodes[self.graph.node_floors[e]]
+        parent = self.parent[e]
+        path = []
+        j = self.local[v]
+        while j != -1:
+            path.append(nodes[j])
+            j = parent[j]
+        return path
+
+    def _floor_search(self, s: int, t: int) -> Tuple[Optional[List[int]], float]:
+        """Dijkstra w obrębie jednego piętra"""
+        graph = self.graph
+        offsets = graph.offsets
+        targets = graph.targets
+        weights = graph.weights
+        node_floors = graph.node_floors
+        floor = node_floors[s]
+        inf = float('inf')
+
+        dist = {s: 0.0}
+        parent = {s: -1}
+        pq = [(0.0, s)]
+        while pq:
+            d, u = heapq.heappop(pq)
+            if d > dist[u]:
+                continue
+            if u == t:
+                path = []
+                while u != -1:
+                    path.append(u)
+                    u = parent[u]
+                path.reverse()
+                return path, d
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if node_floors[v] != floor:
+                    continue
+                nd = d + weights[k]
+                if nd < dist.get(v, inf):
+                    dist[v] = nd
+                    parent[v] = u
+                    heapq.heappush(pq, (nd, v))
+        return None, inf
+
+    def save(self, filename: str):
+        """Zapisuje tablice do pliku JSON (nieosiągalne punkty jako null)"""
+        inf = float('inf')
+        data = {
+            'version': FORMAT_VERSION,
+            'map_hash': self.map_hash,
+            'node_count': len(self.graph),
+            'floors': [
+                {
+                    'nodes': list(nodes),
+                    'exits': [
+                        {'node': e,
+                         'dist': [d if d < inf else None for d in self.dist[e]],
+                         'parent': list(self.parent[e])}
+                        for e in self.exits[f]
+                    ]
+                }
+                for f, nodes in enumerate(self.floor_nodes)
+            ],
+            'overlay': {
+                str(e1): {str(e2): [d, self.overlay_parent[e1][e2]] for e2, d in row.items()}
+                for e1, row in self.overlay_dist.items()
+            }
+        }
+        tmp = filename + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename: str, graph: CompiledGraph,
+             map_hash: str) -> Optional['TransitionTables']:
+        """Wczytuje tablice; None gdy plik nie istnieje lub jest nieaktualny"""
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if (data.get('version') != FORMAT_VERSION
+                or data.get('map_hash') != map_hash
+                or data.get('node_count') != len(graph)):
+            return None
+
+        inf = float('inf')
+        floor_nodes, exits, dist, parent = [], [], {}, {}
+        for floor in data['floors']:
+            floor_nodes.append(floor['nodes'])
+            exits.append([])
+            for entry in floor['exits']:
+                e = entry['node']
+                exits[-1].append(e)
+                dist[e] = array('d', [inf if d is None else d for d in entry['dist']])
+                parent[e] = array('i', entry['parent'])
+
+        overlay_dist, overlay_parent = {}, {}
+        for e1, row in data['overlay'].items():
+            overlay_dist[int(e1)] = {int(e2): d for e2, (d, _) in row.items()}
+            overlay_parent[int(e1)] = {int(e2): p for e2, (_, p) in row.items()}
+
+        return cls(graph, map_hash, floor_nodes, exits, dist, parent,
+                   overlay_dist, overlay_parent)
+
+    @classmethod
+    def for_map(cls, graph: CompiledGraph, map_filename: str) -> 'TransitionTables':
+        """Wczytuje tablice zapisane obok mapy lub buduje je i zapisuje od nowa"""
+        map_hash = file_hash(map_filename)
+        filename = tables_filename(map_filename)
+        tables = cls.load(filename, graph, map_hash)
+        if tables is None:
+            tables = cls.build(graph, map_hash)
+            try:
+                tables.save(filename)
+                print(f"✓ Zapisano tablice przejść: {filename}")
+            except OSError as e:
+                print(f"✗ Nie udało się zapisać tablic przejść: {e}")
+        return tables